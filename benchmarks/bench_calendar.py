@@ -0,0 +1,82 @@
+"""Benchmark of calendar rendering (per-line folding vs. pre-folded templates).
+
+Usage:
+    python -m benchmarks.bench_calendar --events 100000
+"""
+import argparse
+from datetime import datetime, timedelta
+import time
+
+from modules import calendar
+
+
+def generate_schedule(events):
+    """Returns a synthetic schedule with the provided number of shifts."""
+    start = datetime(2018, 1, 1, 7, 0, 0)
+    codes = ('A1', 'B1', 'C1', 'D1')
+
+    return [
+        {
+            'shift_code': codes[index % len(codes)],
+            'start_datetime': start + timedelta(days=index),
+            'end_datetime': start + timedelta(days=index, hours=12),
+            'comment': 'Covering for a colleague; see the unit board for details' if index % 5 == 0 else '',
+        }
+        for index in range(events)
+    ]
+
+
+def render_lines(user, schedule, dt_stamp):
+    """Renders the calendar by formatting and folding each event line.
+
+    This is the path EventTemplate.render falls back to when a shift
+    value makes a line too long.
+    """
+    template = calendar.get_event_template(user['full_day'], user['reminder'])
+    content = [calendar.get_calendar_header()]
+
+    for shift in schedule:
+        uid = calendar.generate_event_uid(user, shift, 0)
+        fields = template.generate_fields(shift, uid, calendar.new_revision(dt_stamp))
+        content.extend(calendar.encode_line(line.format_map(fields)) for line in template.lines)
+
+    content.append(calendar.encode_line('END:VCALENDAR'))
+
+    return b''.join(content)
+
+
+def render_templates(user, schedule, dt_stamp):
+    """Renders the calendar with the pre-folded byte templates."""
+    return b''.join(calendar.render_calendar(user, schedule, dt_stamp))
+
+
+def main():
+    """Runs the benchmark and reports the timings."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=100000, help='number of calendar events')
+    parser.add_argument('--reminder', type=int, default=30, help='reminder minutes (-1 for none)')
+    parser.add_argument('--full-day', action='store_true', help='render full day events')
+    args = parser.parse_args()
+
+    user = {
+        'sb_user': 1,
+        'full_day': args.full_day,
+        'reminder': None if args.reminder < 0 else args.reminder,
+    }
+    schedule = generate_schedule(args.events)
+    dt_stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+
+    print(f'Events: {args.events}')
+
+    for name, render in (('Per-line folding', render_lines), ('Byte templates', render_templates)):
+        start = time.perf_counter()
+        content = render(user, schedule, dt_stamp)
+        elapsed = time.perf_counter() - start
+
+        print(
+            f'{name + ":":18s}{elapsed:.2f} s ({args.events / elapsed:,.0f} events/s, {len(content):,} bytes)'
+        )
+
+
+if __name__ == '__main__':
+    main()
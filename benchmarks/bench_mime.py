@@ -0,0 +1,86 @@
+"""Benchmark of email construction (MIMEMultipart vs. the prebuilt layout).
+
+Usage:
+    python -m benchmarks.bench_mime --emails 20000
+"""
+import argparse
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formataddr
+import time
+
+from unipath import Path
+
+from modules.mime import build_message
+from modules.templates import load_template
+
+
+FROM_ADDRESS = formataddr(('RDRHC Calendar', 'calendar@example.com'))
+UNSUBSCRIBE_LINK = 'https://example.com/unsubscribe'
+
+
+def build_mime_multipart(to_addresses, subject, body):
+    """Builds the email with the standard library email generator."""
+    content = MIMEMultipart('alternative')
+    content['From'] = FROM_ADDRESS
+    content['To'] = ','.join(to_addresses)
+    content['Subject'] = subject
+    content['List-Unsubscribe'] = f'<{UNSUBSCRIBE_LINK}>'
+
+    content.attach(MIMEText(body['plain'], 'plain'))
+    content.attach(MIMEText(body['html'], 'html'))
+
+    return content.as_string()
+
+
+def build_prebuilt(to_addresses, subject, body):
+    """Builds the email with the prebuilt header block."""
+    return build_message(FROM_ADDRESS, to_addresses, subject, UNSUBSCRIBE_LINK, body)
+
+
+def generate_bodies(count, non_ascii):
+    """Returns rendered update email bodies."""
+    email_templates = Path(__file__).absolute().parent.parent.child('email_templates')
+    text_template = load_template(email_templates.child('update.txt'), '\r\n')
+    html_template = load_template(email_templates.child('update.html'))
+    name = 'Zoë' if non_ascii else 'Zoe'
+
+    bodies = []
+
+    for index in range(count):
+        context = {
+            'user_name': f'{name} {index}',
+            'calendar_name': f'calendar-{index}',
+            'additions': '\r\n'.join(f' - 2018-01-{day:02d} - A1' for day in range(1, 7)),
+            'changes': ' - 2018-02-01 - C1 changed to C2',
+        }
+        bodies.append({
+            'plain': text_template.render(context),
+            'html': html_template.render(context),
+        })
+
+    return bodies
+
+
+def main():
+    """Runs the benchmark and reports the timings."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--emails', type=int, default=20000, help='number of emails to build')
+    parser.add_argument('--non-ascii', action='store_true', help='use non-ASCII user names (base64 bodies)')
+    args = parser.parse_args()
+
+    bodies = generate_bodies(args.emails, args.non_ascii)
+    to_addresses = [formataddr(('Test User', 'user@example.com'))]
+
+    print(f'Emails: {args.emails}')
+
+    for label, build in (('MIMEMultipart:', build_mime_multipart), ('Prebuilt:     ', build_prebuilt)):
+        start = time.perf_counter()
+        size = sum(len(build(to_addresses, 'RDRHC Schedule Changes', body)) for body in bodies)
+        elapsed = time.perf_counter() - start
+
+        print(f'{label} {elapsed:.2f} s ({args.emails / elapsed:,.0f} emails/s, {size:,} characters)')
+
+
+if __name__ == '__main__':
+    main()
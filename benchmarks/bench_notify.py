@@ -0,0 +1,96 @@
+"""Benchmark of notify_user email throughput against a local SMTP stand-in.
+
+Usage:
+    python -m benchmarks.bench_notify --users 2000 --latency 0.005 --connections 4
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+from unipath import Path
+
+from modules import delivery, notify
+
+from tests.api_server import build_app_config
+from tests.smtp_server import StandInSMTP
+
+
+def generate_notification_details(index, messages):
+    """Returns synthetic notification details for a user."""
+    return {
+        'additions': [
+            {'email_message': f'2018-01-{day + 1:02d} - A{index % 9}'} for day in range(messages)
+        ],
+        'deletions': [
+            {'email_message': f'2018-02-{day + 1:02d} - B{index % 9}'} for day in range(messages // 2)
+        ],
+        'changes': [
+            {'email_message': f'2018-03-{day + 1:02d} - C1 changed to C2'} for day in range(messages // 2)
+        ],
+        'missing': [{'email_message': '2018-04-01 - X1'}] if index % 10 == 0 else [],
+        'null': [],
+    }
+
+
+def main():
+    """Runs the benchmark and reports the timings."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000, help='number of synthetic users')
+    parser.add_argument('--messages', type=int, default=6, help='schedule changes per user')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the SMTP server takes per message')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of messages rejected')
+    parser.add_argument('--connections', type=int, default=4, help='parallel SMTP connections')
+    parser.add_argument('--outbox', action='store_true', help='queue emails in an on-disk outbox')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    email_templates = Path(__file__).absolute().parent.parent.child('email_templates')
+
+    with tempfile.TemporaryDirectory() as directory, \
+            StandInSMTP(latency=args.latency, error_rate=args.error_rate) as stand_in:
+        app_config = build_app_config('http://127.0.0.1/api/', directory, email_templates)
+        app_config['debug']['email_console'] = False
+        app_config['email'].update({
+            'server': stand_in.address,
+            'starttls': False,
+            'smtp_connections': args.connections,
+        })
+
+        if args.outbox:
+            app_config['outbox'] = {'location': f'{directory}/outbox'}
+
+        users = [
+            {
+                'sb_user': index,
+                'name': f'User {index}',
+                'calendar_name': f'calendar-{index}',
+                'first_email_sent': True,
+            }
+            for index in range(args.users)
+        ]
+        notifications = [generate_notification_details(index, args.messages) for index in range(args.users)]
+
+        start = time.perf_counter()
+
+        with delivery.OutboxWorker(app_config):
+            for user, notification in zip(users, notifications):
+                notify.notify_user(user, app_config, notification, [f'user{user["sb_user"]}@example.com'])
+
+            queued = time.perf_counter() - start
+
+        delivery.close_smtp_sessions()
+        elapsed = time.perf_counter() - start
+
+        report = stand_in.report()
+        per_second = f'{report["per_second"]:,.0f}' if report['per_second'] else 'n/a'
+
+        print(f'Users:            {args.users}')
+        print(f'Rendered/queued:  {queued:.2f} s ({args.users / queued:,.0f} users/s)')
+        print(f'Delivered:        {elapsed:.2f} s ({report["messages"] / elapsed:,.0f} emails/s end-to-end)')
+        print(f'SMTP server:      {report["messages"]} messages ({per_second}/s), {report["errors"]} rejected')
+        print(f'SMTP connections: {report["connections"]} opened, {report["peak_connections"]} concurrent')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""End-to-end benchmark of run_program against the stand-in API.
+
+Usage:
+    python -m benchmarks.bench_run_program --users 200 --latency 0.02
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+from unipath import Path
+
+from modules.manager import run_program
+
+from tests.api_server import StandInAPI, build_app_config, write_schedule_workbooks
+
+
+def main():
+    """Runs the benchmark and reports the timings."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100, help='number of synthetic users')
+    parser.add_argument('--days', type=int, default=120, help='days in each schedule')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to each API request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of API requests failing')
+    parser.add_argument('--prefetch', type=int, default=2, help='users to prefetch API data for')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    email_templates = Path(__file__).absolute().parent.parent.child('email_templates')
+
+    with tempfile.TemporaryDirectory() as directory:
+        stand_in = StandInAPI(args.users, latency=args.latency, error_rate=args.error_rate)
+
+        with stand_in:
+            write_schedule_workbooks(directory, stand_in.users, days=args.days)
+
+            app_config = build_app_config(stand_in.url, directory, email_templates)
+            app_config['api_retries'] = {'max_retries': 3, 'backoff_base': 0.05}
+            app_config['pipeline']['prefetch_users'] = args.prefetch
+
+            start = time.perf_counter()
+            run_program(app_config)
+            elapsed = time.perf_counter() - start
+
+        requests_made = sum(stand_in.request_counts.values())
+
+        print(f'Users:        {args.users}')
+        print(f'API requests: {requests_made}')
+        print(f'Elapsed:      {elapsed:.2f} s ({elapsed / args.users * 1000:.1f} ms per user)')
+
+        for route, count in sorted(stand_in.request_counts.items()):
+            print(f'  {count:6d}  {route}')
+
+
+if __name__ == '__main__':
+    main()
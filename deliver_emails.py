@@ -0,0 +1,25 @@
+"""Delivers the emails queued in the outbox.
+
+    Emails queued by run.py (when an outbox location is configured)
+    are delivered with retries; this may be run on a schedule (e.g. via
+    cron) to deliver any emails awaiting a retry.
+"""
+
+import logging
+import logging.config
+import pathlib
+
+from modules.config import assemble_app_configuration_details, LOGGING_DICT
+from modules.delivery import deliver_outbox
+
+
+# Collect all the application configuration values
+APP_CONFIG = assemble_app_configuration_details(
+    str(pathlib.Path(__file__).parent.absolute())
+)
+
+# Setup Logging
+logging.config.dictConfig(LOGGING_DICT)
+LOG = logging.getLogger(__name__)
+
+deliver_outbox(APP_CONFIG)
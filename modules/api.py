@@ -0,0 +1,428 @@
+"""Client used for all requests to the RDRHC Calendar API."""
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import re
+import threading
+import time
+
+import requests
+
+from modules.custom_exceptions import CircuitOpenError
+
+
+LOG = logging.getLogger(__name__)
+
+LIMITERS = {}
+LIMITERS_LOCK = threading.Lock()
+
+BREAKERS = {}
+BREAKERS_LOCK = threading.Lock()
+
+# Methods that are safe to repeat after any transient failure
+IDEMPOTENT_METHODS = ('get', 'delete')
+
+# Statuses worth retrying for idempotent requests
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Statuses where the API did not process the request, so that even
+# non-idempotent requests (e.g. schedule uploads) may be retried
+NOT_PROCESSED_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value):
+    """Converts a Retry-After header value to seconds (or None)."""
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_datetime = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_datetime.tzinfo is None:
+        retry_datetime = retry_datetime.replace(tzinfo=timezone.utc)
+
+    return max(0.0, (retry_datetime - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveLimiter():  # pylint: disable=too-many-instance-attributes
+    """Limits concurrent API requests with AIMD.
+
+    The concurrency limit increases additively (by roughly one request
+    per limit's worth of healthy responses) and is halved whenever the
+    API throttles (429), errors (5xx) or the p95 latency rises above
+    the tolerated multiple of the best p95 observed.
+    """
+    def _p95(self):
+        """Returns the p95 latency of the recent requests."""
+        latencies = sorted(self.latencies)
+
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    def _decrease(self, reason):
+        """Multiplicatively decreases the limit (once per half window).
+
+        Returns:
+            bool: whether the limit was decreased.
+        """
+        if self.samples_since_decrease < self.latencies.maxlen // 2:
+            return False
+
+        self.decreases += 1
+        self.limit = max(self.min_limit, self.limit / 2)
+        self.samples_since_decrease = 0
+
+        LOG.debug('Reduced API concurrency to %.1f (%s)', self.limit, reason)
+
+        return True
+
+    def acquire(self):
+        """Blocks until a request may be sent."""
+        with self.condition:
+            while True:
+                wait = self.blocked_until - time.monotonic()
+
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+
+                self.condition.wait(wait if wait > 0 else None)
+
+            self.in_flight += 1
+
+    def release(self, latency, status_code=None, retry_after=None):
+        """Records the outcome of a request and adjusts the limit.
+
+        Arguments:
+            latency (float): Seconds taken by the request.
+            status_code (int): The response status code (None if no
+                response was received).
+            retry_after (str): The Retry-After header value (if any).
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.samples_since_decrease += 1
+
+            retry_seconds = parse_retry_after(retry_after)
+
+            if retry_seconds is not None and status_code in (429, 503):
+                self.blocked_until = max(
+                    self.blocked_until, time.monotonic() + retry_seconds
+                )
+
+            if status_code is None or status_code == 429 or status_code >= 500:
+                self.throttled += 1
+                self._decrease(f'status code {status_code}')
+            else:
+                self.latencies.append(latency)
+
+                if len(self.latencies) == self.latencies.maxlen:
+                    p95 = self._p95()
+                    self.best_p95 = min(self.best_p95, p95)
+
+                    if p95 > self.best_p95 * self.latency_tolerance:
+                        if self._decrease(f'p95 latency {p95:.3f} s'):
+                            # Measure the latencies at the new limit
+                            self.latencies.clear()
+                    else:
+                        self.limit = min(
+                            self.max_limit, self.limit + 1 / self.limit
+                        )
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self.condition.notify_all()
+
+    def report(self):
+        """Returns a summary of the limits the limiter settled on."""
+        with self.condition:
+            return {
+                'limit': self.limit,
+                'p95': self._p95() if self.latencies else None,
+                'throttled': self.throttled,
+                'decreases': self.decreases,
+            }
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=16, latency_tolerance=2.0, window=50):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.latencies = deque(maxlen=window)
+        self.best_p95 = float('inf')
+        self.blocked_until = 0.0
+        self.in_flight = 0
+        self.throttled = 0
+        self.decreases = 0
+        self.samples_since_decrease = window
+        self.condition = threading.Condition()
+
+
+def get_limiter(app_config):
+    """Returns the (shared) limiter for the configured API."""
+    with LIMITERS_LOCK:
+        if app_config['api_url'] not in LIMITERS:
+            limits = app_config.get('api_limits', {})
+
+            LIMITERS[app_config['api_url']] = AdaptiveLimiter(
+                initial_limit=limits.get('initial_concurrency', 4),
+                max_limit=limits.get('max_concurrency', 16),
+                latency_tolerance=limits.get('latency_tolerance', 2.0),
+            )
+
+        return LIMITERS[app_config['api_url']]
+
+
+class CircuitBreaker():
+    """Fails requests fast once an API endpoint is known to be down.
+
+    The breaker opens after a number of consecutive failures. While
+    open, requests raise CircuitOpenError without contacting the API.
+    After the cooldown a single trial request is allowed through
+    (half-open); its outcome closes or re-opens the breaker.
+    """
+    def before_request(self):
+        """Raises CircuitOpenError if the request may not be sent."""
+        with self.lock:
+            if self.state == 'closed':
+                return
+
+            if self.state == 'open' and time.monotonic() >= self.opened_at + self.cooldown:
+                LOG.info('Trying API endpoint %s again', self.endpoint)
+                self.state = 'half-open'
+                return
+
+            raise CircuitOpenError(
+                f'API endpoint {self.endpoint} is unavailable; skipping request.'
+            )
+
+    def record_success(self):
+        """Records a successful request and closes the breaker."""
+        with self.lock:
+            if self.state != 'closed':
+                LOG.info('API endpoint %s has recovered', self.endpoint)
+
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        """Records a failed request and opens the breaker if needed."""
+        with self.lock:
+            self.failures += 1
+
+            if self.state == 'half-open' or self.failures >= self.threshold:
+                if self.state != 'open':
+                    LOG.warning(
+                        'API endpoint %s appears to be down; failing requests for %s seconds',
+                        self.endpoint,
+                        self.cooldown,
+                    )
+
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def __init__(self, endpoint, threshold=5, cooldown=60):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+
+def get_endpoint(app_config, method, api_url):
+    """Returns the endpoint (method and path template) for a URL.
+
+    e.g. "GET shifts/{id}/" for ".../api/shifts/10/".
+    """
+    path = api_url.split('?', 1)[0]
+
+    if path.startswith(app_config['api_url']):
+        path = path[len(app_config['api_url']):]
+
+    path = re.sub(r'(^|/)\d+(?=/|$)', r'\1{id}', path)
+
+    return f'{method.upper()} {path}'
+
+
+def get_circuit_breaker(app_config, method, api_url):
+    """Returns the (shared) circuit breaker for the URL's endpoint."""
+    endpoint = get_endpoint(app_config, method, api_url)
+    key = (app_config['api_url'], endpoint)
+
+    with BREAKERS_LOCK:
+        if key not in BREAKERS:
+            retries = app_config.get('api_retries', {})
+
+            BREAKERS[key] = CircuitBreaker(
+                endpoint,
+                threshold=retries.get('breaker_threshold', 5),
+                cooldown=retries.get('breaker_cooldown', 60),
+            )
+
+        return BREAKERS[key]
+
+
+def get_backoff(attempt, retry_config, retry_after=None):
+    """Returns the seconds to wait before retrying (full jitter).
+
+    Returns None when the API asks (via Retry-After) for a longer wait
+    than the maximum backoff, in which case the request is not retried.
+    """
+    backoff_max = retry_config.get('backoff_max', 10.0)
+    ceiling = min(
+        backoff_max, retry_config.get('backoff_base', 0.5) * 2 ** attempt
+    )
+    backoff = random.uniform(0, ceiling)
+
+    retry_seconds = parse_retry_after(retry_after)
+
+    if retry_seconds is not None:
+        if retry_seconds > backoff_max:
+            return None
+
+        backoff = max(backoff, retry_seconds)
+
+    return backoff
+
+
+def send(app_config, method, api_url, **kwargs):
+    """Sends a single API request through the adaptive limiter.
+
+    Arguments:
+        app_config (dict): The application configuration.
+        method (str): The requests method to use (e.g. "get").
+        api_url (str): The API URL.
+        **kwargs: Passed on to the requests method.
+
+    Returns:
+        obj: The requests response.
+    """
+    limiter = get_limiter(app_config)
+    limiter.acquire()
+
+    start = time.monotonic()
+    response = None
+
+    try:
+        response = getattr(requests, method)(api_url, **kwargs)
+    finally:
+        if response is None:
+            limiter.release(time.monotonic() - start)
+        else:
+            limiter.release(
+                time.monotonic() - start,
+                response.status_code,
+                response.headers.get('Retry-After'),
+            )
+
+    return response
+
+
+def send_with_retries(app_config, method, api_url, **kwargs):
+    """Sends an API request, retrying transient failures.
+
+    GET and DELETE requests are retried after any transient failure;
+    other requests are only retried when the API did not process them.
+    Retries use exponential backoff with full jitter (honouring any
+    Retry-After header up to the maximum backoff).
+
+    Returns:
+        obj: The requests response (the last one if retries failed).
+    """
+    retry_config = app_config.get('api_retries', {})
+    max_retries = retry_config.get('max_retries', 3)
+    idempotent = method in IDEMPOTENT_METHODS
+    retry_codes = RETRY_STATUS_CODES if idempotent else NOT_PROCESSED_STATUS_CODES
+
+    attempt = 0
+
+    while True:
+        try:
+            response = send(app_config, method, api_url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            retryable = idempotent or isinstance(error, requests.ConnectTimeout)
+
+            if not retryable or attempt >= max_retries:
+                raise
+
+            backoff = get_backoff(attempt, retry_config)
+            LOG.debug('Retrying %s in %.2f s (%s)', api_url, backoff, error)
+        else:
+            if response.status_code not in retry_codes or attempt >= max_retries:
+                return response
+
+            backoff = get_backoff(
+                attempt, retry_config, response.headers.get('Retry-After')
+            )
+
+            if backoff is None:
+                return response
+
+            LOG.debug(
+                'Retrying %s in %.2f s (status code %s)',
+                api_url, backoff, response.status_code
+            )
+
+        time.sleep(backoff)
+        attempt += 1
+
+
+def request(app_config, method, api_url, **kwargs):
+    """Sends an API request with retries and a circuit breaker.
+
+    Arguments:
+        app_config (dict): The application configuration.
+        method (str): The requests method to use (e.g. "get").
+        api_url (str): The API URL.
+        **kwargs: Passed on to the requests method.
+
+    Returns:
+        obj: The requests response (the last one if retries failed).
+
+    Raises:
+        CircuitOpenError: The endpoint is known to be down.
+    """
+    breaker = get_circuit_breaker(app_config, method, api_url)
+    breaker.before_request()
+
+    healthy = False
+
+    try:
+        response = send_with_retries(app_config, method, api_url, **kwargs)
+        healthy = response.status_code != 429 and response.status_code < 500
+    finally:
+        # Any error (including unexpected ones) counts as a failure so
+        # that a half-open breaker never stays half-open
+        if healthy:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    return response
+
+
+def report_limits():
+    """Logs the limits each API limiter settled on."""
+    with LIMITERS_LOCK:
+        limiters = dict(LIMITERS)
+
+    for api_url, limiter in limiters.items():
+        report = limiter.report()
+        p95 = f'{report["p95"] * 1000:.0f} ms' if report['p95'] is not None else 'n/a'
+
+        LOG.info(
+            'API limiter for %s settled at %.1f concurrent requests (p95 = %s, %s throttled/failed responses)',
+            api_url,
+            report['limit'],
+            p95,
+            report['throttled'],
+        )
@@ -4,8 +4,9 @@ import json
 import logging
 
 from decimal import Decimal
-import requests
 
+from modules import api
+from modules.cache import cached_get
 from modules.custom_exceptions import ScheduleError
 from modules.extract_schedule import generate_raw_schedule
 from modules.utils import convert_duration_to_hours_minutes
@@ -19,9 +20,8 @@ def retrieve_old_schedule(app_config, user_id):
 
     api_url = f'{app_config["api_url"]}shifts/{user_id}/'
 
-    shifts_response = requests.get(
-        api_url,
-        headers=app_config['api_headers']
+    shifts_response = api.request(
+        app_config, 'get', api_url, headers=app_config['api_headers']
     )
 
     if shifts_response.status_code >= 400:
@@ -152,61 +152,80 @@ def get_default_start_end_datetimes(start_date, defaults, stat_match, dow):
     return start_datetime, end_datetime
 
 
-class Schedule():
-    """Holds all the users shifts and any noted modifications"""
-    def _retrieve_shift_codes(self):
-        """Takes a specific user and retrieves their shift times."""
-        user_id = self.user['sb_user']
+def convert_shift_codes(response_text):
+    """Converts the shift code API response to Python types."""
+    shift_codes = json.loads(response_text)
+
+    for index, code in enumerate(shift_codes):
+        date_keys = [
+            'monday_start',
+            'tuesday_start',
+            'wednesday_start',
+            'thursday_start',
+            'friday_start',
+            'saturday_start',
+            'sunday_start',
+            'stat_start',
+        ]
+        decimal_keys = [
+            'monday_duration',
+            'tuesday_duration',
+            'wednesday_duration',
+            'thursday_duration',
+            'friday_duration',
+            'saturday_duration',
+            'sunday_duration',
+            'stat_duration',
+        ]
+
+        for key in date_keys:
+            if code[key]:
+                shift_codes[index][key] = datetime.strptime(
+                    code[key], '%H:%M:%S'
+                ).time()
+
+        for key in decimal_keys:
+            if code[key]:
+                shift_codes[index][key] = Decimal(code[key])
+
+    return shift_codes
+
+
+def convert_stat_holidays(response_text):
+    """Converts the stat holiday API response to datetimes."""
+    stat_holidays = []
+
+    for holiday_date in json.loads(response_text):
+        stat_holidays.append(
+            datetime.strptime(holiday_date, '%Y-%m-%d')
+        )
 
-        LOG.debug('Collecting shift codes for user id = %s', user_id)
+    return stat_holidays
 
-        api_url = f'{self.config["api_url"]}shift-codes/{user_id}/'
 
-        shift_code_response = requests.get(
-            api_url,
-            headers=self.config['api_headers']
-        )
+def retrieve_shift_codes(app_config, user_id):
+    """Retrieves the shift codes (and times) for the provided user."""
+    LOG.debug('Collecting shift codes for user id = %s', user_id)
 
-        if shift_code_response.status_code >= 400:
-            raise ScheduleError(
-                f'Unable to connect to API ({api_url}) and retrieve user shift codes.'
-            )
+    api_url = f'{app_config["api_url"]}shift-codes/{user_id}/'
 
-        shift_codes = json.loads(shift_code_response.text)
-
-        for index, code in enumerate(shift_codes):
-            date_keys = [
-                'monday_start',
-                'tuesday_start',
-                'wednesday_start',
-                'thursday_start',
-                'friday_start',
-                'saturday_start',
-                'sunday_start',
-                'stat_start',
-            ]
-            decimal_keys = [
-                'monday_duration',
-                'tuesday_duration',
-                'wednesday_duration',
-                'thursday_duration',
-                'friday_duration',
-                'saturday_duration',
-                'sunday_duration',
-                'stat_duration',
-            ]
+    status_code, shift_codes = cached_get(
+        app_config, api_url, convert_shift_codes
+    )
+
+    if status_code >= 400:
+        raise ScheduleError(
+            f'Unable to connect to API ({api_url}) and retrieve user shift codes.'
+        )
 
-            for key in date_keys:
-                if code[key]:
-                    shift_codes[index][key] = datetime.strptime(
-                        code[key], '%H:%M:%S'
-                    ).time()
+    return shift_codes
 
-            for key in decimal_keys:
-                if code[key]:
-                    shift_codes[index][key] = Decimal(code[key])
 
-        return shift_codes
+class Schedule():  # pylint: disable=too-many-instance-attributes
+    """Holds all the users shifts and any noted modifications"""
+    def _retrieve_shift_codes(self):
+        """Takes a specific user and retrieves their shift times."""
+        return retrieve_shift_codes(self.config, self.user['sb_user'])
 
     def _retrieve_stat_holidays(self):
         """Retrieves any stat holidays occuring between schedule dates."""
@@ -218,23 +237,15 @@ class Schedule():
 
             api_url = f'{self.config["api_url"]}stat-holidays/?date_start={first_day}&date_end={last_day}'
 
-            stat_holidays_response = requests.get(
-                api_url,
-                headers=self.config['api_headers']
+            status_code, stat_holidays = cached_get(
+                self.config, api_url, convert_stat_holidays
             )
 
-            if stat_holidays_response.status_code >= 400:
+            if status_code >= 400:
                 raise ScheduleError(
                     f'Unable to connect to API ({api_url}) and retrieve stat holidays.'
                 )
 
-            stat_holidays = []
-
-            for holiday_date in json.loads(stat_holidays_response.text):
-                stat_holidays.append(
-                    datetime.strptime(holiday_date, '%Y-%m-%d')
-                )
-
             return stat_holidays
 
         return None
@@ -246,6 +257,10 @@ class Schedule():
         dow = shift['start_date'].weekday()
         stat_match = is_stat(shift['start_date'], stat_holidays)
 
+        # Codes already known to be missing are not looked up again
+        if shift['shift_code'].upper() in self.known_missing:
+            shift_code_list = []
+
         for code in shift_code_list:
             if shift['shift_code'].upper() == code['code'].upper():
                 # Shift code exists for user
@@ -368,7 +383,8 @@ class Schedule():
 
                 self.notification_details['deletions'].append({
                     'date': old_date,
-                    'email_message': message
+                    'email_message': message,
+                    'old_shift_codes': [str(s['shift_code']) for s in old_shifts],
                 })
 
     def determine_schedule_changes(self):
@@ -406,6 +422,7 @@ class Schedule():
                     self.notification_details['changes'].append({
                         'date': old_date,
                         'email_message': message,
+                        'old_shift_codes': [str(s['shift_code']) for s in old_shifts],
                         'shift_codes': new_codes,
                     })
 
@@ -462,8 +479,16 @@ class Schedule():
     def process_new_schedule(self):
         """Generates a new schedule and identifies important shifts."""
 
-        # Get shift codes/times for user
-        shift_code_list = self._retrieve_shift_codes()
+        # Get shift codes/times for user (unless already retrieved)
+        if self.shift_codes is None:
+            self.shift_codes = self._retrieve_shift_codes()
+
+        shift_code_list = self.shift_codes
+
+        # A known missing code may since have been added for this user
+        if self.known_missing:
+            present = {code['code'].upper() for code in shift_code_list}
+            self.known_missing = self.known_missing - present
 
         # Get all the stat holidays for the date range of the raw_schedule
         stat_holidays = self._retrieve_stat_holidays()
@@ -481,13 +506,47 @@ class Schedule():
         self.clean_missing()
         self.clean_null()
 
-    def __init__(self, schedule_old, schedule_new, user, app_config):
+        self.notification = self._build_notification()
+
+    def _build_notification(self):
+        """Returns the compact notification payload for the user.
+
+        The payload only holds strings (and lists of strings), so it can
+        be serialized (e.g. to notify the user from another process) and
+        the schedule itself released once it is uploaded.
+        """
+        details = self.notification_details
+        notification = {
+            'additions': [dict(addition) for addition in details['additions']],
+            'deletions': [dict(deletion) for deletion in details['deletions']],
+            'changes': [dict(change) for change in details['changes']],
+            'missing_codes': sorted(details['missing_upload']),
+        }
+
+        for key in ('missing', 'null'):
+            notification[key] = [
+                {
+                    'date': shift['date'].strftime('%Y-%m-%d'),
+                    'email_message': shift['email_message'],
+                    'shift_code': shift['shift_code'],
+                }
+                for shift in details[key]
+            ]
+
+        return notification
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, schedule_old, schedule_new, user, app_config, shift_codes=None, *, known_missing=None
+    ):
         self.schedule_old = schedule_old
         self.schedule_new = schedule_new
         self.schedule_new_by_date = []
         self.user = user
         self.config = app_config
+        self.shift_codes = shift_codes
+        self.known_missing = known_missing or set()
         self.shifts = []
+        self.notification = None
         self.notification_details = {
             'additions': [],
             'deletions': [],
@@ -498,13 +557,31 @@ class Schedule():
         }
 
 
-def assemble_schedule(app_config, excel_files, user):
-    """Assembles all the schedule details for provided user."""
+def assemble_schedule(app_config, excel_files, user, prefetched=None, *, known_missing=None):
+    """Assembles all the schedule details for provided user.
+
+    Arguments:
+        app_config (dict): The application configuration.
+        excel_files (dict): The Excel schedule paths for each role.
+        user (dict): The user details.
+        prefetched (obj): Optional PrefetchedUserData holding the
+            user's previously retrieved API data.
+        known_missing (set): Optional (upper case) shift codes already
+            known to be missing for the user's role.
+    """
+    if prefetched:
+        old_schedule = prefetched.old_schedule()
+        shift_codes = prefetched.shift_codes()
+    else:
+        old_schedule = retrieve_old_schedule(app_config, user['sb_user'])
+        shift_codes = None
 
-    old_schedule = retrieve_old_schedule(app_config, user['sb_user'])
     new_schedule_raw = generate_raw_schedule(app_config, excel_files, user)
 
-    new_schedule = Schedule(old_schedule, new_schedule_raw, user, app_config)
+    new_schedule = Schedule(
+        old_schedule, new_schedule_raw, user, app_config, shift_codes,
+        known_missing=known_missing
+    )
     new_schedule.process_new_schedule()
 
     return new_schedule
@@ -0,0 +1,182 @@
+"""On-disk cache for slowly changing API resources."""
+from datetime import datetime, time
+from decimal import Decimal
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time as timer
+
+from unipath import Path
+
+from modules import api
+
+
+LOG = logging.getLogger(__name__)
+
+
+def encode_value(value):
+    """Tags the Python types used in parsed API data for JSON."""
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+
+    if isinstance(value, time):
+        return {'__time__': value.isoformat()}
+
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+
+    raise TypeError(f'Unable to cache value of type {type(value).__name__}')
+
+
+def decode_value(value):
+    """Converts tagged JSON values back to their Python types."""
+    if '__datetime__' in value:
+        return datetime.fromisoformat(value['__datetime__'])
+
+    if '__time__' in value:
+        return time.fromisoformat(value['__time__'])
+
+    if '__decimal__' in value:
+        return Decimal(value['__decimal__'])
+
+    return value
+
+
+class ResponseCache():
+    """Stores parsed API responses alongside their HTTP validators.
+
+    Entries younger than the TTL are returned without contacting the
+    API. Older entries are revalidated with a conditional GET; a 304
+    response reuses the stored (already parsed) data.
+    """
+    def _entry_path(self, api_url):
+        """Returns the file path used to store the entry for a URL."""
+        key = hashlib.sha256(api_url.encode('utf8')).hexdigest()
+
+        return Path(self.location, f'{key}.json')
+
+    def load(self, api_url):
+        """Returns the stored entry for the URL (or None).
+
+        Unreadable or malformed entries are treated as cache misses.
+        """
+        try:
+            with open(self._entry_path(api_url), 'r', encoding='utf8') as entry_file:
+                entry = json.load(entry_file, object_hook=decode_value)
+        except (OSError, ValueError):
+            return None
+
+        # Guard against malformed entries and (unlikely) hash collisions
+        if not isinstance(entry, dict) or entry.get('url') != api_url:
+            return None
+
+        if not {'etag', 'last_modified', 'stored', 'data'} <= entry.keys():
+            return None
+
+        return entry
+
+    def save(self, api_url, entry):
+        """Atomically writes the entry for the URL to disk."""
+        # Cache is only readable/writable by the owner
+        os.makedirs(self.location, mode=0o700, exist_ok=True)
+
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.location)
+
+        try:
+            with os.fdopen(file_descriptor, 'w', encoding='utf8') as entry_file:
+                json.dump(entry, entry_file, default=encode_value)
+
+            os.replace(temp_path, self._entry_path(api_url))
+        except (OSError, TypeError):
+            LOG.warning('Unable to save cached response for %s', api_url)
+
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def get(self, app_config, api_url, parse, ttl=None):
+        """Retrieves and parses an API resource.
+
+        Arguments:
+            app_config (dict): The application configuration.
+            api_url (str): The API URL to retrieve.
+            parse (func): Converts the response text to the returned
+                data; only called when the API returns a new response.
+            ttl (int): Seconds an entry is used without revalidation
+                (defaults to the cache TTL).
+
+        Returns:
+            tuple: the response status code and the parsed data (None
+                if the API returned an error status).
+        """
+        ttl = self.ttl if ttl is None else ttl
+        entry = self.load(api_url)
+
+        if entry and timer.time() - entry['stored'] < ttl:
+            LOG.debug('Using cached response for %s', api_url)
+
+            return 200, entry['data']
+
+        request_headers = dict(app_config['api_headers'])
+
+        if entry and entry['etag']:
+            request_headers['If-None-Match'] = entry['etag']
+
+        if entry and entry['last_modified']:
+            request_headers['If-Modified-Since'] = entry['last_modified']
+
+        response = api.request(
+            app_config, 'get', api_url, headers=request_headers
+        )
+
+        if response.status_code == 304 and entry:
+            LOG.debug('Cached response for %s is still valid', api_url)
+
+            entry['stored'] = timer.time()
+            self.save(api_url, entry)
+
+            return response.status_code, entry['data']
+
+        if response.status_code >= 400:
+            return response.status_code, None
+
+        data = parse(response.text)
+
+        self.save(api_url, {
+            'url': api_url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'stored': timer.time(),
+            'data': data,
+        })
+
+        return response.status_code, data
+
+    def __init__(self, location, ttl):
+        self.location = location
+        self.ttl = ttl
+
+
+def cached_get(app_config, api_url, parse, ttl=None):
+    """Retrieves an API resource through the cache (if configured).
+
+    See ResponseCache.get for the arguments and return value.
+    """
+    cache_config = app_config.get('cache')
+
+    if cache_config and cache_config['location']:
+        response_cache = ResponseCache(
+            cache_config['location'], cache_config['ttl']
+        )
+
+        return response_cache.get(app_config, api_url, parse, ttl)
+
+    response = api.request(
+        app_config, 'get', api_url, headers=app_config['api_headers']
+    )
+
+    if response.status_code >= 400:
+        return response.status_code, None
+
+    return response.status_code, parse(response.text)
@@ -1,13 +1,62 @@
 """Functions to generate .ics calendar from user schedule."""
 
-from datetime import datetime, timedelta
+from collections import Counter
+from datetime import date, datetime, timedelta
+from functools import lru_cache, partial
+import gzip
+import hashlib
+import io
+import json
 import logging
+import os
+import re
+import tempfile
+from urllib.parse import quote
 
 from unipath import Path
 
+from modules.vtimezone import generate_vtimezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 LOG = logging.getLogger(__name__)
 
+# Properties that change every run without the calendar changing
+STAMP_LINES = re.compile(rb'^(?:DTSTAMP|CREATED|LAST-MODIFIED):[^\n]*\n', re.MULTILINE)
+
+CALENDAR_FILE_MODE = 0o644
+
+# Characters that must be escaped in TEXT property values (RFC 5545)
+TEXT_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    ';': '\\;',
+    ',': '\\,',
+    '\n': '\\n',
+    '\r': '\\n',
+})
+
+DEFAULT_TIMEZONE = 'America/Edmonton'
+
+CALENDAR_HEADER = (
+    'BEGIN:VCALENDAR',
+    'PRODID:-//StudyBuffalo.com//RDRHC Calendar//EN',
+    'VERSION:2.0',
+    'CALSCALE:GREGORIAN',
+    'X-WR-CALNAME:{title}',
+    'X-WR-TIMEZONE:{timezone}',
+)
+
+CALENDAR_FOOTER = b'END:VCALENDAR\n'
+
+CALENDAR_TITLE = 'Work Schedule'
+
+
+ARCHIVE_TITLE = 'Work Schedule Archive'
+
 
 def generate_full_day_dt_start_end(shift):
     """Generates start/end datetime strings for full day event."""
@@ -27,15 +76,21 @@ def generate_full_day_dt_start_end(shift):
     }
 
 
-def generate_dt_start_end(shift):
+@lru_cache(maxsize=None)
+def get_tzid_properties(tz_name):
+    """Returns the DTSTART and DTEND property names for the timezone."""
+    return f'DTSTART;TZID={tz_name}:', f'DTEND;TZID={tz_name}:'
+
+
+def generate_dt_start_end(shift, tz_name=DEFAULT_TIMEZONE):
     """Generates start/end datetime strings for shift."""
-    start_date = shift['start_datetime'].strftime('%Y%m%d')
-    start_time = str(shift['start_datetime'].time()).replace(':', '').zfill(6)
-    end_date = shift['end_datetime'].strftime('%Y%m%d')
-    end_time = str(shift['end_datetime'].time()).replace(':', '').zfill(6)
+    start = shift['start_datetime'].strftime('%Y%m%dT%H%M%S')
+    end = shift['end_datetime'].strftime('%Y%m%dT%H%M%S')
+    start_date, start_time = start.split('T')
+    dt_start_property, dt_end_property = get_tzid_properties(tz_name)
 
-    dt_start = f'DTSTART;TZID=America/Edmonton:{start_date}T{start_time}'
-    dt_end = f'DTEND;TZID=America/Edmonton:{end_date}T{end_time}'
+    dt_start = f'{dt_start_property}{start}'
+    dt_end = f'{dt_end_property}{end}'
 
     return {
         'dt_start': dt_start,
@@ -65,138 +120,647 @@ def generate_alarm(reminder_time, shift_code):
     return lines
 
 
-def generate_calendar_event(shift, user, dt_stamp, i):
-    """Generates a .ics calendar event from a shift.
+def generate_event_uid(user, shift, ordinal):
+    """Generates a UID that stays the same while the shift exists.
 
     Arguments:
-        shift (dict): A dictionary of one shift's details.
         user (dict): A dictionary of user details.
-        dt_stamp (str): A string timestamp of the .ics creation date.
-        i (int): an incrementing count to generate a unique ID.
+        shift (dict): A dictionary of one shift's details.
+        ordinal (int): The count of earlier shifts with the same date
+            and shift code (to keep duplicate shifts unique).
     """
-    lines = []
+    start_date = shift['start_datetime'].strftime('%Y%m%d')
+    shift_code = quote(shift['shift_code'], safe='')
 
-    lines.append('BEGIN:VEVENT')
+    return f'{user["sb_user"]}-{start_date}-{shift_code}-{ordinal}@studybuffalo.com'
 
-    # Generate the event datetime starts and ends
-    if user['full_day']:
-        event_details = generate_full_day_dt_start_end(shift)
-        lines.append(event_details['dt_start'])
-        lines.append(event_details['dt_end'])
-    else:
-        event_details = generate_dt_start_end(shift)
-        lines.append(event_details['dt_start'])
-        lines.append(event_details['dt_end'])
 
-    lines.append(f'DTSTAMP:{dt_stamp}')
-    lines.append(
-        f'UID:{event_details["start_date"]}T{event_details["start_time"]}@studybuffalo.com-{i}'
-    )
-    lines.append(f'CREATED:{dt_stamp}')
-    lines.append(f'DESCRIPTION:{shift["comment"]}')
-    lines.append(f'LAST-MODIFIED:{dt_stamp}')
-    lines.append('LOCATION:Red Deer Regional Hospital Centre')
-    lines.append('SEQUENCE:0')
-    lines.append('STATUS:CONFIRMED')
-    lines.append(f'SUMMARY:{shift["shift_code"]} Shift')
-    lines.append('TRANSP:TRANSPARENT')
-
-    if user['reminder'] is not None:
-        lines.extend(generate_alarm(user['reminder'], shift['shift_code']))
+def escape_text(text):
+    """Escapes a value for an .ics TEXT property (e.g. DESCRIPTION)."""
+    return text.replace('\r\n', '\n').translate(TEXT_ESCAPES)
+
+
+def get_event_lines(reminder):
+    """Returns the line templates of an event.
+
+    Templates use str.format fields for the per-shift values (dt_start,
+    dt_end, uid, comment, shift_code) and the revision values
+    (sequence, created, last_modified).
+    """
+    lines = [
+        'BEGIN:VEVENT',
+        '{dt_start}',
+        '{dt_end}',
+        'DTSTAMP:{last_modified}',
+        'UID:{uid}',
+        'CREATED:{created}',
+        'DESCRIPTION:{comment}',
+        'LAST-MODIFIED:{last_modified}',
+        'LOCATION:Red Deer Regional Hospital Centre',
+        'SEQUENCE:{sequence}',
+        'STATUS:CONFIRMED',
+        'SUMMARY:{shift_code} Shift',
+        'TRANSP:TRANSPARENT',
+    ]
+
+    if reminder is not None:
+        lines.extend(generate_alarm(reminder, '{shift_code}'))
 
     lines.append('END:VEVENT')
 
-    return lines
+    return tuple(lines)
+
 
+class EventTemplate():
+    """A pre-folded template of a calendar event.
 
-def fold_calendar_lines(lines):
-    """Folds all lines so that max length is 75."""
-    LOG.debug('Folding lines greater than 75 characters long')
+    The event lines are joined into a single template (with any long
+    constant lines folded in advance), so rendering an event is one
+    format and one encode; lines are only folded individually when a
+    shift value makes a line too long (e.g. a long comment).
+    """
+    def generate_fields(self, shift, uid, revision):
+        """Returns the template fields for a shift."""
+        event_details = self.dt_start_end(shift)
+
+        return {
+            'dt_start': event_details['dt_start'],
+            'dt_end': event_details['dt_end'],
+            'uid': uid,
+            'comment': escape_text(shift['comment']),
+            'shift_code': shift['shift_code'],
+            'sequence': revision['sequence'],
+            'created': revision['created'],
+            'last_modified': revision['last_modified'],
+        }
+
+    def hash_fields(self, fields):
+        """Returns a hash of the event content (ignoring its revision)."""
+        content = '\x1f'.join([
+            self.digest, fields['dt_start'], fields['dt_end'], fields['comment'], fields['shift_code'],
+        ])
+
+        return hashlib.sha256(content.encode('utf8')).hexdigest()
+
+    def render(self, fields):
+        """Returns the folded and encoded event."""
+        content = self.template.format_map(fields).encode('utf8')
+
+        if max(map(len, content.split(b'\n'))) > 75:
+            content = b''.join([encode_line(line.format_map(fields)) for line in self.lines])
+
+        return content
+
+    def __init__(self, full_day, reminder, tz_name=DEFAULT_TIMEZONE):
+        if full_day:
+            self.dt_start_end = generate_full_day_dt_start_end
+        else:
+            self.dt_start_end = partial(generate_dt_start_end, tz_name=tz_name)
+
+        self.lines = get_event_lines(reminder)
+        self.digest = hashlib.sha256(
+            '\n'.join((str(full_day),) + self.lines).encode('utf8')
+        ).hexdigest()
+        self.template = ''.join(
+            line + '\n' if '{' in line else ''.join(fold_line(line)) for line in self.lines
+        )
 
-    folded_lines = []
 
-    for line in lines:
-        if len(line) > 75:
+@lru_cache(maxsize=None)
+def get_event_template(full_day, reminder, tz_name=DEFAULT_TIMEZONE):
+    """Returns the (shared) event template for the user settings."""
+    return EventTemplate(full_day, reminder, tz_name)
 
-            # Create line with first 75 characters
-            new_line = line[0:75]
-            folded_lines.append(new_line + '\n')
 
-            # Go through remainder and fold them
-            line = line[75:]
-            length = len(line)
+def new_revision(dt_stamp):
+    """Returns the revision details of a new event."""
+    return {'sequence': 0, 'created': dt_stamp, 'last_modified': dt_stamp}
 
-            # 74 characters because of required leading space
-            while length > 74:
-                new_line = line[0:74]
-                folded_lines.append(' ' + new_line + '\n')
 
-                # Generate new line and length
-                line = line[74:]
-                length = len(line)
+class EventIndex():
+    """Tracks the revision of each of a user's calendar events.
 
-            # Add remainder
-            folded_lines.append(' ' + line + '\n')
+    Unchanged events keep their timestamps (and so are rendered
+    verbatim); changed events are given a new LAST-MODIFIED and an
+    incremented SEQUENCE so that clients only update what changed.
+    """
+    def _index_path(self):
+        """Returns the path to the user's index file."""
+        return Path(self.location, f'{self.user_id}.json')
+
+    def load(self):
+        """Loads the saved event index (if any)."""
+        try:
+            with open(self._index_path(), 'r', encoding='utf8') as index_file:
+                self.events = json.load(index_file)
+        except (OSError, ValueError):
+            self.events = {}
+
+    def revise(self, uid, event_hash, dt_stamp):
+        """Records an event and returns its revision details.
+
+        Arguments:
+            uid (str): The unique ID of the event.
+            event_hash (str): A hash of the event content (ignoring
+                its revision).
+            dt_stamp (str): A string timestamp of this run.
+
+        Returns:
+            dict: the event's hash, sequence, created and last_modified
+                values.
+        """
+        previous = self.events.get(uid)
+
+        if previous is None:
+            revision = dict(new_revision(dt_stamp), hash=event_hash)
+        elif previous['hash'] == event_hash:
+            revision = previous
         else:
-            folded_lines.append(line + '\n')
+            revision = {
+                'hash': event_hash,
+                'sequence': previous['sequence'] + 1,
+                'created': previous['created'],
+                'last_modified': dt_stamp,
+            }
+
+        self.revised_events[uid] = revision
+
+        return revision
+
+    def save(self):
+        """Atomically saves the events revised during this run."""
+        os.makedirs(self.location, mode=0o700, exist_ok=True)
+
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.location)
+
+        try:
+            with os.fdopen(file_descriptor, 'w', encoding='utf8') as index_file:
+                json.dump(self.revised_events, index_file)
+
+            os.replace(temp_path, self._index_path())
+        except OSError:
+            LOG.warning('Unable to save calendar event index for user %s', self.user_id)
+
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def __init__(self, location, user_id):
+        self.location = location
+        self.user_id = user_id
+        self.events = {}
+        self.revised_events = {}
+
+
+def fold_octets(data):
+    """Folds an encoded line so that no segment exceeds 75 octets.
+
+    Folding is done in a single pass and never splits a multibyte
+    UTF-8 character across segments.
+
+    Arguments:
+        data (bytes): The UTF-8 encoded line (without a newline).
 
-    return folded_lines
+    Returns:
+        bytes: the folded line (continuation segments start with the
+            required leading space) with a trailing newline.
+    """
+    length = len(data)
+
+    if length <= 75:
+        return data + b'\n'
+
+    segments = []
+    start = 0
+
+    # 74 octets per continuation segment because of the leading space
+    limit = 75
+
+    while length - start > limit:
+        end = start + limit
+
+        # Back up to the start of a character (UTF-8 continuation
+        # bytes are 0b10xxxxxx)
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+
+        segments.append(data[start:end])
+        start = end
+        limit = 74
+
+    segments.append(data[start:])
+
+    return b'\n '.join(segments) + b'\n'
+
+
+def fold_line(line):
+    """Yields the folded segments of a line (max length of 75 octets).
+
+    Each segment includes its trailing newline; continuation segments
+    start with the required leading space.
+    """
+    for segment in fold_octets(line.encode('utf8'))[:-1].split(b'\n'):
+        yield segment.decode('utf8') + '\n'
+
+
+def encode_line(line):
+    """Returns the folded line encoded for the .ics file."""
+    return fold_octets(line.encode('utf8'))
+
+
+@lru_cache(maxsize=None)
+def get_calendar_header(title=CALENDAR_TITLE, tz_name=DEFAULT_TIMEZONE):
+    """Returns the folded and encoded calendar header."""
+    lines = [line.format(title=title, timezone=tz_name) for line in CALENDAR_HEADER]
+    lines.extend(generate_vtimezone(tz_name, date.today().year))
+
+    return b''.join(encode_line(line) for line in lines)
+
+
+def hash_existing_calendar(file_path):
+    """Returns the content hash of an existing calendar (or None)."""
+    content_hash = hashlib.sha256()
+
+    try:
+        with open(file_path, 'rb') as ics:
+            for line in ics:
+                content_hash.update(STAMP_LINES.sub(b'', line))
+    except OSError:
+        return None
+
+    return content_hash.hexdigest()
+
+
+def save_calendar(chunks, calendar_name, calendar_location):
+    """Saves the provided content as an .ics calendar file.
 
+    The calendar is written to a temporary file and atomically renamed
+    into place. If the content (ignoring the DTSTAMP, CREATED and
+    LAST-MODIFIED lines) matches the existing calendar, the existing
+    file is left alone so clients do not needlessly re-sync.
 
-def save_calendar(lines, calendar_name, calendar_location):
-    """Saves the provided lines as an .ics calendar file."""
+    Arguments:
+        chunks (iterable): The encoded content, as bytes of whole
+            folded lines; may be a generator, which is written as it
+            is consumed.
+        calendar_name (str): The calendar file name (without extension).
+        calendar_location (str): The directory to save the calendar in.
+
+    Returns:
+        bool: whether the calendar file was written.
+    """
     calendar_title = f'{calendar_name}.ics'
     file_path = Path(calendar_location, calendar_title)
 
     LOG.debug('Saving calendar to %s', file_path)
 
-    with open(file_path, 'w', encoding='utf8') as ics:
-        for line in lines:
-            ics.write(line)
+    content_hash = hashlib.sha256()
+    temp_descriptor, temp_path = tempfile.mkstemp(
+        prefix=f'.{calendar_name}.', suffix='.tmp', dir=calendar_location
+    )
+
+    try:
+        with os.fdopen(temp_descriptor, 'wb') as ics:
+            for chunk in chunks:
+                ics.write(chunk)
+                content_hash.update(STAMP_LINES.sub(b'', chunk))
+
+        if content_hash.hexdigest() == hash_existing_calendar(file_path):
+            LOG.debug('Calendar %s is unchanged', file_path)
+            os.remove(temp_path)
+
+            return False
+
+        # mkstemp creates private files; calendars are served publicly
+        os.chmod(temp_path, CALENDAR_FILE_MODE)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        raise
+
+    return True
+
+
+def replace_file(file_path, data, file_mode=None):
+    """Atomically replaces the file with the provided data.
+
+    Arguments:
+        file_path (str): The path to the file.
+        data (bytes): The new file content.
+        file_mode (int): The permissions of the new file (defaults to
+            owner read/write only).
+    """
+    file_path = Path(file_path)
+    temp_descriptor, temp_path = tempfile.mkstemp(
+        prefix=f'.{file_path.name}.', suffix='.tmp', dir=file_path.parent
+    )
+
+    try:
+        with os.fdopen(temp_descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+
+        if file_mode is not None:
+            os.chmod(temp_path, file_mode)
+
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        raise
+
+
+def compress_gzip(data):
+    """Returns gzip compressed data (with a fixed header timestamp)."""
+    compressed = io.BytesIO()
+
+    # A fixed mtime keeps the output identical for identical content
+    with gzip.GzipFile(fileobj=compressed, mode='wb', compresslevel=9, mtime=0) as gzip_file:
+        gzip_file.write(data)
+
+    return compressed.getvalue()
 
 
-def generate_calendar(user, schedule, calendar_location):
-    """Generates an .ics file from the extracted user schedule"""
+def compress_zstd(data):
+    """Returns Zstandard compressed data."""
+    return zstandard.ZstdCompressor(level=19).compress(data)
+
+
+@lru_cache(maxsize=None)
+def get_compressors(formats):
+    """Returns the file extensions and compressors for the formats.
+
+    Arguments:
+        formats (tuple): The configured formats ("gzip" and/or "zstd").
+
+    Returns:
+        list: tuples of the file extension and compression function.
+    """
+    compressors = []
+
+    for compression_format in formats:
+        if compression_format == 'gzip':
+            compressors.append(('gz', compress_gzip))
+        elif compression_format == 'zstd' and zstandard is not None:
+            compressors.append(('zst', compress_zstd))
+        elif compression_format == 'zstd':
+            LOG.warning('zstandard is not installed; skipping .ics.zst calendars')
+        else:
+            LOG.warning('Unknown calendar compression format: %s', compression_format)
+
+    return compressors
+
+
+def save_compressed_calendars(file_path, formats):
+    """Saves pre-compressed copies of a calendar for static serving.
+
+    A compressed copy is only regenerated when it is missing or older
+    than the calendar (i.e. when the calendar content changed).
+
+    Arguments:
+        file_path (str): The path to the .ics calendar.
+        formats (tuple): The compression formats to save.
+    """
+    compressors = get_compressors(tuple(formats))
+
+    if not compressors:
+        return
+
+    calendar_mtime = os.path.getmtime(file_path)
+    data = None
+
+    for extension, compress in compressors:
+        compressed_path = f'{file_path}.{extension}'
+
+        try:
+            if os.path.getmtime(compressed_path) >= calendar_mtime:
+                continue
+        except OSError:
+            pass
+
+        if data is None:
+            with open(file_path, 'rb') as ics:
+                data = ics.read()
+
+        LOG.debug('Saving compressed calendar to %s', compressed_path)
+
+        replace_file(compressed_path, compress(data), CALENDAR_FILE_MODE)
+
+
+def render_calendar(  # pylint: disable=too-many-arguments
+        user, schedule, dt_stamp, event_index=None, *, title=CALENDAR_TITLE, tz_name=DEFAULT_TIMEZONE
+):
+    """Yields the encoded content of the user's .ics calendar.
+
+    Arguments:
+        user (dict): A dictionary of user details.
+        schedule (list): The user's shifts.
+        dt_stamp (str): A string timestamp of the .ics creation date.
+        event_index (obj): An EventIndex to revise the events with
+            (if None, every event is treated as new).
+        title (str): The calendar name shown by clients.
+        tz_name (str): The timezone of the shift times.
+    """
+    yield get_calendar_header(title, tz_name)
+
+    template = get_event_template(user['full_day'], user['reminder'], tz_name)
+    revision = new_revision(dt_stamp)
+    ordinals = Counter()
+
+    for shift in schedule:
+        ordinal_key = (shift['start_datetime'].date(), shift['shift_code'])
+        uid = generate_event_uid(user, shift, ordinals[ordinal_key])
+        ordinals[ordinal_key] += 1
+
+        fields = template.generate_fields(shift, uid, revision)
+
+        if event_index is not None:
+            fields.update(event_index.revise(uid, template.hash_fields(fields), dt_stamp))
+
+        yield template.render(fields)
+
+    # End calendar file
+    yield CALENDAR_FOOTER
+
+
+def get_window_start(window_months, today=None):
+    """Returns the first day of the oldest month kept in the calendar.
+
+    Arguments:
+        window_months (int): The number of past months to keep.
+        today (obj): The current date (defaults to today).
+
+    Returns:
+        obj: the datetime the calendar window starts at.
+    """
+    today = today or date.today()
+    months = today.year * 12 + today.month - 1 - window_months
+
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def split_schedule(schedule, window_months):
+    """Splits the schedule into the calendar window and the archive.
+
+    Arguments:
+        schedule (list): The user's shifts.
+        window_months (int): The number of past months to keep in the
+            calendar (0 to keep every shift).
+
+    Returns:
+        tuple: the shifts within the window and the archived shifts.
+    """
+    if not window_months:
+        return schedule, []
+
+    window_start = get_window_start(window_months)
+    shifts = []
+    archived_shifts = []
+
+    for shift in schedule:
+        if shift['start_datetime'] >= window_start:
+            shifts.append(shift)
+        else:
+            archived_shifts.append(shift)
+
+    return shifts, archived_shifts
+
+
+def hash_shifts(user, shifts, tz_name=DEFAULT_TIMEZONE):
+    """Returns a hash of the shifts as they would be rendered."""
+    template = get_event_template(user['full_day'], user['reminder'], tz_name)
+    content_hash = hashlib.sha256(f'{template.digest}{tz_name}'.encode('utf8'))
+
+    for shift in shifts:
+        content_hash.update('\x1f'.join([
+            shift['start_datetime'].isoformat(),
+            shift['end_datetime'].isoformat(),
+            shift['shift_code'],
+            shift['comment'],
+            '\x1e',
+        ]).encode('utf8'))
+
+    return content_hash.hexdigest()
+
+
+def write_calendar(user, shifts, dt_stamp, calendar_config, archive=False):
+    """Renders and saves one of the user's calendars.
+
+    Arguments:
+        user (dict): A dictionary of user details.
+        shifts (list): The shifts to include.
+        dt_stamp (str): A string timestamp of the .ics creation date.
+        calendar_config (dict): The calendar settings (including the
+            save_location).
+        archive (bool): Whether this is the archive calendar.
+
+    Returns:
+        bool: whether the calendar file was written.
+    """
+    if archive:
+        calendar_name = f'{user["calendar_name"]}-archive'
+        index_id = f'{user["sb_user"]}-archive'
+        title = ARCHIVE_TITLE
+    else:
+        calendar_name = user['calendar_name']
+        index_id = user['sb_user']
+        title = CALENDAR_TITLE
+
+    event_index = None
+
+    if calendar_config.get('state_location'):
+        event_index = EventIndex(calendar_config['state_location'], index_id)
+        event_index.load()
+
+    # Stream the rendered events straight into the calendar file
+    chunks = render_calendar(
+        user,
+        shifts,
+        dt_stamp,
+        event_index,
+        title=title,
+        tz_name=calendar_config.get('timezone', DEFAULT_TIMEZONE),
+    )
+    saved = save_calendar(chunks, calendar_name, calendar_config['save_location'])
+
+    save_compressed_calendars(
+        Path(calendar_config['save_location'], f'{calendar_name}.ics'),
+        calendar_config.get('compress', ()),
+    )
+
+    # Only record the new revisions once they are in the calendar
+    if event_index is not None:
+        event_index.save()
+
+    return saved
+
+
+def update_archive_calendar(user, archived_shifts, dt_stamp, calendar_config):
+    """Saves the user's archive calendar if its shifts have changed.
+
+    The archived shifts only change when the calendar window moves on
+    (or past shifts are edited), so the archive is only rendered when
+    the hash of its shifts differs from the one recorded last time.
+    """
+    archive_path = Path(calendar_config['save_location'], f'{user["calendar_name"]}-archive.ics')
+
+    if not archived_shifts and not archive_path.exists():
+        return
+
+    shifts_hash = None
+    hash_path = None
+
+    if calendar_config.get('state_location'):
+        shifts_hash = hash_shifts(
+            user, archived_shifts, calendar_config.get('timezone', DEFAULT_TIMEZONE)
+        )
+        hash_path = Path(calendar_config['state_location'], f'{user["sb_user"]}-archive.sha256')
+
+        try:
+            with open(hash_path, 'r', encoding='utf8') as hash_file:
+                if hash_file.read() == shifts_hash and archive_path.exists():
+                    return
+        except OSError:
+            pass
+
+    LOG.info('Generating archive .ics calendar for %s', user['name'])
+
+    write_calendar(user, archived_shifts, dt_stamp, calendar_config, archive=True)
+
+    if hash_path is not None:
+        replace_file(hash_path, shifts_hash.encode('utf8'))
+
+
+def generate_calendar(user, schedule, calendar_location, calendar_config=None):
+    """Generates an .ics file from the extracted user schedule
+
+    If a window is configured, shifts older than the window are moved
+    to a separate archive calendar ("<calendar name>-archive.ics").
+
+    Arguments:
+        user (dict): A dictionary of user details.
+        schedule (list): The user's shifts.
+        calendar_location (str): The directory to save the calendar in.
+        calendar_config (dict): The calendar settings of the
+            application configuration.
+
+    Returns:
+        bool: whether the calendar file was written (False if the
+            schedule has not changed since the last run).
+    """
     LOG.info('Generating .ics calendar for %s', user['name'])
 
+    calendar_config = dict(calendar_config or {}, save_location=calendar_location)
+
     # Generate initial calendar information
     dt_stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
 
-    lines = [
-        'BEGIN:VCALENDAR',
-        'PRODID:-//StudyBuffalo.com//RDRHC Calendar//EN',
-        'VERSION:2.0',
-        'CALSCALE:GREGORIAN',
-        'X-WR-CALNAME:Work Schedule',
-        'X-WR-TIMEZONE:America/Edmonton',
-        'BEGIN:VTIMEZONE',
-        'TZID:America/Edmonton',
-        'X-LIC-LOCATION:America/Edmonton',
-        'BEGIN:DAYLIGHT',
-        'TZOFFSETFROM:-0700',
-        'TZOFFSETTO:-0600',
-        'TZNAME:MDT',
-        'DTSTART:19700308T020000',
-        'RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=2SU',
-        'END:DAYLIGHT',
-        'BEGIN:STANDARD',
-        'TZOFFSETFROM:-0600',
-        'TZOFFSETTO:-0700',
-        'TZNAME:MST',
-        'DTSTART:19701101T020000',
-        'RRULE:FREQ=YEARLY;BYMONTH=11;BYDAY=1SU',
-        'END:STANDARD',
-        'END:VTIMEZONE',
-    ]
+    shifts, archived_shifts = split_schedule(schedule, calendar_config.get('window_months', 0))
 
-    for index, shift in enumerate(schedule):
-        lines.extend(generate_calendar_event(shift, user, dt_stamp, index))
-
-    # End calendar file
-    lines.append('END:VCALENDAR')
+    saved = write_calendar(user, shifts, dt_stamp, calendar_config)
 
-    # Fold lines to meet .ics standard (max length of 75 characters)
-    folded_lines = fold_calendar_lines(lines)
+    if calendar_config.get('window_months'):
+        update_archive_calendar(user, archived_shifts, dt_stamp, calendar_config)
 
-    # Save the calendar file
-    save_calendar(folded_lines, user['calendar_name'], calendar_location)
+    return saved
@@ -0,0 +1,171 @@
+"""Serves the generated .ics calendars from an in-memory cache."""
+from collections import OrderedDict
+from email.utils import formatdate
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import os
+import re
+import threading
+from urllib.parse import urlsplit
+
+from unipath import Path
+
+
+LOG = logging.getLogger(__name__)
+
+CALENDAR_PATH = re.compile(r'^/([\w-]+)\.ics$')
+
+
+class CalendarCache():
+    """An LRU cache of calendar file contents and their ETags.
+
+    Entries are revalidated against the file's inode, modification time
+    and size on each access (a single stat). This is how the cache is
+    invalidated: calendars are saved by run.py (a separate process)
+    by replacing the file, so a saved calendar is picked up on the
+    next request for it.
+    """
+    def get(self, calendar_name):
+        """Returns the cached calendar (or None if it does not exist).
+
+        Returns:
+            dict: the calendar content, etag and last_modified values.
+        """
+        file_path = Path(self.location, f'{calendar_name}.ics')
+
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            self.invalidate(calendar_name)
+
+            return None
+
+        # Calendars are saved by replacing the file (so a new inode)
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            entry = self.entries.get(calendar_name)
+
+            if entry and entry['version'] == version:
+                self.entries.move_to_end(calendar_name)
+                self.hits += 1
+
+                return entry
+
+            self.misses += 1
+
+        try:
+            with open(file_path, 'rb') as ics:
+                content = ics.read()
+        except OSError:
+            return None
+
+        entry = {
+            'version': version,
+            'content': content,
+            'etag': f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+            'last_modified': formatdate(stat.st_mtime, usegmt=True),
+        }
+
+        with self.lock:
+            self.entries[calendar_name] = entry
+            self.entries.move_to_end(calendar_name)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return entry
+
+    def invalidate(self, calendar_name):
+        """Removes a calendar from the cache."""
+        with self.lock:
+            self.entries.pop(calendar_name, None)
+
+    def __init__(self, location, max_entries=256):
+        self.location = location
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header matches the ETag."""
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+
+        # If-None-Match uses the weak comparison
+        if candidate == '*' or candidate.replace('W/', '', 1) == etag:
+            return True
+
+    return False
+
+
+class CalendarRequestHandler(BaseHTTPRequestHandler):
+    """Handles GET/HEAD requests for "/<calendar name>.ics"."""
+    def _respond(self, include_body):
+        """Sends the calendar (or a 304/404 response)."""
+        match = CALENDAR_PATH.match(urlsplit(self.path).path)
+        entry = self.server.calendar_cache.get(match.group(1)) if match else None
+
+        if entry is None:
+            self.send_error(404)
+
+            return
+
+        if etag_matches(self.headers.get('If-None-Match'), entry['etag']):
+            self.send_response(304)
+            self.send_header('ETag', entry['etag'])
+            self.end_headers()
+
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar; charset=utf-8')
+        self.send_header('Content-Length', str(len(entry['content'])))
+        self.send_header('ETag', entry['etag'])
+        self.send_header('Last-Modified', entry['last_modified'])
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        if include_body:
+            self.wfile.write(entry['content'])
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serves a calendar."""
+        self._respond(True)
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        """Serves a calendar's headers."""
+        self._respond(False)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOG.debug('%s - %s', self.address_string(), format % args)
+
+
+def create_calendar_server(app_config):
+    """Creates (but does not start) the calendar HTTP server.
+
+    Arguments:
+        app_config (dict): The application configuration.
+
+    Returns:
+        obj: the ThreadingHTTPServer (with its calendar_cache).
+    """
+    server_config = app_config.get('calendar_server', {})
+
+    server = ThreadingHTTPServer(
+        (server_config.get('host', '127.0.0.1'), server_config.get('port', 8080)),
+        CalendarRequestHandler,
+    )
+    server.daemon_threads = True
+    server.calendar_cache = CalendarCache(
+        app_config['calendar_save_location'], server_config.get('cache_size', 256)
+    )
+
+    return server
@@ -25,6 +25,34 @@ def assemble_app_configuration_details(root_path):
             'Authorization': f'Token {config.get("api", "token")}',
             'Content-Type': 'application/json',
         },
+        'api_limits': {
+            'initial_concurrency': config.getint(
+                'api', 'initial_concurrency', fallback=4
+            ),
+            'max_concurrency': config.getint(
+                'api', 'max_concurrency', fallback=16
+            ),
+            'latency_tolerance': config.getfloat(
+                'api', 'latency_tolerance', fallback=2.0
+            ),
+        },
+        'api_retries': {
+            'max_retries': config.getint('api', 'max_retries', fallback=3),
+            'backoff_base': config.getfloat(
+                'api', 'backoff_base', fallback=0.5
+            ),
+            'backoff_max': config.getfloat('api', 'backoff_max', fallback=10.0),
+            'breaker_threshold': config.getint(
+                'api', 'breaker_threshold', fallback=5
+            ),
+            'breaker_cooldown': config.getfloat(
+                'api', 'breaker_cooldown', fallback=60.0
+            ),
+        },
+        'cache': {
+            'location': config.get('cache', 'location', fallback=''),
+            'ttl': config.getint('cache', 'ttl', fallback=3600),
+        },
         'timezone': config.get('localization', 'timezone'),
         'excel': {
             'schedule_loc': config.get('schedules', 'save_location'),
@@ -83,6 +111,40 @@ def assemble_app_configuration_details(root_path):
             ),
         },
         'calendar_save_location': config.get('calendar', 'save_location'),
+        'calendar': {
+            'timezone': config.get('localization', 'timezone'),
+            'state_location': config.get(
+                'calendar', 'state_location', fallback=''
+            ),
+            'window_months': config.getint(
+                'calendar', 'window_months', fallback=0
+            ),
+            'compress': tuple(
+                compression_format.strip() for compression_format in config.get(
+                    'calendar', 'compress', fallback=''
+                ).split(',') if compression_format.strip()
+            ),
+        },
+        'calendar_server': {
+            'host': config.get(
+                'calendar_server', 'host', fallback='127.0.0.1'
+            ),
+            'port': config.getint('calendar_server', 'port', fallback=8080),
+            'cache_size': config.getint(
+                'calendar_server', 'cache_size', fallback=256
+            ),
+        },
+        'pipeline': {
+            'prefetch_users': config.getint(
+                'pipeline', 'prefetch_users', fallback=2
+            ),
+            'calendar_workers': config.getint(
+                'pipeline', 'calendar_workers', fallback=4
+            ),
+            'bulk_emails': config.getint(
+                'pipeline', 'bulk_emails', fallback=100
+            ),
+        },
         'email': {
             'server': config.get('email', 'server'),
             'from_name': config.get('email', 'from_name'),
@@ -99,7 +161,30 @@ def assemble_app_configuration_details(root_path):
             'missing_codes_html': config.get(
                 'email', 'missing_codes_html', raw=True
             ),
-            'unsubscribe_link': config.get('email', 'unsubscribe_link')
+            'unsubscribe_link': config.get('email', 'unsubscribe_link'),
+            'max_messages_per_connection': config.getint(
+                'email', 'max_messages_per_connection', fallback=100
+            ),
+            'smtp_connections': config.getint(
+                'email', 'smtp_connections', fallback=4
+            ),
+            'starttls': config.getboolean('email', 'starttls', fallback=True),
+        },
+        'outbox': {
+            'location': config.get('outbox', 'location', fallback=''),
+            'background_delivery': config.getboolean(
+                'outbox', 'background_delivery', fallback=True
+            ),
+            'max_attempts': config.getint('outbox', 'max_attempts', fallback=5),
+            'retry_delay': config.getint('outbox', 'retry_delay', fallback=60),
+            'poll_interval': config.getint('outbox', 'poll_interval', fallback=5),
+        },
+        'missing_codes': {
+            'location': config.get('missing_codes', 'location', fallback=''),
+        },
+        'digest': {
+            'location': config.get('digest', 'location', fallback=''),
+            'interval': config.getfloat('digest', 'interval', fallback=24),
         },
         'debug': {
             'email_console': config.getboolean('debug', 'email_console')
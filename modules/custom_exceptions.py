@@ -7,3 +7,7 @@ class ScheduleError(LookupError):
 
 class UploadError(ConnectionError):
     """Exception raised for errors related to API uploads."""
+
+
+class CircuitOpenError(ConnectionError):
+    """Exception raised when an API endpoint is known to be down."""
@@ -0,0 +1,548 @@
+"""Delivers emails over reused SMTP connections (or via an outbox)."""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import json
+import logging
+import os
+import smtplib
+import tempfile
+import threading
+import time
+import uuid
+
+
+LOG = logging.getLogger(__name__)
+
+SENDERS = {}
+SENDERS_LOCK = threading.Lock()
+
+OUTBOXES = {}
+OUTBOXES_LOCK = threading.Lock()
+
+# Outbox folders for queued, claimed (being sent) and undeliverable emails
+PENDING = 'pending'
+SENDING = 'sending'
+FAILED = 'failed'
+
+# SMTP reply code for a server closing the connection (e.g. on idle
+# timeouts or per-connection message limits)
+SERVICE_NOT_AVAILABLE = 421
+
+
+class SMTPSession():
+    """Sends emails over a single reused SMTP connection.
+
+    The connection (ehlo and starttls) is opened on the first email and
+    kept open for the rest of the run. It is transparently re-opened
+    after the server disconnects and after the configured number of
+    messages per connection.
+    """
+    def _connect(self):
+        """Opens a new connection to the SMTP server."""
+        LOG.debug('Opening SMTP connection to %s', self.server)
+
+        self.connection = smtplib.SMTP(self.server)
+        self.connection.ehlo()
+
+        if self.starttls:
+            self.connection.starttls()
+        self.sent = 0
+        self.connections += 1
+
+    def _disconnect(self):
+        """Closes the current connection (if any)."""
+        connection = self.connection
+        self.connection = None
+
+        if connection is None:
+            return
+
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            # Connection was already closed by the server
+            pass
+
+    def _sendmail(self, from_address, to_addresses, content):
+        """Sends an email over the current (or a new) connection."""
+        if self.connection is None:
+            self._connect()
+
+        self.connection.sendmail(from_address, to_addresses, content)
+        self.sent += 1
+
+    def send(self, from_address, to_addresses, content):
+        """Sends an email, reconnecting once if the connection dropped.
+
+        Arguments:
+            from_address (str): The sender's address.
+            to_addresses (list): The recipients' addresses.
+            content (str): The serialized email.
+        """
+        with self.lock:
+            if self.sent >= self.max_messages:
+                self._disconnect()
+
+            try:
+                self._sendmail(from_address, to_addresses, content)
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException) as error:
+                if getattr(error, 'smtp_code', SERVICE_NOT_AVAILABLE) != SERVICE_NOT_AVAILABLE:
+                    raise
+
+                LOG.debug('SMTP connection to %s was closed; reconnecting', self.server)
+
+                self._disconnect()
+                self._sendmail(from_address, to_addresses, content)
+
+    def close(self):
+        """Closes the connection."""
+        with self.lock:
+            self._disconnect()
+
+    def __init__(self, server, max_messages=100, starttls=True):
+        self.server = server
+        self.max_messages = max(1, max_messages)
+        self.starttls = starttls
+        self.connection = None
+        self.sent = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+
+class SMTPSenderPool():  # pylint: disable=too-many-instance-attributes
+    """Sends emails concurrently over a bounded pool of SMTP sessions.
+
+    Each of the ``smtp_connections`` worker threads reuses its own
+    SMTPSession. Emails are isolated from each other: a failed email
+    is logged (and counted) without affecting the others.
+    """
+    def _session(self):
+        """Returns the calling thread's SMTP session."""
+        session = getattr(self.local, 'session', None)
+
+        if session is None:
+            session = SMTPSession(self.server, self.max_messages, self.starttls)
+            self.local.session = session
+
+            with self.lock:
+                self.sessions.append(session)
+
+        return session
+
+    def send(self, from_address, to_addresses, content):
+        """Sends an email on the calling thread (raising any errors)."""
+        with self.lock:
+            if self.started is None:
+                self.started = time.monotonic()
+
+        try:
+            self._session().send(from_address, to_addresses, content)
+        except (smtplib.SMTPException, OSError):
+            with self.lock:
+                self.failed += 1
+
+            raise
+
+        with self.lock:
+            self.sent += 1
+            self.finished = time.monotonic()
+
+    def _send_isolated(self, from_address, to_addresses, content):
+        """Sends an email, logging (rather than raising) any errors.
+
+        Returns:
+            bool: whether the email was sent.
+        """
+        try:
+            self.send(from_address, to_addresses, content)
+        except (smtplib.SMTPException, OSError) as error:
+            LOG.error('Unable to send email to %s (%s)', ', '.join(to_addresses), error)
+
+            return False
+
+        return True
+
+    def submit(self, from_address, to_addresses, content):
+        """Queues an email to be sent by the pool.
+
+        Returns:
+            obj: the Future of the send (resolving to whether the email
+                was sent).
+        """
+        return self.get_executor().submit(
+            self._send_isolated, from_address, to_addresses, content
+        )
+
+    def get_executor(self):
+        """Returns the pool's executor (started on first use)."""
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.connections, thread_name_prefix='smtp'
+                )
+
+            return self.executor
+
+    def report(self):
+        """Returns a summary of the emails sent by the pool."""
+        with self.lock:
+            elapsed = (self.finished or 0) - (self.started or 0)
+
+            return {
+                'sent': self.sent,
+                'failed': self.failed,
+                'seconds': elapsed,
+                'per_second': self.sent / elapsed if elapsed > 0 else None,
+            }
+
+    def close(self):
+        """Waits for the queued emails and closes the sessions."""
+        with self.lock:
+            executor = self.executor
+            self.executor = None
+
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+        with self.lock:
+            sessions = self.sessions
+            self.sessions = []
+
+        for session in sessions:
+            session.close()
+
+        report = self.report()
+
+        if report['sent'] or report['failed']:
+            per_second = report['per_second']
+
+            LOG.info(
+                'Sent %s emails over %s SMTP connections in %.1f s (%s emails/s, %s failed)',
+                report['sent'],
+                self.connections,
+                report['seconds'],
+                f'{per_second:.1f}' if per_second is not None else 'n/a',
+                report['failed'],
+            )
+
+    def __init__(self, server, connections=1, max_messages=100, starttls=True):
+        self.server = server
+        self.connections = max(1, connections)
+        self.max_messages = max_messages
+        self.starttls = starttls
+        self.local = threading.local()
+        self.sessions = []
+        self.executor = None
+        self.sent = 0
+        self.failed = 0
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+
+def get_smtp_sender(app_config):
+    """Returns the (shared) SMTP sender pool for the configured server."""
+    email_config = app_config['email']
+    server = email_config['server']
+
+    with SENDERS_LOCK:
+        if server not in SENDERS:
+            SENDERS[server] = SMTPSenderPool(
+                server,
+                connections=email_config.get('smtp_connections', 1),
+                max_messages=email_config.get('max_messages_per_connection', 100),
+                starttls=email_config.get('starttls', True),
+            )
+
+        return SENDERS[server]
+
+
+def close_smtp_sessions():
+    """Sends any queued emails and closes all the SMTP sessions."""
+    with SENDERS_LOCK:
+        senders = list(SENDERS.values())
+        SENDERS.clear()
+
+    for sender in senders:
+        sender.close()
+
+
+class Outbox():
+    """Spools emails on disk until they are delivered.
+
+    Each email is written atomically (as JSON) to the "pending" folder,
+    so queued emails survive a crash. Emails are claimed for delivery
+    by moving them to the "sending" folder and are removed once sent.
+    Failed deliveries are retried with exponential backoff and moved to
+    the "failed" folder after the maximum number of attempts.
+    """
+    def _path(self, folder, name=''):
+        """Returns the path to an outbox folder (or file within it)."""
+        return os.path.join(self.location, folder, name)
+
+    def _write(self, folder, name, message):
+        """Atomically writes the message to the outbox folder."""
+        file_descriptor, temp_path = tempfile.mkstemp(
+            prefix='.', suffix='.tmp', dir=self._path(folder)
+        )
+
+        try:
+            with os.fdopen(file_descriptor, 'w', encoding='utf8') as message_file:
+                json.dump(message, message_file)
+
+            os.replace(temp_path, self._path(folder, name))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+            raise
+
+    def _read(self, folder, name):
+        """Returns the message (or None if it is missing or corrupt)."""
+        try:
+            with open(self._path(folder, name), 'r', encoding='utf8') as message_file:
+                return json.load(message_file)
+        except FileNotFoundError:
+            # Claimed by another worker
+            return None
+        except ValueError:
+            LOG.error('Unable to read queued email %s; moving it to failed', name)
+            os.replace(self._path(folder, name), self._path(FAILED, name))
+
+            return None
+
+    def enqueue(self, from_address, to_addresses, content):
+        """Queues an email for delivery.
+
+        Returns:
+            str: the name of the queued email.
+        """
+        name = f'{time.time_ns()}-{uuid.uuid4().hex}.json'
+
+        self._write(PENDING, name, {
+            'from_address': from_address,
+            'to_addresses': list(to_addresses),
+            'content': content,
+            'attempts': 0,
+            'next_attempt': 0,
+        })
+
+        self.new_message.set()
+
+        return name
+
+    def pending(self):
+        """Returns the names of the queued emails (oldest first)."""
+        return sorted(
+            name for name in os.listdir(self._path(PENDING)) if name.endswith('.json')
+        )
+
+    def recover(self, max_age=600):
+        """Re-queues emails claimed by a worker that did not finish.
+
+        Arguments:
+            max_age (int): Seconds after which a claim is considered
+                abandoned (e.g. the worker crashed while sending).
+        """
+        for name in os.listdir(self._path(SENDING)):
+            path = self._path(SENDING, name)
+
+            if name.endswith('.json') and time.time() - os.path.getmtime(path) > max_age:
+                LOG.warning('Re-queuing abandoned email %s', name)
+                os.replace(path, self._path(PENDING, name))
+
+    def _retry(self, name, message, error):
+        """Re-queues (or fails) a message that could not be sent."""
+        message['attempts'] += 1
+
+        if message['attempts'] >= self.max_attempts:
+            LOG.error(
+                'Unable to deliver email %s after %s attempts (%s)',
+                name, message['attempts'], error,
+            )
+            folder = FAILED
+        else:
+            delay = self.retry_delay * 2 ** (message['attempts'] - 1)
+            message['next_attempt'] = time.time() + delay
+            LOG.warning(
+                'Unable to deliver email %s (%s); retrying in %s seconds',
+                name, error, delay,
+            )
+            folder = PENDING
+
+        self._write(SENDING, name, message)
+        os.replace(self._path(SENDING, name), self._path(folder, name))
+
+    def _deliver_message(self, send, name):
+        """Delivers one queued email (if it is due and still queued).
+
+        Returns:
+            int: 1 if the email was delivered (otherwise 0).
+        """
+        message = self._read(PENDING, name)
+
+        if message is None or message['next_attempt'] > time.time():
+            return 0
+
+        # Claim the message (another worker may have claimed it first);
+        # the claim is timestamped so recover() only re-queues stale claims
+        # (os.replace keeps the time the message was queued)
+        try:
+            os.replace(self._path(PENDING, name), self._path(SENDING, name))
+            os.utime(self._path(SENDING, name))
+        except FileNotFoundError:
+            return 0
+
+        try:
+            send(message['from_address'], message['to_addresses'], message['content'])
+        except (smtplib.SMTPException, OSError) as error:
+            self._retry(name, message, error)
+
+            return 0
+
+        try:
+            os.remove(self._path(SENDING, name))
+        except FileNotFoundError:
+            LOG.warning('Delivered email %s was re-queued while it was being sent', name)
+
+        return 1
+
+    def deliver(self, send, executor=None):
+        """Delivers the queued emails that are due.
+
+        Arguments:
+            send (callable): Sends an email (from_address, to_addresses
+                and content).
+            executor (obj): An optional executor to deliver the emails
+                concurrently.
+
+        Returns:
+            int: the number of emails delivered.
+        """
+        deliver_message = partial(self._deliver_message, send)
+
+        if executor is None:
+            return sum(map(deliver_message, self.pending()))
+
+        return sum(executor.map(deliver_message, self.pending()))
+
+    def __init__(self, location, max_attempts=5, retry_delay=60):
+        self.location = location
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.new_message = threading.Event()
+
+        for folder in (PENDING, SENDING, FAILED):
+            os.makedirs(self._path(folder), mode=0o700, exist_ok=True)
+
+
+def get_outbox(app_config):
+    """Returns the (shared) outbox (or None if emails are sent inline)."""
+    outbox_config = app_config.get('outbox', {})
+    location = outbox_config.get('location')
+
+    if not location:
+        return None
+
+    with OUTBOXES_LOCK:
+        if location not in OUTBOXES:
+            OUTBOXES[location] = Outbox(
+                location,
+                max_attempts=outbox_config.get('max_attempts', 5),
+                retry_delay=outbox_config.get('retry_delay', 60),
+            )
+
+        return OUTBOXES[location]
+
+
+class OutboxWorker():
+    """Delivers the outbox's emails on a background thread.
+
+    The worker delivers new emails as soon as they are queued (and any
+    retries once they are due), so the pipeline never waits on SMTP.
+    On exit, the worker makes a final delivery pass; emails awaiting a
+    retry stay queued for the next run (or deliver_emails.py).
+    """
+    def _run(self):
+        """Delivers queued emails until the worker is stopped."""
+        while True:
+            # Checked before delivering so the final pass sees every email
+            stopping = self.stopping.is_set()
+            self.outbox.new_message.clear()
+
+            try:
+                self.delivered += self.outbox.deliver(
+                    self.sender.send, self.sender.get_executor()
+                )
+            except OSError:
+                LOG.exception('Unable to deliver the queued emails')
+
+            if stopping:
+                break
+
+            self.outbox.new_message.wait(self.poll_interval)
+
+    def __enter__(self):
+        if self.outbox is not None and self.background:
+            self.outbox.recover()
+            self.thread = threading.Thread(
+                target=self._run, name='outbox-worker', daemon=True
+            )
+            self.thread.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.thread is not None:
+            self.stopping.set()
+            self.outbox.new_message.set()
+            self.thread.join()
+            self.thread = None
+
+            LOG.info(
+                'Delivered %s queued emails (%s awaiting delivery)',
+                self.delivered,
+                len(self.outbox.pending()),
+            )
+
+        return False
+
+    def __init__(self, app_config):
+        self.outbox = get_outbox(app_config)
+        self.sender = get_smtp_sender(app_config) if self.outbox else None
+        self.background = app_config.get('outbox', {}).get('background_delivery', True)
+        self.poll_interval = app_config.get('outbox', {}).get('poll_interval', 5)
+        self.stopping = threading.Event()
+        self.thread = None
+        self.delivered = 0
+
+
+def deliver_outbox(app_config):
+    """Delivers the queued emails that are due (e.g. from cron).
+
+    Returns:
+        int: the number of emails delivered.
+    """
+    outbox = get_outbox(app_config)
+
+    if outbox is None:
+        LOG.warning('No outbox location is configured')
+
+        return 0
+
+    outbox.recover()
+
+    sender = get_smtp_sender(app_config)
+
+    try:
+        delivered = outbox.deliver(sender.send, sender.get_executor())
+    finally:
+        close_smtp_sessions()
+
+    LOG.info(
+        'Delivered %s queued emails (%s awaiting delivery)',
+        delivered,
+        len(outbox.pending()),
+    )
+
+    return delivered
@@ -0,0 +1,208 @@
+"""Coalesces a user's schedule notifications across runs into a digest."""
+import json
+import logging
+import os
+import tempfile
+import time
+
+
+LOG = logging.getLogger(__name__)
+
+
+def format_codes(codes):
+    """Formats shift codes as used in the email messages."""
+    return '/'.join(str(code) for code in codes)
+
+
+def codes_differ(old_codes, new_codes):
+    """Determines if a date's shift codes changed.
+
+    Matches Schedule.determine_schedule_changes: the codes are unchanged
+    if there are as many codes and each old code is still present.
+    """
+    if len(old_codes) != len(new_codes):
+        return True
+
+    return any(code not in new_codes for code in old_codes)
+
+
+class NotificationDigest():
+    """Holds a user's pending (not yet emailed) schedule changes.
+
+    Changes are kept per date as the shift codes before the first
+    pending change and the latest shift codes, so successive additions,
+    deletions and changes to the same date fold into their net change
+    (and a date changed back to its original shifts drops out).
+    """
+    def _digest_path(self):
+        """Returns the path to the user's digest file."""
+        return os.path.join(self.location, f'{self.user_id}.json')
+
+    def load(self):
+        """Loads the pending changes (if any)."""
+        try:
+            with open(self._digest_path(), 'r', encoding='utf8') as digest_file:
+                digest = json.load(digest_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            LOG.warning('Unable to read notification digest for user id = %s', self.user_id)
+            return
+
+        self.since = digest['since']
+        self.dates = digest['dates']
+        self.missing = digest['missing']
+        self.null = digest['null']
+
+    def save(self):
+        """Atomically writes the pending changes to disk."""
+        os.makedirs(self.location, mode=0o700, exist_ok=True)
+
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.location)
+
+        try:
+            with os.fdopen(file_descriptor, 'w', encoding='utf8') as digest_file:
+                json.dump({
+                    'since': self.since,
+                    'dates': self.dates,
+                    'missing': self.missing,
+                    'null': self.null,
+                }, digest_file)
+
+            os.replace(temp_path, self._digest_path())
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+            raise
+
+    def clear(self):
+        """Removes the pending changes (once they are emailed)."""
+        self.since = None
+        self.dates = {}
+        self.missing = []
+        self.null = []
+
+        try:
+            os.remove(self._digest_path())
+        except FileNotFoundError:
+            pass
+
+    def merge(self, notification_details):
+        """Merges a run's notification details into the digest.
+
+        Arguments:
+            notification_details (dict): The Schedule's notification
+                details.
+        """
+        changes = [
+            (addition['date'], [], addition['shift_codes'])
+            for addition in notification_details['additions']
+        ]
+        changes.extend(
+            (deletion['date'], deletion['old_shift_codes'], [])
+            for deletion in notification_details['deletions']
+        )
+        changes.extend(
+            (change['date'], change['old_shift_codes'], change['shift_codes'])
+            for change in notification_details['changes']
+        )
+
+        for shift_date, old_codes, new_codes in changes:
+            shift_date = str(shift_date)
+            pending = self.dates.setdefault(shift_date, {'old': list(old_codes)})
+            pending['new'] = list(new_codes)
+
+        for key, pending_shifts in (('missing', self.missing), ('null', self.null)):
+            known = {(shift['date'], shift['shift_code']) for shift in pending_shifts}
+
+            for shift in notification_details[key]:
+                shift_key = (str(shift['date'])[:10], shift['shift_code'])
+
+                if shift_key not in known:
+                    known.add(shift_key)
+                    pending_shifts.append({
+                        'date': shift_key[0],
+                        'email_message': shift['email_message'],
+                        'shift_code': shift['shift_code'],
+                    })
+
+        if self.since is None and (self.dates or self.missing or self.null):
+            self.since = time.time()
+
+    def is_due(self, interval, now=None):
+        """Determines if the pending changes should be emailed.
+
+        Arguments:
+            interval (float): Hours between digest emails.
+            now (float): The current time (defaults to time.time()).
+        """
+        if self.since is None:
+            return False
+
+        now = time.time() if now is None else now
+
+        return now - self.since >= interval * 3600
+
+    def notification_details(self):
+        """Returns the net changes as notification details."""
+        details = {
+            'additions': [],
+            'deletions': [],
+            'changes': [],
+            'missing': [],
+            'null': [],
+        }
+
+        for shift_date in sorted(self.dates):
+            old_codes = self.dates[shift_date]['old']
+            new_codes = self.dates[shift_date]['new']
+
+            if not codes_differ(old_codes, new_codes):
+                continue
+
+            if not old_codes:
+                details['additions'].append({
+                    'date': shift_date,
+                    'email_message': f'{shift_date} - {format_codes(new_codes)}',
+                    'shift_codes': new_codes,
+                })
+            elif not new_codes:
+                details['deletions'].append({
+                    'date': shift_date,
+                    'email_message': f'{shift_date} - {format_codes(old_codes)}',
+                    'old_shift_codes': old_codes,
+                })
+            else:
+                details['changes'].append({
+                    'date': shift_date,
+                    'email_message': (
+                        f'{shift_date} - {format_codes(old_codes)} changed to {format_codes(new_codes)}'
+                    ),
+                    'old_shift_codes': old_codes,
+                    'shift_codes': new_codes,
+                })
+
+        # As in Schedule.clean_missing/clean_null, only shifts for codes
+        # that are (still) added or changed are reported
+        new_codes = {
+            code
+            for detail in details['additions'] + details['changes']
+            for code in detail['shift_codes']
+        }
+
+        for key, pending_shifts in (('missing', self.missing), ('null', self.null)):
+            details[key] = sorted(
+                (shift for shift in pending_shifts if shift['shift_code'] in new_codes),
+                key=lambda shift: shift['date'],
+            )
+
+        return details
+
+    def __init__(self, location, user_id):
+        self.location = location
+        self.user_id = user_id
+        self.since = None
+        self.dates = {}
+        self.missing = []
+        self.null = []
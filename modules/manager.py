@@ -6,10 +6,13 @@ import logging.config
 
 import requests
 
-from modules import notify, upload
+from modules import api, delivery, notify, upload
 from modules.assemble_schedule import assemble_schedule
-from modules.calendar import generate_calendar
-from modules.custom_exceptions import ScheduleError, UploadError
+from modules.cache import cached_get
+from modules.custom_exceptions import CircuitOpenError, ScheduleError, UploadError
+from modules.missing_codes import MissingCodeIndex
+from modules.prefetch import prefetch_user_data
+from modules.render import CalendarRenderer
 from modules.retrieve import retrieve_schedule_file_paths
 
 
@@ -20,15 +23,17 @@ def retrieve_users(app_config):
     """Retrieves all the calendar users."""
     LOG.info('Retrieving all calendar users')
 
-    response = requests.get(f'{app_config["api_url"]}users/', headers=app_config['api_headers'])
+    # Users are always revalidated (ttl=0) as their details (e.g. the
+    # first_email_sent flag) are updated by this program
+    status_code, users = cached_get(
+        app_config, f'{app_config["api_url"]}users/', json.loads, ttl=0
+    )
 
-    if response.status_code >= 400:
+    if status_code >= 400:
         raise requests.ConnectionError(
             f'Unable to connect to API ({app_config["api_url"]})'
         )
 
-    users = json.loads(response.text)
-
     return users
 
 
@@ -51,57 +56,105 @@ def run_program(app_config):
         't': set()
     }
 
-    # Cycle through each user and process their schedule
-    for user in users:
-        # Assemble the users schedule
-        LOG.info(
-            'Assembling schedule for %s (role = %s)',
-            user['schedule_name'],
-            user['role']
-        )
-
-        try:
-            schedule = assemble_schedule(app_config, excel_files, user)
-        except ScheduleError:
-            LOG.exception(
-                'Unable to assemble schedule for %s (role = %s)',
-                user['schedule_name'],
-                user['role']
-            )
-            schedule = None
-
-        if schedule:
-            try:
-                upload.update_schedule_database(
-                    user, schedule.shifts, app_config
-                )
-            except UploadError:
-                LOG.exception(
-                    'Unable to upload to API for %s (role = %s)',
+    # Codes uploaded in previous runs are not uploaded (or emailed) again
+    missing_index = MissingCodeIndex(app_config.get('missing_codes', {}).get('location'))
+    missing_index.load()
+
+    # Emails are delivered from the outbox in the background (if one
+    # is configured) so the users are not held up by the SMTP server
+    with delivery.OutboxWorker(app_config):
+        # Calendars are rendered and saved in the background
+        with CalendarRenderer(app_config) as renderer:
+            # Cycle through each user and process their schedule (the API
+            # data for upcoming users is retrieved in the background)
+            for user, prefetched in prefetch_user_data(app_config, users):
+                # Assemble the users schedule
+                LOG.info(
+                    'Assembling schedule for %s (role = %s)',
                     user['schedule_name'],
                     user['role']
                 )
 
-            # Generate and the iCal file to the Django server
-            generate_calendar(
-                user, schedule.shifts, app_config['calendar_save_location']
+                try:
+                    schedule = assemble_schedule(
+                        app_config,
+                        excel_files,
+                        user,
+                        prefetched,
+                        known_missing=missing_index.known(user['role'])
+                    )
+                except (ScheduleError, CircuitOpenError):
+                    LOG.exception(
+                        'Unable to assemble schedule for %s (role = %s)',
+                        user['schedule_name'],
+                        user['role']
+                    )
+                    schedule = None
+
+                if schedule:
+                    shifts = schedule.shifts
+                    notification = schedule.notification
+
+                    # Forget any codes that are no longer missing
+                    missing_index.prune(user['role'], schedule.shift_codes)
+
+                    # Add the missing codes to the set
+                    missing_codes[user['role']].update(notification['missing_codes'])
+
+                    # Only the shifts and notification are needed from here
+                    # on, so the schedule's source data can be released
+                    schedule = None
+
+                    try:
+                        upload.update_schedule_database(
+                            user, shifts, app_config
+                        )
+                    except (UploadError, CircuitOpenError):
+                        LOG.exception(
+                            'Unable to upload to API for %s (role = %s)',
+                            user['schedule_name'],
+                            user['role']
+                        )
+
+                    # Generate the iCal file on the Django server (in the
+                    # background so the emails are not held up)
+                    renderer.submit(user, shifts)
+
+                    # Send any required emails to user
+                    try:
+                        notify.notify_user(
+                            user, app_config, notification, prefetched.emails()
+                        )
+                    except CircuitOpenError:
+                        LOG.exception(
+                            'Unable to notify %s (role = %s)',
+                            user['schedule_name'],
+                            user['role']
+                        )
+
+        # Upload any newly missing codes to the database
+        missing_codes = missing_index.unknown(missing_codes)
+
+        try:
+            missing_codes_upload = upload.update_missing_codes_database(
+                app_config, missing_codes
             )
+        except CircuitOpenError:
+            LOG.exception('Unable to upload the missing shift codes')
+            missing_codes_upload = None
+        else:
+            missing_index.add(missing_codes)
 
-            # Send any required emails to user
-            notify.notify_user(user, app_config, schedule)
+        missing_index.save()
 
-            # Add the missing codes to the set
-            missing_codes[user['role']] = missing_codes[user['role']].union(
-                schedule.notification_details['missing_upload']
-            )
+        # Notify owner that there are new codes to upload
+        if missing_codes_upload:
+            notify.email_missing_codes(missing_codes_upload, app_config)
 
-    # Upload the missing codes to the database
-    missing_codes_upload = upload.update_missing_codes_database(
-        app_config, missing_codes
-    )
+    # All emails have been sent
+    delivery.close_smtp_sessions()
 
-    # Notify owner that there are new codes to upload
-    if missing_codes_upload:
-        notify.email_missing_codes(missing_codes_upload, app_config)
+    # Record the API limits settled on for tuning the configuration
+    api.report_limits()
 
     LOG.info('CALENDAR GENERATION COMPLETE')
@@ -0,0 +1,122 @@
+"""Builds the two-part (plain text & html) notification emails.
+
+Notification emails always have the same layout, so rather than
+running the full email generator for every message, the headers shared
+by every email are built once and only the variable parts (recipients,
+subject and the two bodies) are encoded per message.
+"""
+from base64 import encodebytes
+from email.header import Header
+from functools import lru_cache
+import secrets
+
+
+# Lines longer than this must not be sent as 7bit (RFC 5322)
+MAX_LINE_LENGTH = 998
+
+# Header lines are folded (between addresses) beyond this length
+FOLD_LENGTH = 78
+
+
+def encode_header(value):
+    """Returns the header value (RFC 2047 encoded if non-ASCII)."""
+    if value.isascii():
+        return value
+
+    return Header(value, 'utf-8').encode()
+
+
+def fold_addresses(name, addresses):
+    """Returns an address header folded between addresses."""
+    lines = [f'{name}: {addresses[0]}'] if addresses else [f'{name}: ']
+
+    for address in addresses[1:]:
+        if len(lines[-1]) + len(address) + 2 > FOLD_LENGTH:
+            lines[-1] += ','
+            lines.append(f' {address}')
+        else:
+            lines[-1] += f', {address}'
+
+    return '\n'.join(lines)
+
+
+def encode_part(text, subtype):
+    """Returns a text part (headers and body) for the message.
+
+    ASCII text with short lines is sent as is (7bit); any other text is
+    sent as base64 encoded UTF-8 (as done by email.mime.text.MIMEText).
+    """
+    text = text.replace('\r\n', '\n')
+
+    if text.isascii() and all(len(line) <= MAX_LINE_LENGTH for line in text.split('\n')):
+        return (
+            f'Content-Type: text/{subtype}; charset="us-ascii"\n'
+            'MIME-Version: 1.0\n'
+            'Content-Transfer-Encoding: 7bit\n'
+            '\n'
+            f'{text}'
+        )
+
+    body = encodebytes(text.encode('utf8')).decode('ascii')
+
+    return (
+        f'Content-Type: text/{subtype}; charset="utf-8"\n'
+        'MIME-Version: 1.0\n'
+        'Content-Transfer-Encoding: base64\n'
+        '\n'
+        f'{body}'
+    )
+
+
+@lru_cache(maxsize=None)
+def get_header_block(from_address, unsubscribe_link):
+    """Returns the boundary and the headers shared by every email."""
+    boundary = f'=============={secrets.token_hex(12)}=='
+
+    headers = (
+        'Content-Type: multipart/alternative;\n'
+        f' boundary="{boundary}"\n'
+        'MIME-Version: 1.0\n'
+        f'From: {encode_header(from_address)}\n'
+    )
+
+    return boundary, headers, f'List-Unsubscribe: <{unsubscribe_link}>\n'
+
+
+def build_message(from_address, to_addresses, subject, unsubscribe_link, body):
+    """Builds a multipart/alternative email with plain text and html parts.
+
+    Arguments:
+        from_address (str): The formatted sender address.
+        to_addresses (list): The formatted recipient addresses.
+        subject (str): The email subject.
+        unsubscribe_link (str): The List-Unsubscribe URL.
+        body (dict): The "plain" and "html" email bodies.
+
+    Returns:
+        str: the serialized email.
+    """
+    boundary, headers, unsubscribe = get_header_block(from_address, unsubscribe_link)
+
+    plain = encode_part(body['plain'], 'plain')
+    html = encode_part(body['html'], 'html')
+
+    if boundary in plain or boundary in html:
+        # Extremely unlikely, but the boundary may not appear in a part
+        get_header_block.cache_clear()
+
+        return build_message(from_address, to_addresses, subject, unsubscribe_link, body)
+
+    return ''.join((
+        headers,
+        fold_addresses('To', [encode_header(address) for address in to_addresses]),
+        '\n',
+        f'Subject: {encode_header(subject)}\n',
+        unsubscribe,
+        '\n',
+        f'--{boundary}\n',
+        plain,
+        f'\n--{boundary}\n',
+        html,
+        f'\n--{boundary}--\n',
+    ))
@@ -0,0 +1,114 @@
+"""Remembers the shift codes already known to be missing across runs."""
+import json
+import logging
+import os
+import tempfile
+
+
+LOG = logging.getLogger(__name__)
+
+INDEX_FILE = 'missing_codes.json'
+
+
+class MissingCodeIndex():
+    """Tracks the missing shift codes (per role) already uploaded.
+
+    Known codes are not uploaded (or emailed to the owner) again and
+    their lookups are skipped during schedule assembly. Codes are
+    removed from the index once they are found in a user's shift codes.
+    """
+    def _index_path(self):
+        """Returns the path to the index file."""
+        return os.path.join(self.location, INDEX_FILE)
+
+    def load(self):
+        """Loads the saved index (if one is configured)."""
+        if not self.location:
+            return
+
+        try:
+            with open(self._index_path(), 'r', encoding='utf8') as index_file:
+                self.codes = {role: set(codes) for role, codes in json.load(index_file).items()}
+        except FileNotFoundError:
+            self.codes = {}
+        except (OSError, ValueError):
+            LOG.warning('Unable to read the missing shift code index')
+            self.codes = {}
+
+    def known(self, role):
+        """Returns the (upper case) codes known to be missing for a role."""
+        return {code.upper() for code in self.codes.get(role, ())}
+
+    def prune(self, role, shift_codes):
+        """Removes codes that are no longer missing.
+
+        Arguments:
+            role (str): The role of the user.
+            shift_codes (list): The user's shift codes (from the API).
+        """
+        known_codes = self.codes.get(role)
+
+        if not known_codes or not shift_codes:
+            return
+
+        present = {code['code'].upper() for code in shift_codes}
+        found = {code for code in known_codes if code.upper() in present}
+
+        if found:
+            LOG.debug('Shift codes no longer missing (role = %s): %s', role, ', '.join(sorted(found)))
+            known_codes.difference_update(found)
+            self.changed = True
+
+    def unknown(self, missing_codes):
+        """Returns the missing codes not already in the index.
+
+        Arguments:
+            missing_codes (dict): The missing codes for each role.
+
+        Returns:
+            dict: the new missing codes for each role.
+        """
+        return {
+            role: {code for code in codes if code.upper() not in self.known(role)}
+            for role, codes in missing_codes.items()
+        }
+
+    def add(self, missing_codes):
+        """Records missing codes (once they are uploaded).
+
+        Arguments:
+            missing_codes (dict): The missing codes for each role.
+        """
+        for role, codes in missing_codes.items():
+            if codes:
+                self.codes.setdefault(role, set()).update(codes)
+                self.changed = True
+
+    def save(self):
+        """Atomically saves the index (if it was changed)."""
+        if not self.location or not self.changed:
+            return
+
+        os.makedirs(self.location, mode=0o700, exist_ok=True)
+
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.location)
+
+        try:
+            with os.fdopen(file_descriptor, 'w', encoding='utf8') as index_file:
+                json.dump({role: sorted(codes) for role, codes in self.codes.items()}, index_file)
+
+            os.replace(temp_path, self._index_path())
+        except OSError:
+            LOG.warning('Unable to save the missing shift code index')
+
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+            return
+
+        self.changed = False
+
+    def __init__(self, location):
+        self.location = location
+        self.codes = {}
+        self.changed = False
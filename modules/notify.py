@@ -1,16 +1,15 @@
 """Functions used to send notifications to users and owners."""
 
 from datetime import datetime, timedelta
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from email.utils import formataddr
 import json
 import logging
-import re
-import smtplib
 
 import requests
 
+from modules import api, delivery, digest
+from modules.mime import build_message
+from modules.templates import load_template
 from modules.utils import convert_duration_to_hours_minutes
 
 
@@ -23,9 +22,8 @@ def retrieve_emails(user_id, app_config):
 
     api_url = f'{app_config["api_url"]}users/{user_id}/emails/'
 
-    emails_response = requests.get(
-        api_url,
-        headers=app_config['api_headers']
+    emails_response = api.request(
+        app_config, 'get', api_url, headers=app_config['api_headers']
     )
 
     if emails_response.status_code >= 400:
@@ -38,15 +36,47 @@ def retrieve_emails(user_id, app_config):
     return emails
 
 
+def retrieve_bulk_emails(app_config, user_ids):
+    """Retrieves the emails of multiple users in one request.
+
+    Arguments:
+        app_config (dict): The application configuration.
+        user_ids (list): The IDs of the users.
+
+    Returns:
+        dict: the emails for each user ID (or None if the API does
+            not support bulk retrieval).
+    """
+    LOG.debug('Retrieving email(s) for %s users', len(user_ids))
+
+    ids = ','.join(str(user_id) for user_id in user_ids)
+    api_url = f'{app_config["api_url"]}users/emails/?ids={ids}'
+
+    emails_response = api.request(
+        app_config, 'get', api_url, headers=app_config['api_headers']
+    )
+
+    if emails_response.status_code in (404, 405):
+        return None
+
+    if emails_response.status_code >= 400:
+        raise requests.ConnectionError(
+            f'Unable to connect to API ({api_url}) and retrieve user emails.'
+        )
+
+    emails = json.loads(emails_response.text)
+
+    return {int(user_id): user_emails for user_id, user_emails in emails.items()}
+
+
 def update_first_email_sent_flag(user_id, app_config):
     """Flags specified account as "first email sent"."""
     LOG.debug('Updating "first_email_sent" flag for user id = %s', user_id)
 
     api_url = f'{app_config["api_url"]}users/{user_id}/emails/first-sent/'
 
-    response = requests.post(
-        api_url,
-        headers=app_config['api_headers']
+    response = api.request(
+        app_config, 'post', api_url, headers=app_config['api_headers']
     )
 
     if response.status_code >= 400:
@@ -70,144 +100,71 @@ def convert_emails_to_addresses(emails, user_name):
 
 
 def send_multipart_email(app_config, to_addresses, subject, body):
-    """Constructs a MIMEMultipart email."""
+    """Constructs a multipart (plain text & html) email.
+
+    Arguments:
+        app_config (dict): The application configuration.
+        to_addresses (list): The formatted recipient addresses.
+        subject (str): The email subject.
+        body (dict): The "plain" and "html" email bodies.
+
+    Returns:
+        obj: the Future of the SMTP send (None if the email was logged
+            or queued in the outbox).
+    """
     from_name = app_config['email']['from_name']
     from_email = app_config['email']['from_email']
     from_address = formataddr((from_name, from_email))
 
-    content = MIMEMultipart('alternative')
-    content['From'] = from_address
-    content['To'] = ','.join(to_addresses)
-    content['Subject'] = subject
-    content['List-Unsubscribe'] = f'<{app_config["email"]["unsubscribe_link"]}>'
+    content = build_message(
+        from_address,
+        to_addresses,
+        subject,
+        app_config['email']['unsubscribe_link'],
+        body,
+    )
 
-    content.attach(body['plain'])
-    content.attach(body['html'])
+    outbox = delivery.get_outbox(app_config)
 
-    # Send the email
+    # Queue the email for the outbox worker or for the SMTP sender pool
+    # (which reuses the run's SMTP connections)
     if app_config['debug']['email_console']:
-        LOG.info(content.as_string())
+        LOG.info(content)
+    elif outbox is not None:
+        outbox.enqueue(from_address, to_addresses, content)
     else:
-        server = smtplib.SMTP(app_config['email']['server'])
+        return delivery.get_smtp_sender(app_config).submit(
+            from_address, to_addresses, content
+        )
 
-        server.ehlo()
-        server.starttls()
-        server.sendmail(from_address, to_addresses, content.as_string())
-        server.quit()
+    return None
 
 
 def email_welcome(user, emails, app_config):
     """Sends a welcome email to any new user."""
     LOG.debug('Processing data to send user a welcome email')
 
-    # Collects text welcome email from template file
-    text_loc = app_config['email']['welcome_text']
-
-    with open(text_loc, 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    # Collects html welcome email from template file
-    html_loc = app_config['email']['welcome_html']
-
-    with open(html_loc, 'r', encoding='utf8') as html_file:
-        html = html_file.read()
+    # Collects the welcome email templates (compiled once per run)
+    text = load_template(app_config['email']['welcome_text'], '\r\n').render({})
+    html = load_template(app_config['email']['welcome_html']).render({})
 
     # Send the email
     to_addresses = convert_emails_to_addresses(emails, user['name'])
     subject = 'Welcome to Your New Online Schedule'
     body = {
-        'plain': MIMEText(text, 'plain'),
-        'html': MIMEText(html, 'html'),
+        'plain': text,
+        'html': html,
     }
-    send_multipart_email(app_config, to_addresses, subject, body)
-
-    update_first_email_sent_flag(user['sb_user'], app_config)
-
-
-def update_additions_section(text, html, additions):
-    """Updates the email templates' addition section."""
-    # Manage added shifts
-    LOG.debug('Updating the "additions" section')
-
-    if additions:
-        # Cycle through additions and insert into templates
-        additions_text = []
-        additions_html = []
+    sent = send_multipart_email(app_config, to_addresses, subject, body)
 
-        for addition in additions:
-            additions_text.append(f' - {addition["email_message"]}')
-            additions_html.append(f'<li>{addition["email_message"]}</li>')
+    # The user is only flagged once the welcome email is sent (so a
+    # failed email is retried on the next run)
+    if sent is not None and not sent.result():
+        LOG.warning('Welcome email not sent to user id = %s', user['sb_user'])
 
-        text = text.replace('{{ additions }}', '\r\n'.join(additions_text))
-        html = html.replace('{{ additions }}', '\r\n'.join(additions_html))
+        return
 
-        # Remove the block markers
-        text = text.replace('{% block additions %}', '')
-        html = html.replace('{% block additions %}', '')
-    else:
-        # No additions, remove entire section
-        regex = r'{% block additions %}.*{% block additions %}'
-
-        text = re.sub(regex, '', text, flags=re.S)
-        html = re.sub(regex, '', html, flags=re.S)
-
-    return text, html
-
-
-def update_deletions_section(text, html, deletions):
-    """Updates the email templates' deletion section."""
-    LOG.debug('Updating the "deletions" section')
-
-    if deletions:
-        deletions_text = []
-        deletions_html = []
-
-        for deletion in deletions:
-            deletions_text.append(f' - {deletion["email_message"]}')
-            deletions_html.append(f'<li>{deletion["email_message"]}</li>')
-
-        text = text.replace('{{ deletions }}', '\r\n'.join(deletions_text))
-        html = html.replace('{{ deletions }}', '\r\n'.join(deletions_html))
-
-        # Remove the block markers
-        text = text.replace('{% block deletions %}', '')
-        html = html.replace('{% block deletions %}', '')
-    else:
-        # No deletions, remove entire section
-        regex = r'{% block deletions %}.*{% block deletions %}'
-
-        text = re.sub(regex, '', text, flags=re.S)
-        html = re.sub(regex, '', html, flags=re.S)
-
-    return text, html
-
-
-def update_changes_section(text, html, changes):
-    """Updates the email templates' changes section."""
-    LOG.debug('Updating the "changes" section')
-
-    if changes:
-        changes_text = []
-        changes_html = []
-
-        for change in changes:
-            changes_text.append(f' - {change["email_message"]}')
-            changes_html.append(f'<li>{change["email_message"]}</li>')
-
-        text = text.replace('{{ changes }}', '\r\n'.join(changes_text))
-        html = html.replace('{{ changes }}', '\r\n'.join(changes_html))
-
-        # Remove the block markers
-        text = text.replace('{% block changes %}', '')
-        html = html.replace('{% block changes %}', '')
-    else:
-        # No changes, remove entire section
-        regex = r'{% block changes %}.*{% block changes %}'
-
-        text = re.sub(regex, '', text, flags=re.S)
-        html = re.sub(regex, '', html, flags=re.S)
-
-    return text, html
+    update_first_email_sent_flag(user['sb_user'], app_config)
 
 
 def determine_end_time(start_time, duration):
@@ -222,168 +179,90 @@ def determine_end_time(start_time, duration):
     return end_time.strftime('%H:%M')
 
 
-def update_missing_section(text, html, missings, app_config):
-    """Updates the email templates' missing section."""
-    LOG.debug('Updating the "missing" section')
+def format_messages(messages, html=False):
+    """Formats messages as a plain text or html list."""
+    if html:
+        return '\r\n'.join(f'<li>{message}</li>' for message in messages)
 
-    if missings:
-        defaults = app_config['calendar_defaults']
+    return '\r\n'.join(f' - {message}' for message in messages)
 
-        weekday_start = defaults['weekday_start'].strftime('%H:%M')
-        text = text.replace('{{ weekday_start }}', weekday_start)
-        html = html.replace('{{ weekday_start }}', weekday_start)
 
-        weekday_end = determine_end_time(
-            defaults['weekday_start'], defaults['weekday_duration']
-        )
-        text = text.replace('{{ weekday_end }}', weekday_end)
-        html = html.replace('{{ weekday_end }}', weekday_end)
+def get_schedule_context(user, notification_details, app_config):
+    """Returns the update email template values.
 
-        weekend_start = defaults['weekend_start'].strftime('%H:%M')
-        text = text.replace('{{ weekend_start }}', weekend_start)
-        html = html.replace('{{ weekend_start }}', weekend_start)
+    Returns:
+        tuple: the plain values and the (unformatted) message lists
+            for each section.
+    """
+    defaults = app_config['calendar_defaults']
 
-        weekend_end = determine_end_time(
+    context = {
+        'user_name': user['name'],
+        'calendar_name': user['calendar_name'],
+        'weekday_start': defaults['weekday_start'].strftime('%H:%M'),
+        'weekday_end': determine_end_time(
+            defaults['weekday_start'], defaults['weekday_duration']
+        ),
+        'weekend_start': defaults['weekend_start'].strftime('%H:%M'),
+        'weekend_end': determine_end_time(
             defaults['weekend_start'], defaults['weekend_duration']
-        )
-        text = text.replace('{{ weekend_end }}', weekend_end)
-        html = html.replace('{{ weekend_end }}', weekend_end)
-
-        stat_start = defaults['stat_start'].strftime('%H:%M')
-        text = text.replace('{{ stat_start }}', stat_start)
-        html = html.replace('{{ stat_start }}', stat_start)
-
-        stat_end = determine_end_time(
+        ),
+        'stat_start': defaults['stat_start'].strftime('%H:%M'),
+        'stat_end': determine_end_time(
             defaults['stat_start'], defaults['stat_duration']
-        )
-        text = text.replace('{{ stat_end }}', stat_end)
-        html = html.replace('{{ stat_end }}', stat_end)
-
-        missing_text = []
-        missing_html = []
-
-        for missing in missings:
-            missing_text.append(f' - {missing["email_message"]}')
-            missing_html.append(f'<li>{missing["email_message"]}</li>')
-
-        text = text.replace('{{ missing }}', '\r\n'.join(missing_text))
-        html = html.replace('{{ missing }}', '\r\n'.join(missing_html))
-
-        # Remove the block markers
-        text = text.replace('{% block missing %}', '')
-        html = html.replace('{% block missing %}', '')
-    else:
-        # No missing shifts, remove entire section
-        regex = r'{% block missing %}.*{% block missing %}'
-
-        text = re.sub(regex, '', text, flags=re.S)
-        html = re.sub(regex, '', html, flags=re.S)
-
-    return text, html
-
-
-def update_null_section(text, html, nulls):
-    """Updates the email templates' excluded (null) section."""
-    LOG.debug('Updating the "excluded" section')
-
-    if nulls:
-        null_text = []
-        null_html = []
-
-        for null in nulls:
-            null_text.append(f' - {null["email_message"]}')
-            null_html.append(f'<li>{null["email_message"]}</li>')
-
-        text = text.replace('{{ excluded }}', '\r\n'.join(null_text))
-        html = html.replace('{{ excluded }}', '\r\n'.join(null_html))
-
-        # Remove the block markers
-        text = text.replace('{% block excluded %}', '')
-        html = html.replace('{% block excluded %}', '')
-    else:
-        # No excluded shifts, remove entire section
-        regex = r'{% block excluded %}.*{% block excluded %}'
+        ),
+    }
 
-        text = re.sub(regex, '', text, flags=re.S)
-        html = re.sub(regex, '', html, flags=re.S)
+    sections = {
+        section: [
+            detail['email_message'] for detail in notification_details[key]
+        ]
+        for section, key in (
+            ('additions', 'additions'),
+            ('deletions', 'deletions'),
+            ('changes', 'changes'),
+            ('missing', 'missing'),
+            ('excluded', 'null'),
+        )
+    }
 
-    return text, html
+    return context, sections
 
 
 def email_schedule(user, emails, app_config, notification_details):
-    """Emails user with any schedule changes"""
-    LOG.debug('User qualifies for an update email to be sent')
-
-    # Opens the update email (text) file
-    LOG.debug('Opening the email templates')
-
-    text_loc = app_config['email']['update_text']
+    """Emails user with any schedule changes
 
-    with open(text_loc, 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    # Opens the update email (html) file
-    html_loc = app_config['email']['update_html']
+    Returns:
+        obj: the Future of the SMTP send (see send_multipart_email).
+    """
+    LOG.debug('User qualifies for an update email to be sent')
 
-    with open(html_loc, 'r', encoding='utf8') as html_file:
-        html = html_file.read()
+    # Render the templates (sections without messages are removed)
+    context, sections = get_schedule_context(
+        user, notification_details, app_config
+    )
 
-    # Set the user name
-    text = text.replace('{{ user_name }}', user['name'])
-    html = html.replace('{{ user_name }}', user['name'])
+    text_context = dict(context)
+    html_context = dict(context)
 
-    # Update all the different notification sections
-    text, html = update_additions_section(
-        text, html, notification_details['additions']
-    )
-    text, html = update_deletions_section(
-        text, html, notification_details['deletions']
-    )
-    text, html = update_changes_section(
-        text, html, notification_details['changes']
-    )
-    text, html = update_missing_section(
-        text, html, notification_details['missing'], app_config
-    )
-    text, html = update_null_section(
-        text, html, notification_details['null']
-    )
+    for section, messages in sections.items():
+        text_context[section] = format_messages(messages)
+        html_context[section] = format_messages(messages, html=True)
 
-    # Add the calendar name
-    calendar_name = user['calendar_name']
-    text = text.replace('{{ calendar_name }}', calendar_name)
-    html = html.replace('{{ calendar_name }}', calendar_name)
+    # The templates are compiled once per run
+    text = load_template(app_config['email']['update_text'], '\r\n').render(text_context)
+    html = load_template(app_config['email']['update_html']).render(html_context)
 
     # Send the email
     LOG.info('Sending update email to %s', user['name'])
     to_addresses = convert_emails_to_addresses(emails, user['name'])
     subject = 'RDRHC Schedule Changes'
     body = {
-        'plain': MIMEText(text, 'plain'),
-        'html': MIMEText(html, 'html'),
+        'plain': text,
+        'html': html,
     }
-    send_multipart_email(app_config, to_addresses, subject, body)
-
-
-def update_codes_section(text, html, codes):
-    """Replaces the codes section with all the missing shift codes."""
-    LOG.debug('Formatting missing shift codes for email')
-
-    missing_codes_text = []
-    missing_codes_html = []
-
-    for code in codes:
-        missing_codes_text.append(f' - {code}')
-        missing_codes_html.append(f'<li>{code}</li>')
-
-    text = text.replace('{{ codes }}', '\r\n'.join(missing_codes_text))
-    html = html.replace('{{ codes }}', '\r\n'.join(missing_codes_html))
-
-    # Remove the block markers
-    text = text.replace('{% block codes %}', '')
-    html = html.replace('{% block codes %}', '')
 
-    return text, html
+    return send_multipart_email(app_config, to_addresses, subject, body)
 
 
 def email_missing_codes(missing_codes, app_config):
@@ -391,21 +270,15 @@ def email_missing_codes(missing_codes, app_config):
 
     LOG.debug('New missing shift codes uploaded to database - notifying owner')
 
-    # Opens the notification (text) template
-    LOG.debug('Opening the email templates')
-
-    text_loc = app_config['email']['missing_codes_text']
-
-    with open(text_loc, 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    # Opens the notification (text) template
-    html_loc = app_config['email']['missing_codes_html']
-
-    with open(html_loc, 'r', encoding='utf8') as html_file:
-        html = html_file.read()
+    # Collects the notification templates (compiled once per run)
+    LOG.debug('Formatting missing shift codes for email')
 
-    text, html = update_codes_section(text, html, missing_codes)
+    text = load_template(app_config['email']['missing_codes_text'], '\r\n').render({
+        'codes': format_messages(missing_codes),
+    })
+    html = load_template(app_config['email']['missing_codes_html']).render({
+        'codes': format_messages(missing_codes, html=True),
+    })
 
     # Send the email
     to_addresses = convert_emails_to_addresses(
@@ -414,29 +287,61 @@ def email_missing_codes(missing_codes, app_config):
     )
     subject = 'RDRHC Calendar Missing Shift Codes'
     body = {
-        'plain': MIMEText(text, 'plain'),
-        'html': MIMEText(html, 'html'),
+        'plain': text,
+        'html': html,
     }
     send_multipart_email(app_config, to_addresses, subject, body)
 
 
-def notify_user(user, app_config, schedule):
-    """Determines which emails to send to specified user."""
-    # Get the users email(s)
-    emails = retrieve_emails(user['sb_user'], app_config)
+def notify_user(user, app_config, notification, emails=None):
+    """Determines which emails to send to specified user.
+
+    Arguments:
+        user (dict): The user details.
+        app_config (dict): The application configuration.
+        notification (dict): The Schedule's notification payload.
+        emails (list): The user's email addresses (retrieved if None).
+    """
+    # Get the users email(s) (unless already retrieved)
+    if emails is None:
+        emails = retrieve_emails(user['sb_user'], app_config)
 
     # If this is the first schedule, email the welcome details
     if user['first_email_sent'] is False:
         email_welcome(user, emails, app_config)
 
+    digest_config = app_config.get('digest', {})
+    user_digest = None
+
+    # In digest mode, changes are collected until the digest is due
+    if digest_config.get('location'):
+        user_digest = digest.NotificationDigest(digest_config['location'], user['sb_user'])
+        user_digest.load()
+        user_digest.merge(notification)
+
+        # Saved before emailing so no changes are lost if it fails
+        if user_digest.since is not None:
+            user_digest.save()
+
+        if not user_digest.is_due(digest_config.get('interval', 24)):
+            return
+
+        notification = user_digest.notification_details()
+
     # Email the user the calendar details
     email_notifications = [
-        schedule.notification_details['additions'],
-        schedule.notification_details['deletions'],
-        schedule.notification_details['changes'],
-        schedule.notification_details['missing'],
-        schedule.notification_details['null'],
+        notification['additions'],
+        notification['deletions'],
+        notification['changes'],
+        notification['missing'],
+        notification['null'],
     ]
 
+    sent = None
+
     if any(email_notifications):
-        email_schedule(user, emails, app_config, schedule.notification_details)
+        sent = email_schedule(user, emails, app_config, notification)
+
+    # The digest is kept for the next run unless its email was sent
+    if user_digest is not None and (sent is None or sent.result()):
+        user_digest.clear()
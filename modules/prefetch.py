@@ -0,0 +1,228 @@
+"""Retrieves upcoming users' API data while the current user is processed."""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+import logging
+import threading
+
+import requests
+
+from modules.assemble_schedule import retrieve_old_schedule, retrieve_shift_codes
+from modules.custom_exceptions import CircuitOpenError
+from modules.notify import retrieve_bulk_emails, retrieve_emails
+
+
+LOG = logging.getLogger(__name__)
+
+# Loggers used by the retrieval functions run on the worker threads
+RETRIEVAL_LOGGERS = (
+    'modules.api',
+    'modules.assemble_schedule',
+    'modules.cache',
+    'modules.notify',
+    'modules.prefetch',
+)
+
+WORKER_STATE = threading.local()
+
+
+class WorkerLogBuffer(logging.Filter):  # pylint: disable=too-few-public-methods
+    """Holds back log records emitted on prefetch worker threads.
+
+    Records are collected into the buffer of the running task and
+    replayed once the main thread accesses that task's result, so the
+    log output stays in user order.
+    """
+    def filter(self, record):
+        records = getattr(WORKER_STATE, 'records', None)
+
+        if records is None:
+            return True
+
+        records.append(record)
+
+        return False
+
+
+WORKER_LOG_BUFFER = WorkerLogBuffer()
+
+for logger_name in RETRIEVAL_LOGGERS:
+    logging.getLogger(logger_name).addFilter(WORKER_LOG_BUFFER)
+
+
+def run_buffered(task, records):
+    """Runs the task, collecting its log records into records."""
+    WORKER_STATE.records = records
+
+    try:
+        return task()
+    finally:
+        WORKER_STATE.records = None
+
+
+def replay_records(records):
+    """Emits the buffered log records on the current thread."""
+    for record in records:
+        logger = logging.getLogger(record.name)
+
+        if logger.isEnabledFor(record.levelno):
+            logger.handle(record)
+
+
+class EmailDirectory():  # pylint: disable=too-few-public-methods
+    """Holds the email addresses of the run's users.
+
+    The addresses are retrieved in bulk, one chunk of users at a time
+    (when the first user of a chunk needs them). Users missing from
+    the bulk responses (or all users, if the API does not support bulk
+    retrieval) fall back to a request per user.
+    """
+    def _load_chunk(self, chunk):
+        """Retrieves the addresses for a chunk of users."""
+        try:
+            emails = retrieve_bulk_emails(self.app_config, self.chunk_users[chunk])
+        except (requests.RequestException, CircuitOpenError, ValueError):
+            LOG.warning('Unable to retrieve emails in bulk; retrieving them per user')
+            return
+
+        if emails is None:
+            LOG.info('API does not support bulk email retrieval; retrieving them per user')
+            self.bulk_supported = False
+            return
+
+        self.addresses.update(emails)
+
+    def emails(self, user_id):
+        """Returns the user's email addresses."""
+        chunk = self.chunks.get(user_id)
+
+        with self.lock:
+            if chunk is not None and chunk not in self.loaded and self.bulk_supported:
+                self.loaded.add(chunk)
+                self._load_chunk(chunk)
+
+            emails = self.addresses.pop(user_id, None)
+
+        if emails is None:
+            emails = retrieve_emails(user_id, self.app_config)
+
+        return emails
+
+    def __init__(self, app_config, users, chunk_size):
+        self.app_config = app_config
+        user_ids = [user['sb_user'] for user in users]
+        self.chunk_users = [
+            user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)
+        ]
+        self.chunks = {
+            user_id: index // chunk_size for index, user_id in enumerate(user_ids)
+        }
+        self.addresses = {}
+        self.loaded = set()
+        self.bulk_supported = True
+        self.lock = threading.Lock()
+
+
+class PrefetchedUserData():
+    """Holds the (possibly still pending) API data for one user.
+
+    Each accessor blocks until its data is available and re-raises any
+    error from the retrieval, so errors surface in user order. Any log
+    records from the retrieval are emitted at the same point.
+    """
+    def _result(self, key):
+        """Returns the result of the specified retrieval task."""
+        task = self.tasks[key]
+
+        if isinstance(task, Future):
+            try:
+                return task.result()
+            finally:
+                replay_records(self.records.pop(key, []))
+
+        return task()
+
+    def old_schedule(self):
+        """Returns the user's previous schedule."""
+        return self._result('old_schedule')
+
+    def shift_codes(self):
+        """Returns the user's shift codes."""
+        return self._result('shift_codes')
+
+    def emails(self):
+        """Returns the user's email addresses."""
+        return self._result('emails')
+
+    def __init__(self, app_config, user, executor=None, email_directory=None):
+        user_id = user['sb_user']
+
+        tasks = {
+            'old_schedule': partial(retrieve_old_schedule, app_config, user_id),
+            'shift_codes': partial(retrieve_shift_codes, app_config, user_id),
+            'emails': partial(retrieve_emails, user_id, app_config),
+        }
+
+        if email_directory:
+            tasks['emails'] = partial(email_directory.emails, user_id)
+
+        self.records = {}
+
+        if executor:
+            for key, task in tasks.items():
+                self.records[key] = []
+                tasks[key] = executor.submit(
+                    run_buffered, task, self.records[key]
+                )
+
+        self.tasks = tasks
+
+
+def prefetch_user_data(app_config, users):
+    """Yields each user with their API data, prefetching ahead.
+
+    The API data for the next ``prefetch_users`` users is retrieved in
+    the background while the current user is processed. Users are
+    always yielded in their original order and the retrieval logs are
+    emitted when that user's data is accessed. Email addresses are
+    retrieved in bulk (``bulk_emails`` users per request) if enabled.
+
+    Arguments:
+        app_config (dict): The application configuration.
+        users (list): The calendar users.
+
+    Yields:
+        tuple: the user and their PrefetchedUserData.
+    """
+    depth = app_config.get('pipeline', {}).get('prefetch_users', 0)
+    chunk_size = app_config.get('pipeline', {}).get('bulk_emails', 0)
+
+    email_directory = None
+
+    if chunk_size > 0:
+        email_directory = EmailDirectory(app_config, users, chunk_size)
+
+    if depth < 1:
+        for user in users:
+            yield user, PrefetchedUserData(
+                app_config, user, email_directory=email_directory
+            )
+
+        return
+
+    LOG.debug('Prefetching API data for up to %s users ahead', depth)
+
+    with ThreadPoolExecutor(max_workers=depth * 3) as executor:
+        pending = deque()
+
+        for user in users:
+            pending.append((
+                user, PrefetchedUserData(app_config, user, executor, email_directory)
+            ))
+
+            # Keep the current user plus "depth" users in flight
+            if len(pending) > depth:
+                yield pending.popleft()
+
+        while pending:
+            yield pending.popleft()
@@ -0,0 +1,118 @@
+"""Renders and saves user calendars on a background thread pool."""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+
+from modules.calendar import generate_calendar
+from modules.prefetch import WORKER_LOG_BUFFER, replay_records, run_buffered
+
+
+LOG = logging.getLogger(__name__)
+
+# Calendar logs from the workers are replayed in user order
+logging.getLogger('modules.calendar').addFilter(WORKER_LOG_BUFFER)
+
+
+class CalendarRenderer():
+    """Renders and saves calendars while the next users are processed.
+
+    Calendars are rendered on a pool of ``calendar_workers`` threads
+    (or inline if there are none), so slow writes (e.g. to a network
+    filesystem) overlap across users. Errors are collected per user
+    and, like the worker logs, reported in user order.
+    """
+    def _render(self, user, shifts):
+        """Renders one calendar.
+
+        Returns:
+            tuple: whether the calendar was written and the error
+                raised (if any).
+        """
+        try:
+            saved = generate_calendar(
+                user,
+                shifts,
+                self.app_config['calendar_save_location'],
+                self.app_config.get('calendar'),
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            return False, error
+
+        return saved, None
+
+    def _report(self, user, outcome, records):
+        """Logs the outcome of rendering a user's calendar."""
+        replay_records(records)
+
+        saved, error = outcome
+
+        if error:
+            LOG.error(
+                'Unable to generate calendar for %s (role = %s)',
+                user['schedule_name'],
+                user['role'],
+                exc_info=error,
+            )
+            self.errors.append((user, error))
+        elif saved:
+            self.saved += 1
+        else:
+            self.unchanged += 1
+
+    def _collect(self, wait=False):
+        """Reports the finished renders (in submission order)."""
+        while self.pending and (wait or self.pending[0][1].done()):
+            user, future, records = self.pending.popleft()
+            self._report(user, future.result(), records)
+
+    def submit(self, user, shifts):
+        """Queues a user's calendar to be rendered and saved.
+
+        Arguments:
+            user (dict): A dictionary of user details.
+            shifts (list): The user's shifts.
+        """
+        if self.executor is None:
+            self._report(user, self._render(user, shifts), [])
+
+            return
+
+        records = []
+        future = self.executor.submit(
+            run_buffered, partial(self._render, user, shifts), records
+        )
+        self.pending.append((user, future, records))
+
+        self._collect()
+
+    def __enter__(self):
+        if self.workers > 0:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._collect(wait=True)
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+        LOG.info(
+            'Generated calendars: %s saved, %s unchanged, %s failed',
+            self.saved,
+            self.unchanged,
+            len(self.errors),
+        )
+
+        return False
+
+    def __init__(self, app_config):
+        self.app_config = app_config
+        self.workers = app_config.get('pipeline', {}).get('calendar_workers', 0)
+        self.executor = None
+        self.pending = deque()
+        self.errors = []
+        self.saved = 0
+        self.unchanged = 0
@@ -0,0 +1,116 @@
+"""Compiles the email templates into render plans."""
+from functools import lru_cache
+import logging
+import re
+
+
+LOG = logging.getLogger(__name__)
+
+# Template markers: {{ variable }} and paired {% block name %} markers
+MARKERS = re.compile(r'{{ (?P<variable>\w+) }}|{% block (?P<block>\w+) %}')
+
+# Steps of a render plan
+TEXT = 0
+VARIABLE = 1
+BLOCK = 2
+
+
+class Template():  # pylint: disable=too-few-public-methods
+    """An email template compiled into a render plan.
+
+    The plan is a flat list of (step, value, extra) tuples:
+
+        - TEXT: the text is copied to the output.
+        - VARIABLE: replaced with the context value of that name (the
+          marker is kept if the context does not have the variable).
+        - BLOCK: the block's contents are rendered if the context value
+          of that name is truthy; otherwise rendering jumps to the step
+          after the closing marker.
+    """
+    def render(self, context):
+        """Renders the template in a single pass over the plan.
+
+        Arguments:
+            context (dict): The variable and block values.
+
+        Returns:
+            str: the rendered template.
+        """
+        output = []
+        plan = self.plan
+        index = 0
+
+        while index < len(plan):
+            step, value, extra = plan[index]
+            index += 1
+
+            if step == TEXT:
+                output.append(value)
+            elif step == VARIABLE:
+                output.append(str(context[value]) if value in context else extra)
+            elif not context.get(value):
+                index = extra
+
+        return ''.join(output)
+
+    def __init__(self, plan):
+        self.plan = plan
+
+
+def compile_template(source):
+    """Compiles the template source into a Template.
+
+    A block is opened by its first marker and closed by the next marker
+    with the same name. Unclosed blocks are always rendered.
+    """
+    plan = []
+    open_blocks = {}
+    position = 0
+
+    for match in MARKERS.finditer(source):
+        if match.start() > position:
+            plan.append((TEXT, source[position:match.start()], None))
+
+        position = match.end()
+        name = match.group('block')
+
+        if name is None:
+            plan.append((VARIABLE, match.group('variable'), match.group(0)))
+        elif name in open_blocks:
+            # Closing marker: record where to jump when the block is skipped
+            plan[open_blocks.pop(name)] = (BLOCK, name, len(plan))
+        else:
+            open_blocks[name] = len(plan)
+            plan.append((BLOCK, name, None))
+
+    if position < len(source):
+        plan.append((TEXT, source[position:], None))
+
+    for name, index in open_blocks.items():
+        LOG.warning('Template block "%s" is not closed', name)
+        plan[index] = (TEXT, '', None)
+
+    return Template(plan)
+
+
+@lru_cache(maxsize=None)
+def load_template(template_path, line_ending='\n'):
+    """Reads and compiles a template file (once per run).
+
+    Arguments:
+        template_path (str): The path to the template file.
+        line_ending (str): The line ending to use in the template
+            (e.g. "\\r\\n" for plain text emails).
+
+    Returns:
+        obj: the compiled Template.
+    """
+    LOG.debug('Compiling the email template %s', template_path)
+
+    with open(template_path, 'r', encoding='utf8') as template_file:
+        source = template_file.read()
+
+    if line_ending != '\n':
+        source = source.replace('\n', line_ending)
+
+    return compile_template(source)
@@ -4,6 +4,7 @@ import logging
 
 import requests
 
+from modules import api
 from modules.custom_exceptions import UploadError
 
 
@@ -16,7 +17,9 @@ def delete_user_schedule(app_config, user_id):
 
     api_url = f'{app_config["api_url"]}shifts/{user_id}/delete/'
 
-    response = requests.delete(api_url, headers=app_config['api_headers'])
+    response = api.request(
+        app_config, 'delete', api_url, headers=app_config['api_headers']
+    )
 
     if response.status_code >= 400:
         raise requests.ConnectionError(
@@ -42,7 +45,9 @@ def upload_user_schedule(app_config, user_id, schedule):
             'text_shift_code': shift['shift_code'],
         })
 
-    response = requests.post(
+    response = api.request(
+        app_config,
+        'post',
         api_url,
         data=json.dumps({'schedule': post_data}),
         headers=app_config['api_headers'],
@@ -76,7 +81,9 @@ def update_missing_codes_database(app_config, missing_codes):
             post_data.append({'code': code, 'role': role})
 
     if post_data:
-        response = requests.post(
+        response = api.request(
+            app_config,
+            'post',
             api_url,
             data=json.dumps({'codes': post_data}),
             headers=app_config['api_headers'],
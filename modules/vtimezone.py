@@ -0,0 +1,230 @@
+"""Generates .ics VTIMEZONE components from the pytz timezones."""
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import pytz
+from pytz.tzinfo import DstTzInfo
+
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+def format_utc_offset(offset):
+    """Formats a timedelta as an .ics UTC offset (e.g. "-0700")."""
+    seconds = int(offset.total_seconds())
+    sign = '-' if seconds < 0 else '+'
+    hours, remainder = divmod(abs(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+
+    return f'{sign}{hours:02d}{minutes:02d}{seconds:02d}' if seconds else f'{sign}{hours:02d}{minutes:02d}'
+
+
+def get_weekday_rule(day):
+    """Returns the RRULE BYDAY position of a date in its month.
+
+    e.g. 2 for the second Sunday and -1 for the last Sunday.
+    """
+    if day.day + 7 > monthrange(day.year, day.month)[1]:
+        return -1
+
+    return (day.day - 1) // 7 + 1
+
+
+def get_weekday_in_year(year, month, weekday, position):
+    """Returns the date of the nth (or last) weekday of a month."""
+    if position < 0:
+        last_day = date(year, month, monthrange(year, month)[1])
+
+        return last_day - timedelta(days=(last_day.weekday() - weekday) % 7)
+
+    first_day = date(year, month, 1)
+
+    return first_day + timedelta(days=(weekday - first_day.weekday()) % 7 + (position - 1) * 7)
+
+
+def get_transitions(tz_name, first_year, last_year):
+    """Returns the timezone's transitions between the years.
+
+    Returns:
+        list: dictionaries of each transition's UTC and local (i.e.
+            before the transition) times, offsets and name.
+    """
+    timezone = pytz.timezone(tz_name)
+
+    # Fixed offset zones (e.g. UTC) have no transitions
+    if not isinstance(timezone, DstTzInfo):
+        return []
+
+    # pytz has no public API for a zone's transitions, so they are read
+    # from its compiled tz database (generate_vtimezone checks that DST
+    # zones still yield transitions if these internals ever change)
+    utc_times = timezone._utc_transition_times  # pylint: disable=protected-access
+    transition_info = timezone._transition_info  # pylint: disable=protected-access
+    transitions = []
+
+    for index in range(1, len(utc_times)):
+        utc_time = utc_times[index]
+
+        if first_year <= utc_time.year <= last_year:
+            offset_from = transition_info[index - 1][0]
+            offset_to, dst, name = transition_info[index]
+
+            transitions.append({
+                'utc_time': utc_time,
+                'local_time': utc_time + offset_from,
+                'offset_from': offset_from,
+                'offset_to': offset_to,
+                'daylight': bool(dst),
+                'name': name,
+            })
+
+    return transitions
+
+
+def uses_daylight_saving(tz_name, first_year, last_year):
+    """Whether the timezone's UTC offset changes between the years."""
+    timezone = pytz.timezone(tz_name)
+    offsets = {
+        timezone.localize(datetime(year, month, 1)).utcoffset()
+        for year in range(first_year, last_year + 1)
+        for month in (1, 7)
+    }
+
+    return len(offsets) > 1
+
+
+def group_transitions(transitions):
+    """Groups transitions that repeat yearly by the same rule.
+
+    Returns:
+        list: lists of the transitions following each rule in
+            consecutive years.
+    """
+    runs = {}
+    groups = []
+
+    for transition in transitions:
+        local_time = transition['local_time']
+        rule = (
+            transition['daylight'],
+            transition['name'],
+            transition['offset_from'],
+            transition['offset_to'],
+            local_time.month,
+            local_time.weekday(),
+            get_weekday_rule(local_time),
+            local_time.time(),
+        )
+        run = runs.get(rule)
+
+        if run and run[-1]['local_time'].year == local_time.year - 1:
+            run.append(transition)
+        else:
+            runs[rule] = [transition]
+            groups.append(runs[rule])
+
+    return groups
+
+
+def generate_timezone_component(run, first_year, last_year):
+    """Generates a VTIMEZONE DAYLIGHT/STANDARD component.
+
+    Arguments:
+        run (list): The transitions of one yearly rule.
+        first_year (int): The first year transitions were read for.
+        last_year (int): The last year transitions were read for.
+    """
+    first = run[0]
+    last = run[-1]
+    local_time = first['local_time']
+    component = 'DAYLIGHT' if first['daylight'] else 'STANDARD'
+    recurs = len(run) > 1 or local_time.year == first_year
+
+    lines = [
+        f'BEGIN:{component}',
+        f'TZOFFSETFROM:{format_utc_offset(first["offset_from"])}',
+        f'TZOFFSETTO:{format_utc_offset(first["offset_to"])}',
+        f'TZNAME:{first["name"]}',
+    ]
+
+    if recurs:
+        position = get_weekday_rule(local_time)
+        weekday = WEEKDAYS[local_time.weekday()]
+        rule = f'RRULE:FREQ=YEARLY;BYMONTH={local_time.month};BYDAY={position}{weekday}'
+
+        # A rule already in effect is assumed to apply to earlier years
+        if local_time.year == first_year:
+            start = datetime.combine(
+                get_weekday_in_year(1970, local_time.month, local_time.weekday(), position),
+                local_time.time(),
+            )
+        else:
+            start = local_time
+
+        # A rule that stops being followed ends at its last transition
+        if last['local_time'].year < last_year:
+            rule = f'{rule};UNTIL={last["utc_time"].strftime("%Y%m%dT%H%M%SZ")}'
+
+        lines.append(f'DTSTART:{start.strftime("%Y%m%dT%H%M%S")}')
+        lines.append(rule)
+    else:
+        lines.append(f'DTSTART:{local_time.strftime("%Y%m%dT%H%M%S")}')
+
+    lines.append(f'END:{component}')
+
+    return lines
+
+
+@lru_cache(maxsize=None)
+def generate_vtimezone(tz_name, year):
+    """Generates the VTIMEZONE lines for a timezone.
+
+    The yearly rules are derived from the timezone's transitions
+    (from the previous year to a few years ahead), so rules that
+    change or end (e.g. a region stopping daylight saving time) are
+    ended with UNTIL. Zones without daylight saving time get a single
+    STANDARD component.
+
+    Arguments:
+        tz_name (str): The timezone name (e.g. "America/Edmonton").
+        year (int): The current year.
+
+    Returns:
+        tuple: the VTIMEZONE lines.
+    """
+    first_year = year - 1
+    last_year = year + 2
+    transitions = get_transitions(tz_name, first_year, last_year)
+
+    lines = [
+        'BEGIN:VTIMEZONE',
+        f'TZID:{tz_name}',
+        f'X-LIC-LOCATION:{tz_name}',
+    ]
+
+    if transitions:
+        runs = group_transitions(transitions)
+
+        # Daylight components first (then by their first transition)
+        for run in sorted(runs, key=lambda run: (not run[0]['daylight'], run[0]['utc_time'])):
+            lines.extend(generate_timezone_component(run, first_year, last_year))
+    elif uses_daylight_saving(tz_name, first_year, last_year):
+        # A single fixed offset would be wrong for part of the year
+        raise ValueError(f'Unable to determine the daylight saving time transitions of {tz_name}')
+    else:
+        now = datetime.now(pytz.timezone(tz_name))
+        offset = format_utc_offset(now.utcoffset())
+
+        lines.extend([
+            'BEGIN:STANDARD',
+            f'TZOFFSETFROM:{offset}',
+            f'TZOFFSETTO:{offset}',
+            f'TZNAME:{now.tzname()}',
+            'DTSTART:19700101T000000',
+            'END:STANDARD',
+        ])
+
+    lines.append('END:VTIMEZONE')
+
+    return tuple(lines)
@@ -0,0 +1,34 @@
+"""Serves the generated .ics calendars over HTTP.
+
+    Calendars are served from an in-memory cache with strong ETags, so
+    polling calendar clients are answered with 304 responses until
+    their calendar changes.
+"""
+
+import logging
+import logging.config
+import pathlib
+
+from modules.calendar_server import create_calendar_server
+from modules.config import assemble_app_configuration_details, LOGGING_DICT
+
+
+# Collect all the application configuration values
+APP_CONFIG = assemble_app_configuration_details(
+    str(pathlib.Path(__file__).parent.absolute())
+)
+
+# Setup Logging
+logging.config.dictConfig(LOGGING_DICT)
+LOG = logging.getLogger(__name__)
+
+SERVER = create_calendar_server(APP_CONFIG)
+
+LOG.info('Serving calendars on http://%s:%s/', *SERVER.server_address[:2])
+
+try:
+    SERVER.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    SERVER.server_close()
@@ -0,0 +1,384 @@
+"""Local stand-in for the RDRHC Calendar API (tests & benchmarks)."""
+# pylint: disable=too-many-locals, too-many-instance-attributes, too-many-arguments
+# pylint: disable=too-many-positional-arguments
+from datetime import date, datetime, timedelta
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+
+import openpyxl
+
+
+ROLES = ('a', 'p', 't')
+
+SHIFT_CODES = ('D1', 'D2', 'E1', 'N1', 'VR', 'X')
+
+STAT_HOLIDAYS = (
+    date(2018, 1, 1), date(2018, 2, 19), date(2018, 3, 30), date(2018, 5, 21),
+    date(2018, 7, 1), date(2018, 8, 6), date(2018, 9, 3), date(2018, 10, 8),
+    date(2018, 11, 11), date(2018, 12, 25),
+)
+
+# Excel layout used for the synthetic schedules (all roles)
+EXCEL_LAYOUT = {
+    'sheet': ['current'],
+    'name_row': 1,
+    'col_start': 3,
+    'col_end': 10000,
+    'row_start': 2,
+    'row_end': 400,
+    'date_col': 2,
+    'ext': 'xlsx',
+}
+
+
+def generate_users(count):
+    """Returns synthetic users spread across the roles."""
+    users = []
+
+    for user_id in range(1, count + 1):
+        users.append({
+            'id': user_id,
+            'sb_user': user_id,
+            'name': f'User {user_id}',
+            'schedule_name': f'USER {user_id}',
+            'calendar_name': f'calendar-{user_id}',
+            'role': ROLES[user_id % len(ROLES)],
+            'full_day': user_id % 4 == 0,
+            'reminder': None if user_id % 3 == 0 else 30,
+            'first_email_sent': user_id % 5 != 0,
+        })
+
+    return users
+
+
+def generate_shift_codes(user_id):
+    """Returns the shift codes (in API format) for a user.
+
+    'E1' is deliberately left out so each run has missing codes.
+    """
+    shift_codes = []
+
+    for code_id, code in enumerate(SHIFT_CODES, 1):
+        if code == 'E1':
+            continue
+
+        start = None if code in ('VR', 'X') else f'{6 + code_id:02d}:00:00'
+        duration = None if start is None else 8.25
+
+        shift_code = {'id': code_id, 'code': code, 'sb_user': user_id, 'role': 'p'}
+
+        for day in ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday', 'stat'):
+            shift_code[f'{day}_start'] = start
+            shift_code[f'{day}_duration'] = duration
+
+        shift_codes.append(shift_code)
+
+    return shift_codes
+
+
+def write_schedule_workbooks(directory, users, days=120, start_date=date(2018, 1, 1)):
+    """Writes a synthetic Excel schedule for each role.
+
+    Returns:
+        dict: the path of the workbook for each role.
+    """
+    role_names = {'a': 'assistant', 'p': 'pharmacist', 't': 'technician'}
+    paths = {}
+
+    for role in ROLES:
+        book = openpyxl.Workbook()
+        sheet = book.active
+        sheet.title = EXCEL_LAYOUT['sheet'][0]
+
+        role_users = [user for user in users if user['role'] == role]
+
+        for column, user in enumerate(role_users, EXCEL_LAYOUT['col_start']):
+            sheet.cell(row=EXCEL_LAYOUT['name_row'], column=column, value=user['schedule_name'])
+
+        for offset in range(days):
+            row = EXCEL_LAYOUT['row_start'] + offset
+            shift_date = start_date + timedelta(days=offset)
+
+            sheet.cell(
+                row=row,
+                column=EXCEL_LAYOUT['date_col'],
+                value=datetime.combine(shift_date, datetime.min.time()),
+            )
+
+            for column, user in enumerate(role_users, EXCEL_LAYOUT['col_start']):
+                code = SHIFT_CODES[(offset + user['sb_user']) % len(SHIFT_CODES)]
+                sheet.cell(row=row, column=column, value=code)
+
+        paths[role] = f'{directory}/{role_names[role]}_synthetic.xlsx'
+        book.save(paths[role])
+
+    return paths
+
+
+class StandInAPIHandler(BaseHTTPRequestHandler):
+    """Handles requests for the stand-in API."""
+    routes = (
+        ('GET', r'users/$', 'get_users'),
+        ('GET', r'users/emails/$', 'get_bulk_emails'),
+        ('GET', r'users/(\d+)/emails/$', 'get_emails'),
+        ('POST', r'users/(\d+)/emails/first-sent/$', 'post_first_sent'),
+        ('GET', r'shifts/(\d+)/$', 'get_shifts'),
+        ('DELETE', r'shifts/(\d+)/delete/$', 'delete_shifts'),
+        ('POST', r'shifts/(\d+)/upload/$', 'post_shifts'),
+        ('GET', r'shift-codes/(\d+)/$', 'get_shift_codes'),
+        ('POST', r'shift-codes/missing/upload/$', 'post_missing_codes'),
+        ('GET', r'stat-holidays/$', 'get_stat_holidays'),
+    )
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Silences the default request logging."""
+
+    def _send_json(self, data, status_code=200):
+        """Sends a JSON response (with ETag revalidation for GETs)."""
+        body = json.dumps(data).encode('utf8')
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+
+        if self.command == 'GET' and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+
+        if self.command == 'GET':
+            self.send_header('ETag', etag)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        """Returns the JSON request body (or None)."""
+        length = int(self.headers.get('Content-Length') or 0)
+
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _handle(self):
+        """Routes the request to its handler with latency/errors applied."""
+        api = self.server.stand_in
+        path, _, query = self.path.partition('?')
+        path = path[len(api.prefix):] if path.startswith(api.prefix) else path
+
+        for method, pattern, handler_name in self.routes:
+            match = re.match(pattern, path)
+
+            if method == self.command and match:
+                api.record_request(f'{method} {pattern}')
+
+                if api.latency:
+                    time.sleep(api.latency)
+
+                if api.should_fail(handler_name):
+                    self._send_json({'detail': 'Injected error'}, api.error_status)
+                    return
+
+                getattr(self, handler_name)(*match.groups(), query=query)
+                return
+
+        self._send_json({'detail': 'Not found'}, 404)
+
+    def get_users(self, query):  # pylint: disable=unused-argument
+        """Returns all the users."""
+        self._send_json(self.server.stand_in.users)
+
+    def get_emails(self, user_id, query):  # pylint: disable=unused-argument
+        """Returns the email addresses for a user."""
+        self._send_json([f'user{user_id}@example.com'])
+
+    def get_bulk_emails(self, query):
+        """Returns the email addresses for the requested users."""
+        params = dict(param.split('=', 1) for param in query.split('&') if '=' in param)
+        user_ids = params.get('ids', '').split(',')
+
+        self._send_json({
+            user_id: [f'user{user_id}@example.com'] for user_id in user_ids if user_id
+        })
+
+    def post_first_sent(self, user_id, query):  # pylint: disable=unused-argument
+        """Flags the user as having received their first email."""
+        for user in self.server.stand_in.users:
+            if user['sb_user'] == int(user_id):
+                user['first_email_sent'] = True
+
+        self._send_json({})
+
+    def get_shifts(self, user_id, query):  # pylint: disable=unused-argument
+        """Returns the shifts previously uploaded for a user."""
+        self._send_json(self.server.stand_in.shifts.get(int(user_id), []))
+
+    def delete_shifts(self, user_id, query):  # pylint: disable=unused-argument
+        """Deletes the shifts for a user."""
+        self.server.stand_in.shifts.pop(int(user_id), None)
+        self._send_json({})
+
+    def post_shifts(self, user_id, query):  # pylint: disable=unused-argument
+        """Stores the uploaded shifts for a user."""
+        self.server.stand_in.shifts[int(user_id)] = self._read_json()['schedule']
+        self._send_json({})
+
+    def get_shift_codes(self, user_id, query):  # pylint: disable=unused-argument
+        """Returns the shift codes for a user."""
+        self._send_json(generate_shift_codes(int(user_id)))
+
+    def post_missing_codes(self, query):  # pylint: disable=unused-argument
+        """Stores the missing codes and returns the new ones."""
+        api = self.server.stand_in
+        new_codes = []
+
+        for code in self._read_json()['codes']:
+            key = (code['role'], code['code'])
+
+            if key not in api.missing_codes:
+                api.missing_codes.add(key)
+                new_codes.append(code['code'])
+
+        self._send_json(new_codes)
+
+    def get_stat_holidays(self, query):
+        """Returns the stat holidays within the requested dates."""
+        params = dict(param.split('=', 1) for param in query.split('&') if '=' in param)
+        date_start = params.get('date_start', '0000')[:10]
+        date_end = params.get('date_end', '9999')[:10]
+
+        self._send_json([
+            str(holiday) for holiday in STAT_HOLIDAYS
+            if date_start <= str(holiday) <= date_end
+        ])
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handles GET requests."""
+        self._handle()
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handles POST requests."""
+        self._handle()
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        """Handles DELETE requests."""
+        self._handle()
+
+
+class StandInAPI():
+    """A local HTTP server implementing the API used by the program.
+
+    Arguments:
+        user_count (int): Number of synthetic users to serve.
+        latency (float): Seconds added to every request.
+        error_rate (float): Fraction of requests returning error_status.
+        error_status (int): Status code for injected errors.
+        failing_handlers (tuple): Handler names (e.g. "get_emails")
+            that always return error_status.
+    """
+    def should_fail(self, handler_name):
+        """Determines if an error should be injected."""
+        if handler_name in self.failing_handlers:
+            return True
+
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def record_request(self, route):
+        """Counts a request to a route."""
+        with self.lock:
+            self.request_counts[route] = self.request_counts.get(route, 0) + 1
+
+    @property
+    def url(self):
+        """The API URL (as used for the api_url config)."""
+        host, port = self.server.server_address[:2]
+
+        return f'http://{host}:{port}{self.prefix}'
+
+    def start(self):
+        """Starts serving on a background thread."""
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        """Stops the server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __init__(self, user_count=10, latency=0.0, error_rate=0.0, error_status=503, failing_handlers=(), seed=0):
+        self.prefix = '/api/'
+        self.users = generate_users(user_count)
+        self.shifts = {}
+        self.missing_codes = set()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.failing_handlers = tuple(failing_handlers)
+        self.random = random.Random(seed)
+        self.request_counts = {}
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInAPIHandler)
+        self.server.daemon_threads = True
+        self.server.stand_in = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+
+def build_app_config(api_url, directory, email_templates):
+    """Returns an application configuration for running against the stand-in."""
+    excel = dict(EXCEL_LAYOUT)
+    defaults_time = datetime.strptime('07:00', '%H:%M').time()
+
+    return {
+        'api_url': api_url,
+        'api_headers': {
+            'user-agent': 'rdrhc-calendar',
+            'Authorization': 'Token stand-in',
+            'Content-Type': 'application/json',
+        },
+        'api_retries': {'max_retries': 0},
+        'timezone': 'America/Edmonton',
+        'excel': {
+            'schedule_loc': directory, 'ext_a': 'xlsx', 'ext_p': 'xlsx', 'ext_t': 'xlsx',
+        },
+        'a_excel': excel,
+        'p_excel': excel,
+        't_excel': excel,
+        'calendar_defaults': {
+            'weekday_start': defaults_time,
+            'weekday_duration': 8,
+            'weekend_start': defaults_time,
+            'weekend_duration': 8,
+            'stat_start': defaults_time,
+            'stat_duration': 8,
+        },
+        'calendar_save_location': directory,
+        'pipeline': {'prefetch_users': 2, 'calendar_workers': 2, 'bulk_emails': 4},
+        'email': {
+            'server': 'localhost',
+            'from_name': 'RDRHC Calendar',
+            'from_email': 'calendar@example.com',
+            'owner_name': 'Owner',
+            'owner_email': 'owner@example.com',
+            'welcome_text': f'{email_templates}/welcome.txt',
+            'welcome_html': f'{email_templates}/welcome.html',
+            'update_text': f'{email_templates}/update.txt',
+            'update_html': f'{email_templates}/update.html',
+            'missing_codes_text': f'{email_templates}/missing_codes.txt',
+            'missing_codes_html': f'{email_templates}/missing_codes.html',
+            'unsubscribe_link': 'https://example.com/unsubscribe',
+        },
+        'debug': {'email_console': True},
+    }
@@ -0,0 +1,20 @@
+"""Shared pytest fixtures."""
+import pytest
+
+from modules import api, delivery
+
+
+@pytest.fixture(autouse=True)
+def reset_api_state():
+    """Resets the shared API client and SMTP state around each test."""
+    api.LIMITERS.clear()
+    api.BREAKERS.clear()
+    delivery.SENDERS.clear()
+    delivery.OUTBOXES.clear()
+
+    yield
+
+    api.LIMITERS.clear()
+    api.BREAKERS.clear()
+    delivery.SENDERS.clear()
+    delivery.OUTBOXES.clear()
@@ -0,0 +1,186 @@
+"""Local stand-in SMTP server that records messages (tests & benchmarks)."""
+# pylint: disable=too-many-instance-attributes, too-many-arguments, too-many-branches
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+import random
+import threading
+import time
+
+
+class StandInSMTPHandler(StreamRequestHandler):
+    """Handles one SMTP connection (the subset of SMTP used by smtplib)."""
+    def _reply(self, line):
+        """Sends a reply line to the client."""
+        self.wfile.write(f'{line}\r\n'.encode('utf8'))
+
+    def _read_data(self):
+        """Reads the message content (up to the terminating ".")."""
+        lines = []
+
+        for line in self.rfile:
+            line = line.rstrip(b'\r\n')
+
+            if line == b'.':
+                break
+
+            # Remove the dot-stuffing
+            lines.append(line[1:] if line.startswith(b'.') else line)
+
+        return b'\r\n'.join(lines).decode('utf8', 'replace')
+
+    def handle(self):
+        stand_in = self.server.stand_in
+        stand_in.record_connection(1)
+
+        envelope = {'from_address': None, 'to_addresses': []}
+        accepted = 0
+
+        try:
+            self._reply('220 stand-in ESMTP')
+
+            for line in self.rfile:
+                command = line.decode('utf8', 'replace').strip()
+                verb = command.split(' ', 1)[0].upper()
+
+                if verb == 'EHLO':
+                    self._reply('250-stand-in')
+                    self._reply('250 8BITMIME')
+                elif verb in ('HELO', 'NOOP'):
+                    self._reply('250 OK')
+                elif verb == 'RSET':
+                    envelope = {'from_address': None, 'to_addresses': []}
+                    self._reply('250 OK')
+                elif verb == 'MAIL':
+                    envelope['from_address'] = command.split(':', 1)[1].strip()
+                    self._reply('250 OK')
+                elif verb == 'RCPT':
+                    envelope['to_addresses'].append(command.split(':', 1)[1].strip())
+                    self._reply('250 OK')
+                elif verb == 'DATA':
+                    self._reply('354 End data with <CR><LF>.<CR><LF>')
+                    message = {**envelope, 'content': self._read_data()}
+                    envelope = {'from_address': None, 'to_addresses': []}
+
+                    if stand_in.latency:
+                        time.sleep(stand_in.latency)
+
+                    if stand_in.should_fail():
+                        stand_in.record_error()
+                        self._reply(f'{stand_in.error_code} Injected error')
+                        continue
+
+                    stand_in.record_message(message)
+                    self._reply('250 OK')
+                    accepted += 1
+
+                    # Close the connection at the per-connection limit
+                    if accepted == stand_in.messages_per_connection:
+                        self._reply('421 Too many messages; closing connection')
+                        break
+                elif verb == 'QUIT':
+                    self._reply('221 Bye')
+                    break
+                else:
+                    self._reply('502 Command not implemented')
+        finally:
+            stand_in.record_connection(-1)
+
+
+class StandInSMTP():
+    """A local SMTP server recording the messages it receives.
+
+    Arguments:
+        latency (float): Seconds added to the reply to every message.
+        error_rate (float): Fraction of messages rejected with
+            error_code.
+        error_code (int): Reply code for injected errors (e.g. 451 for
+            a temporary failure).
+        messages_per_connection (int): Messages accepted before the
+            server closes the connection with a 421 reply (0 for no
+            limit).
+    """
+    def should_fail(self):
+        """Determines if an error should be injected."""
+        with self.lock:
+            return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def record_connection(self, change):
+        """Tracks the open (and peak concurrent) connections."""
+        with self.lock:
+            self.open_connections += change
+
+            if change > 0:
+                self.connections += 1
+                self.peak_connections = max(self.peak_connections, self.open_connections)
+
+    def record_error(self):
+        """Counts an injected error."""
+        with self.lock:
+            self.errors += 1
+
+    def record_message(self, message):
+        """Stores a received message."""
+        with self.lock:
+            now = time.perf_counter()
+
+            if self.first_message is None:
+                self.first_message = now
+
+            self.last_message = now
+            self.messages.append(message)
+
+    def report(self):
+        """Returns a summary of the messages received."""
+        with self.lock:
+            elapsed = (self.last_message or 0) - (self.first_message or 0)
+
+            return {
+                'messages': len(self.messages),
+                'errors': self.errors,
+                'connections': self.connections,
+                'peak_connections': self.peak_connections,
+                'per_second': len(self.messages) / elapsed if elapsed > 0 else None,
+            }
+
+    @property
+    def address(self):
+        """The server address (as used for the email server config)."""
+        host, port = self.server.server_address[:2]
+
+        return f'{host}:{port}'
+
+    def start(self):
+        """Starts serving on a background thread."""
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        """Stops the server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __init__(self, latency=0.0, error_rate=0.0, error_code=451, messages_per_connection=0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.messages_per_connection = messages_per_connection
+        self.random = random.Random(seed)
+        self.messages = []
+        self.errors = 0
+        self.first_message = None
+        self.last_message = None
+        self.connections = 0
+        self.open_connections = 0
+        self.peak_connections = 0
+        self.lock = threading.Lock()
+
+        self.server = ThreadingTCPServer(('127.0.0.1', 0), StandInSMTPHandler)
+        self.server.daemon_threads = True
+        self.server.stand_in = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
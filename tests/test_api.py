@@ -0,0 +1,323 @@
+"""Unit tests for the api module."""
+# pylint: disable=too-few-public-methods, unused-argument
+from copy import deepcopy
+import time
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from modules import api
+from modules.custom_exceptions import CircuitOpenError
+
+from tests.utils import MockRequest200Response, APP_CONFIG
+
+
+class MockResponse():
+    """A mock response with a configurable status code."""
+    def __init__(self, status_code):
+        self.headers = {}
+        self.status_code = status_code
+        self.text = ''
+
+
+class MockResponseSequence():
+    """Returns the provided responses (or raises errors) in order."""
+    def __call__(self, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+
+        if isinstance(outcome, Exception):
+            raise outcome
+
+        return MockResponse(outcome)
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+
+class MockRetryAfter429Response():
+    """A mock of a 429 response with a Retry-After header."""
+    def __init__(self, url, headers):
+        self.url = url
+        self.headers = {'Retry-After': '120'}
+        self.status_code = 429
+        self.text = 'Too many requests'
+
+
+def test_parse_retry_after_seconds():
+    """Tests that Retry-After seconds are parsed."""
+    assert api.parse_retry_after('5') == 5.0
+
+
+def test_parse_retry_after_http_date():
+    """Tests that a past Retry-After HTTP date returns 0 seconds."""
+    assert api.parse_retry_after('Mon, 01 Jan 2018 00:00:00 GMT') == 0.0
+
+
+def test_parse_retry_after_invalid():
+    """Tests that invalid Retry-After values are ignored."""
+    assert api.parse_retry_after('soon') is None
+    assert api.parse_retry_after(None) is None
+
+
+def test_adaptive_limiter_additive_increase():
+    """Tests that healthy responses increase the limit."""
+    limiter = api.AdaptiveLimiter(initial_limit=2, max_limit=4)
+
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release(0.01, 200)
+
+    assert 2 < limiter.limit <= 4
+
+
+def test_adaptive_limiter_respects_maximum():
+    """Tests that the limit never exceeds the maximum."""
+    limiter = api.AdaptiveLimiter(initial_limit=2, max_limit=3)
+
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release(0.01, 200)
+
+    assert limiter.limit == 3
+
+
+def test_adaptive_limiter_multiplicative_decrease():
+    """Tests that throttling and errors halve the limit."""
+    limiter = api.AdaptiveLimiter(initial_limit=8)
+
+    limiter.acquire()
+    limiter.release(0.01, 503)
+
+    assert limiter.limit == 4
+    assert limiter.report()['throttled'] == 1
+
+
+def test_adaptive_limiter_single_decrease_per_window():
+    """Tests that a burst of errors only decreases the limit once."""
+    limiter = api.AdaptiveLimiter(initial_limit=8, window=10)
+
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(0.01, 500)
+
+    assert limiter.limit == 4
+    assert limiter.report()['decreases'] == 1
+
+
+def test_adaptive_limiter_rising_p95_decrease():
+    """Tests that rising latencies decrease the limit."""
+    limiter = api.AdaptiveLimiter(initial_limit=8, max_limit=8, window=10)
+
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(0.01, 200)
+
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(1.0, 200)
+
+    assert limiter.limit < 8
+    assert limiter.report()['decreases'] == 1
+
+
+def test_adaptive_limiter_keeps_window_without_decrease():
+    """Tests that latencies are kept if a decrease was skipped."""
+    limiter = api.AdaptiveLimiter(initial_limit=8, max_limit=8, window=10)
+
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(0.01, 200)
+
+    # Error decrease blocks further decreases for half a window
+    limiter.acquire()
+    limiter.release(0.01, 500)
+
+    for _ in range(2):
+        limiter.acquire()
+        limiter.release(1.0, 200)
+
+    assert limiter.report()['decreases'] == 1
+    assert len(limiter.latencies) == 10
+
+
+def test_adaptive_limiter_honours_retry_after():
+    """Tests that Retry-After blocks further requests."""
+    limiter = api.AdaptiveLimiter()
+
+    limiter.acquire()
+    limiter.release(0.01, 429, '120')
+
+    assert limiter.blocked_until > time.monotonic() + 100
+
+
+@patch('time.sleep')
+@patch('requests.get', MockRetryAfter429Response)
+def test_request_records_response(mock_sleep):
+    """Tests that request passes the response details to the limiter."""
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['api_url'] = 'https://127.0.0.2/api/'
+
+    response = api.request(custom_config, 'get', custom_config['api_url'], headers={})
+    limiter = api.get_limiter(custom_config)
+
+    assert response.status_code == 429
+    assert limiter.in_flight == 0
+    assert limiter.report()['throttled'] == 1
+    assert limiter.blocked_until > time.monotonic()
+
+    # Retry-After exceeds the maximum backoff, so no retries are made
+    mock_sleep.assert_not_called()
+
+
+@patch('requests.post', MockRequest200Response)
+def test_request_passes_arguments():
+    """Tests that request passes the arguments to requests."""
+    response = api.request(
+        APP_CONFIG, 'post', APP_CONFIG['api_url'], headers={'a': 'b'}, data='c'
+    )
+
+    assert response.url == APP_CONFIG['api_url']
+    assert response.headers == {'a': 'b'}
+    assert response.data == 'c'
+
+
+def test_get_endpoint_templates_ids():
+    """Tests that IDs and query strings are removed from endpoints."""
+    assert api.get_endpoint(APP_CONFIG, 'get', f'{APP_CONFIG["api_url"]}shifts/10/') == 'GET shifts/{id}/'
+    assert api.get_endpoint(
+        APP_CONFIG, 'get', f'{APP_CONFIG["api_url"]}stat-holidays/?date_start=2018-01-01'
+    ) == 'GET stat-holidays/'
+    assert api.get_endpoint(
+        APP_CONFIG, 'post', f'{APP_CONFIG["api_url"]}users/5/emails/first-sent/'
+    ) == 'POST users/{id}/emails/first-sent/'
+
+
+def test_get_backoff_within_ceiling():
+    """Tests that the jittered backoff stays under the ceiling."""
+    retry_config = {'backoff_base': 1, 'backoff_max': 3}
+
+    for attempt in range(5):
+        assert 0 <= api.get_backoff(attempt, retry_config) <= min(3, 2 ** attempt)
+
+
+def test_get_backoff_honours_retry_after():
+    """Tests that Retry-After sets a minimum backoff."""
+    assert api.get_backoff(0, {'backoff_base': 0.1, 'backoff_max': 10}, '5') == 5
+
+
+def test_get_backoff_retry_after_exceeds_maximum():
+    """Tests that no retry is made when Retry-After is too long."""
+    assert api.get_backoff(0, {'backoff_max': 10}, '120') is None
+
+
+def test_circuit_breaker_opens_after_threshold():
+    """Tests that consecutive failures open the breaker."""
+    breaker = api.CircuitBreaker('GET users/', threshold=2, cooldown=60)
+
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_circuit_breaker_half_open_then_close():
+    """Tests that a successful trial after the cooldown closes the breaker."""
+    breaker = api.CircuitBreaker('GET users/', threshold=1, cooldown=0)
+
+    breaker.record_failure()
+    breaker.before_request()
+
+    assert breaker.state == 'half-open'
+
+    breaker.record_success()
+
+    assert breaker.state == 'closed'
+
+
+def test_circuit_breaker_half_open_failure_reopens():
+    """Tests that a failed trial re-opens the breaker."""
+    breaker = api.CircuitBreaker('GET users/', threshold=5, cooldown=60)
+    breaker.state = 'open'
+    breaker.opened_at = time.monotonic() - 120
+
+    breaker.before_request()
+    breaker.record_failure()
+
+    assert breaker.state == 'open'
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+@patch('time.sleep')
+def test_request_retries_idempotent_requests(mock_sleep):
+    """Tests that GET requests are retried after transient errors."""
+    responses = MockResponseSequence(503, requests.ConnectionError(), 200)
+
+    with patch('requests.get', responses):
+        response = api.request(APP_CONFIG, 'get', APP_CONFIG['api_url'], headers={})
+
+    assert response.status_code == 200
+    assert responses.calls == 3
+    assert mock_sleep.call_count == 2
+
+
+@patch('time.sleep')
+def test_request_does_not_retry_processed_posts(mock_sleep):
+    """Tests that POST requests are not retried if they may have been processed."""
+    responses = MockResponseSequence(500, 200)
+
+    with patch('requests.post', responses):
+        response = api.request(APP_CONFIG, 'post', APP_CONFIG['api_url'], headers={})
+
+    assert response.status_code == 500
+    assert responses.calls == 1
+    mock_sleep.assert_not_called()
+
+
+@patch('time.sleep')
+def test_request_retries_unprocessed_posts(mock_sleep):
+    """Tests that POST requests are retried when the API did not process them."""
+    responses = MockResponseSequence(503, 200)
+
+    with patch('requests.post', responses):
+        response = api.request(APP_CONFIG, 'post', APP_CONFIG['api_url'], headers={})
+
+    assert response.status_code == 200
+    assert responses.calls == 2
+    assert mock_sleep.call_count == 1
+
+
+@patch('time.sleep')
+def test_request_fails_fast_once_breaker_opens(mock_sleep):  # pylint: disable=unused-argument
+    """Tests that a down endpoint is not contacted once the breaker opens."""
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['api_retries'] = {'max_retries': 0, 'breaker_threshold': 2}
+    responses = MockResponseSequence(500, 500, 200)
+
+    with patch('requests.get', responses):
+        api.request(custom_config, 'get', f'{APP_CONFIG["api_url"]}shifts/1/', headers={})
+        api.request(custom_config, 'get', f'{APP_CONFIG["api_url"]}shifts/2/', headers={})
+
+        with pytest.raises(CircuitOpenError):
+            api.request(custom_config, 'get', f'{APP_CONFIG["api_url"]}shifts/3/', headers={})
+
+    assert responses.calls == 2
+
+
+def test_request_unexpected_error_records_failure():
+    """Tests that unexpected errors still record a breaker failure."""
+    breaker = api.get_circuit_breaker(APP_CONFIG, 'get', APP_CONFIG['api_url'])
+    breaker.state = 'open'
+    breaker.opened_at = time.monotonic() - 120
+
+    with patch('requests.get', MockResponseSequence(ValueError())):
+        with pytest.raises(ValueError):
+            api.request(APP_CONFIG, 'get', APP_CONFIG['api_url'], headers={})
+
+    assert breaker.state == 'open'
@@ -8,6 +8,7 @@
 
 from datetime import datetime, date, time
 from decimal import Decimal
+import json
 from unittest.mock import patch
 
 from modules import assemble_schedule
@@ -467,6 +468,38 @@ def test_determine_shift_details_missing_shift():
     assert 'E1' in missing_upload
 
 
+def test_determine_shift_details_known_missing_shift():
+    """Tests that codes known to be missing are not looked up."""
+    schedule = assemble_schedule.Schedule(
+        OLD_SCHEDULE, EXTRACTED_SCHEDULE, USER, APP_CONFIG, known_missing={'E1'}
+    )
+
+    shift = {
+        'shift_code': 'e1',
+        'start_date': date(2018, 1, 2),
+        'comment': '',
+    }
+
+    # Raises if the shift code list is iterated
+    schedule._determine_shift_details(shift, None, STAT_HOLIDAYS)
+
+    assert schedule.shifts[0]['shift_code_fk'] is None
+    assert schedule.notification_details['missing_upload'] == {'e1'}
+
+
+def test_process_new_schedule_prunes_known_missing():
+    """Tests that known missing codes in the user's codes are found."""
+    schedule = assemble_schedule.Schedule(
+        OLD_SCHEDULE, EXTRACTED_SCHEDULE, USER, APP_CONFIG, USER_SHIFT_CODES, known_missing={'C1', 'E1'}
+    )
+
+    with patch.object(assemble_schedule.Schedule, '_retrieve_stat_holidays', return_value=STAT_HOLIDAYS):
+        schedule.process_new_schedule()
+
+    assert schedule.known_missing == {'E1'}
+    assert 'C1' not in schedule.notification_details['missing_upload']
+
+
 def test_determine_schedule_additions():
     """Tests identification of shift additions."""
     schedule = assemble_schedule.Schedule(
@@ -581,3 +614,23 @@ def test_clean_null_removing_shifts_properly():
 
     assert len(null) == 1
     assert null[0]['shift_code'] == 'WR'
+
+
+def test_process_new_schedule_notification_payload():
+    """Tests that the notification payload can be serialized."""
+    schedule = assemble_schedule.Schedule(
+        OLD_SCHEDULE, EXTRACTED_SCHEDULE, USER, APP_CONFIG, USER_SHIFT_CODES
+    )
+
+    with patch.object(assemble_schedule.Schedule, '_retrieve_stat_holidays', return_value=STAT_HOLIDAYS):
+        schedule.process_new_schedule()
+
+    notification = json.loads(json.dumps(schedule.notification))
+    details = schedule.notification_details
+
+    for key in ('additions', 'deletions', 'changes', 'missing', 'null'):
+        assert [entry['email_message'] for entry in notification[key]] == [
+            entry['email_message'] for entry in details[key]
+        ]
+
+    assert notification['missing_codes'] == sorted(details['missing_upload'])
@@ -0,0 +1,137 @@
+"""Unit tests for the cache module."""
+# pylint: disable=too-few-public-methods
+import json
+from datetime import datetime, time
+from decimal import Decimal
+from unittest.mock import patch
+
+from modules import cache
+
+from tests.utils import MockRequest404Response, APP_CONFIG
+
+
+API_URL = 'https://127.0.0.1/api/shift-codes/1/'
+REQUEST_HEADERS = []
+
+
+class MockETag200Response():
+    """A mock of a 200 response with an ETag validator."""
+    def __init__(self, url, headers):
+        REQUEST_HEADERS.append(headers)
+        self.url = url
+        self.headers = {'ETag': '"abc"', 'Last-Modified': 'Mon, 01 Jan 2018 00:00:00 GMT'}
+        self.status_code = 200
+        self.text = '["A1", "B1"]'
+
+
+class MockRequest304Response():
+    """A mock of a 304 (not modified) response."""
+    def __init__(self, url, headers):
+        REQUEST_HEADERS.append(headers)
+        self.url = url
+        self.headers = {}
+        self.status_code = 304
+        self.text = ''
+
+
+def count_parse(response_text):
+    """Parses JSON and records each call."""
+    count_parse.calls += 1
+
+    return json.loads(response_text)
+
+
+count_parse.calls = 0
+
+
+@patch('requests.get', MockETag200Response)
+def test_cached_get_without_cache_config():
+    """Tests that requests pass straight through without a cache."""
+    status_code, data = cache.cached_get(APP_CONFIG, API_URL, json.loads)
+
+    assert status_code == 200
+    assert data == ['A1', 'B1']
+
+
+@patch('requests.get', MockRequest404Response)
+def test_response_cache_error_response(tmp_path):
+    """Tests that error responses return no data and are not cached."""
+    response_cache = cache.ResponseCache(str(tmp_path), 3600)
+
+    status_code, data = response_cache.get(APP_CONFIG, API_URL, json.loads)
+
+    assert status_code == 404
+    assert data is None
+    assert response_cache.load(API_URL) is None
+
+
+@patch('requests.get', MockETag200Response)
+def test_response_cache_stores_validators(tmp_path):
+    """Tests that the validators and parsed data are stored."""
+    response_cache = cache.ResponseCache(str(tmp_path), 3600)
+
+    response_cache.get(APP_CONFIG, API_URL, json.loads)
+    entry = response_cache.load(API_URL)
+
+    assert entry['etag'] == '"abc"'
+    assert entry['last_modified'] == 'Mon, 01 Jan 2018 00:00:00 GMT'
+    assert entry['data'] == ['A1', 'B1']
+
+
+def test_response_cache_fresh_entry_skips_request(tmp_path):
+    """Tests that an entry within the TTL is used without a request."""
+    response_cache = cache.ResponseCache(str(tmp_path), 3600)
+
+    with patch('requests.get', MockETag200Response):
+        response_cache.get(APP_CONFIG, API_URL, json.loads)
+
+    with patch('requests.get', MockRequest404Response):
+        status_code, data = response_cache.get(APP_CONFIG, API_URL, json.loads)
+
+    assert status_code == 200
+    assert data == ['A1', 'B1']
+
+
+def test_response_cache_304_skips_parsing(tmp_path):
+    """Tests that a 304 revalidation reuses the parsed data."""
+    response_cache = cache.ResponseCache(str(tmp_path), 0)
+    count_parse.calls = 0
+
+    with patch('requests.get', MockETag200Response):
+        response_cache.get(APP_CONFIG, API_URL, count_parse)
+
+    del REQUEST_HEADERS[:]
+
+    with patch('requests.get', MockRequest304Response):
+        status_code, data = response_cache.get(APP_CONFIG, API_URL, count_parse)
+
+    assert status_code == 304
+    assert data == ['A1', 'B1']
+    assert count_parse.calls == 1
+    assert REQUEST_HEADERS[0]['If-None-Match'] == '"abc"'
+
+
+def test_response_cache_round_trips_converted_types(tmp_path):
+    """Tests that times, Decimals and datetimes survive the cache."""
+    response_cache = cache.ResponseCache(str(tmp_path), 3600)
+    data = [{
+        'start': time(7, 0),
+        'duration': Decimal('8.25'),
+        'date': datetime(2018, 1, 1),
+    }]
+
+    response_cache.save(API_URL, {
+        'url': API_URL, 'etag': None, 'last_modified': None, 'stored': 0, 'data': data,
+    })
+
+    assert response_cache.load(API_URL)['data'] == data
+
+
+def test_response_cache_malformed_entry_is_a_miss(tmp_path):
+    """Tests that a corrupt cache file is treated as a cache miss."""
+    response_cache = cache.ResponseCache(str(tmp_path), 3600)
+
+    with open(response_cache._entry_path(API_URL), 'w', encoding='utf8') as entry_file:  # pylint: disable=protected-access
+        entry_file.write('{"url": ')
+
+    assert response_cache.load(API_URL) is None
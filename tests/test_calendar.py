@@ -1,9 +1,22 @@
 """Unit tests for the calendar module."""
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import gzip
+import os
+from unittest.mock import patch
+
+import pytest
 
 from modules import calendar
 
 
+def render_event_lines(shift, user, dt_stamp, uid):
+    """Returns the (unfolded) lines of a rendered calendar event."""
+    template = calendar.get_event_template(user['full_day'], user['reminder'])
+    fields = template.generate_fields(shift, uid, calendar.new_revision(dt_stamp))
+
+    return template.render(fields).decode('utf8').replace('\n ', '').splitlines()
+
+
 def test_generate_full_day_dt_start_end():
     """Tests that proper values are generated for full day event."""
     shift = {
@@ -57,7 +70,7 @@ def test_generate_alarm_multiple_minutes():
     assert lines[3] == 'DESCRIPTION:A1 shift starting in 2 minutes'
 
 
-def test_generate_calendar_event():
+def test_render_event():
     """Tests proper event generation for calendar event."""
     shift = {
         'shift_code': 'A1',
@@ -70,20 +83,22 @@ def test_generate_calendar_event():
         'reminder': None,
     }
     dt_stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
-    index = 0
+    uid = '10-20180101-A1-0@studybuffalo.com'
 
-    lines = calendar.generate_calendar_event(shift, user, dt_stamp, index)
+    lines = render_event_lines(shift, user, dt_stamp, uid)
 
     assert lines[0] == 'BEGIN:VEVENT'
     assert lines[1] == 'DTSTART;TZID=America/Edmonton:20180101T090000'
     assert lines[2] == 'DTEND;TZID=America/Edmonton:20180101T170000'
     assert lines[3] == f'DTSTAMP:{dt_stamp}'
-    assert lines[4] == 'UID:20180101T090000@studybuffalo.com-0'
+    assert lines[4] == 'UID:10-20180101-A1-0@studybuffalo.com'
+    assert lines[5] == f'CREATED:{dt_stamp}'
+    assert lines[9] == 'SEQUENCE:0'
     assert lines[6] == 'DESCRIPTION:'
     assert lines[-1] == 'END:VEVENT'
 
 
-def test_generate_calendar_event_with_comment():
+def test_render_event_with_comment():
     """Tests proper event generation for calendar event."""
     shift = {
         'shift_code': 'A1',
@@ -96,14 +111,14 @@ def test_generate_calendar_event_with_comment():
         'reminder': None,
     }
     dt_stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
-    index = 0
+    uid = '10-20180101-A1-0@studybuffalo.com'
 
-    lines = calendar.generate_calendar_event(shift, user, dt_stamp, index)
+    lines = render_event_lines(shift, user, dt_stamp, uid)
 
     assert lines[6] == 'DESCRIPTION:TEST'
 
 
-def test_generate_full_day_calendar_event():
+def test_render_full_day_event():
     """Tests proper event generation for full day calendar event."""
     shift = {
         'shift_code': 'A1',
@@ -116,15 +131,15 @@ def test_generate_full_day_calendar_event():
         'reminder': None,
     }
     dt_stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
-    index = 0
+    uid = '10-20180101-A1-0@studybuffalo.com'
 
-    lines = calendar.generate_calendar_event(shift, user, dt_stamp, index)
+    lines = render_event_lines(shift, user, dt_stamp, uid)
 
     assert lines[1] == 'DTSTART;VALUE=DATE:20180101'
     assert lines[2] == 'DTEND;VALUE=DATE:20180102'
 
 
-def test_generate_calendar_event_with_reminder():
+def test_render_event_with_reminder():
     """Tests proper event generation for event with reminder."""
     shift = {
         'shift_code': 'A1',
@@ -137,45 +152,339 @@ def test_generate_calendar_event_with_reminder():
         'reminder': 0,
     }
     dt_stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
-    index = 0
+    uid = '10-20180101-A1-0@studybuffalo.com'
 
-    lines = calendar.generate_calendar_event(shift, user, dt_stamp, index)
+    lines = render_event_lines(shift, user, dt_stamp, uid)
 
     assert lines[14] == 'TRIGGER:-PT0M'
     assert lines[16] == 'DESCRIPTION:A1 shift starting now'
 
 
-def test_fold_calendar_lines_10_characters():
+def test_generate_event_uid_is_stable():
+    """Tests that UIDs depend on the user, date, code and ordinal only."""
+    user = {'sb_user': 10}
+    shift = {
+        'shift_code': 'A1/B',
+        'start_datetime': datetime(2018, 1, 1, 9, 0, 0),
+        'end_datetime': datetime(2018, 1, 1, 17, 0, 0),
+    }
+
+    assert calendar.generate_event_uid(user, shift, 1) == '10-20180101-A1%2FB-1@studybuffalo.com'
+
+
+def test_event_index_revisions(tmp_path):
+    """Tests that only changed events get a new revision."""
+    event_index = calendar.EventIndex(str(tmp_path), 10)
+    event_index.load()
+    new = event_index.revise('uid-1', 'hash-1', '20180101T000000Z')
+    event_index.save()
+
+    event_index = calendar.EventIndex(str(tmp_path), 10)
+    event_index.load()
+    unchanged = event_index.revise('uid-1', 'hash-1', '20180102T000000Z')
+    changed = event_index.revise('uid-1', 'hash-2', '20180102T000000Z')
+
+    assert new['sequence'] == 0
+    assert unchanged == new
+    assert changed['sequence'] == 1
+    assert changed['created'] == '20180101T000000Z'
+    assert changed['last_modified'] == '20180102T000000Z'
+
+
+def test_fold_line_10_characters():
     """Tests handling of line under 75 characters."""
-    lines = [
-        'a' * 10,
-    ]
-    folded_lines = calendar.fold_calendar_lines(lines)
+    folded_lines = list(calendar.fold_line('a' * 10))
 
     assert len(folded_lines) == 1
     assert folded_lines[0] == f'{"a" * 10}\n'
 
 
-def test_fold_calendar_lines_80_characters():
+def test_fold_line_80_characters():
     """Tests handling of line between 75 and 150 characters."""
-    lines = [
-        'a' * 80,
-    ]
-    folded_lines = calendar.fold_calendar_lines(lines)
+    folded_lines = list(calendar.fold_line('a' * 80))
 
     assert len(folded_lines) == 2
     assert folded_lines[0] == f'{"a" * 75}\n'
     assert folded_lines[1] == f' {"a" * 5}\n'
 
 
-def test_fold_calendar_lines_160_characters():
+def test_fold_line_160_characters():
     """Tests handling of line between over 150 characters."""
-    lines = [
-        'a' * 160,
-    ]
-    folded_lines = calendar.fold_calendar_lines(lines)
+    folded_lines = list(calendar.fold_line('a' * 160))
 
     assert len(folded_lines) == 3
     assert folded_lines[0] == f'{"a" * 75}\n'
     assert folded_lines[1] == f' {"a" * 74}\n'
     assert folded_lines[2] == f' {"a" * 11}\n'
+
+
+def test_fold_line_exact_multiple():
+    """Tests that folding leaves no empty trailing segment."""
+    segments = list(calendar.fold_line('a' * 149))
+
+    assert segments == [f'{"a" * 75}\n', f' {"a" * 74}\n']
+
+
+def test_generate_calendar_folds_long_lines(tmp_path):
+    """Tests that the calendar lines are folded to 75 octets."""
+    user = {
+        'sb_user': 10,
+        'name': 'Test User',
+        'calendar_name': 'SecretCalendar',
+        'full_day': False,
+        'reminder': 30,
+    }
+    schedule = [
+        {
+            'shift_code': 'A1',
+            'start_datetime': datetime(2018, 1, day, 9, 0, 0),
+            'end_datetime': datetime(2018, 1, day, 17, 0, 0),
+            'comment': 'A long comment ' * 10,
+        }
+        for day in range(1, 29)
+    ]
+
+    with patch('modules.calendar.datetime') as mock_datetime:
+        mock_datetime.utcnow.return_value = datetime(2018, 1, 1)
+        calendar.generate_calendar(user, schedule, str(tmp_path))
+
+    with open(tmp_path / 'SecretCalendar.ics', 'rb') as ics:
+        content = ics.read()
+
+    assert all(len(line) <= 75 for line in content.split(b'\n'))
+
+    lines = content.decode('utf8').replace('\n ', '').splitlines()
+
+    assert lines.count('BEGIN:VEVENT') == 28
+    assert f'DESCRIPTION:{"A long comment " * 10}' in lines
+    assert lines[-1] == 'END:VCALENDAR'
+
+
+def _generate_at(user, schedule, location, utc_now, calendar_config=None):
+    """Generates the calendar with a fixed generation time."""
+    with patch('modules.calendar.datetime') as mock_datetime:
+        mock_datetime.utcnow.return_value = utc_now
+
+        return calendar.generate_calendar(user, schedule, location, calendar_config)
+
+
+def test_save_calendar_skips_unchanged_calendar(tmp_path):
+    """Tests that only the DTSTAMP changing does not rewrite the file."""
+    user = {'sb_user': 10, 'name': 'Test User', 'calendar_name': 'SecretCalendar', 'full_day': True, 'reminder': None}
+    schedule = [{
+        'shift_code': 'A1',
+        'start_datetime': datetime(2018, 1, 1, 9, 0, 0),
+        'end_datetime': datetime(2018, 1, 1, 17, 0, 0),
+        'comment': '',
+    }]
+
+    assert _generate_at(user, schedule, str(tmp_path), datetime(2018, 1, 1)) is True
+    first_contents = (tmp_path / 'SecretCalendar.ics').read_text(encoding='utf8')
+
+    assert _generate_at(user, schedule, str(tmp_path), datetime(2018, 1, 2)) is False
+    assert (tmp_path / 'SecretCalendar.ics').read_text(encoding='utf8') == first_contents
+
+    schedule[0]['shift_code'] = 'B1'
+
+    assert _generate_at(user, schedule, str(tmp_path), datetime(2018, 1, 3)) is True
+    assert 'B1' in (tmp_path / 'SecretCalendar.ics').read_text(encoding='utf8')
+    assert [path.name for path in tmp_path.iterdir()] == ['SecretCalendar.ics']
+
+
+def test_save_calendar_failure_keeps_existing_file(tmp_path):
+    """Tests that a failed write leaves the existing calendar intact."""
+    (tmp_path / 'SecretCalendar.ics').write_text('BEGIN:VCALENDAR\n', encoding='utf8')
+
+    def failing_lines():
+        yield b'BEGIN:VCALENDAR\n'
+        raise ValueError('Mock error')
+
+    with pytest.raises(ValueError):
+        calendar.save_calendar(failing_lines(), 'SecretCalendar', str(tmp_path))
+
+    assert (tmp_path / 'SecretCalendar.ics').read_text(encoding='utf8') == 'BEGIN:VCALENDAR\n'
+    assert [path.name for path in tmp_path.iterdir()] == ['SecretCalendar.ics']
+
+
+def test_generate_calendar_only_revises_changed_events(tmp_path):
+    """Tests that inserting a shift leaves the other events untouched."""
+    save_location = tmp_path / 'calendars'
+    save_location.mkdir()
+    calendar_config = {'state_location': str(tmp_path / 'state')}
+    user = {'sb_user': 10, 'name': 'Test User', 'calendar_name': 'SecretCalendar', 'full_day': True, 'reminder': None}
+    schedule = [
+        {
+            'shift_code': 'A1',
+            'start_datetime': datetime(2018, 1, day, 9, 0, 0),
+            'end_datetime': datetime(2018, 1, day, 17, 0, 0),
+            'comment': '',
+        }
+        for day in (1, 3)
+    ]
+
+    _generate_at(user, schedule, str(save_location), datetime(2018, 1, 1), calendar_config)
+
+    schedule[1]['comment'] = 'Changed'
+    schedule.insert(1, {
+        'shift_code': 'B1',
+        'start_datetime': datetime(2018, 1, 2, 9, 0, 0),
+        'end_datetime': datetime(2018, 1, 2, 17, 0, 0),
+        'comment': '',
+    })
+
+    assert _generate_at(user, schedule, str(save_location), datetime(2018, 1, 2), calendar_config)
+
+    events = (save_location / 'SecretCalendar.ics').read_text(encoding='utf8').split('BEGIN:VEVENT\n')[1:]
+
+    assert 'UID:10-20180101-A1-0@studybuffalo.com' in events[0]
+    assert 'LAST-MODIFIED:20180101T000000Z' in events[0]
+    assert 'SEQUENCE:0' in events[0]
+    assert 'UID:10-20180102-B1-0@studybuffalo.com' in events[1]
+    assert 'CREATED:20180102T000000Z' in events[1]
+    assert 'UID:10-20180103-A1-0@studybuffalo.com' in events[2]
+    assert 'CREATED:20180101T000000Z' in events[2]
+    assert 'LAST-MODIFIED:20180102T000000Z' in events[2]
+    assert 'SEQUENCE:1' in events[2]
+
+
+def test_fold_line_multibyte_characters():
+    """Tests that folding counts octets and keeps characters whole."""
+    line = f'DESCRIPTION:{"é" * 40}'
+
+    folded_lines = list(calendar.fold_line(line))
+
+    assert ''.join(folded_lines) == f'DESCRIPTION:{"é" * 31}\n {"é" * 9}\n'
+
+    for folded_line in folded_lines:
+        assert len(folded_line.rstrip('\n').encode('utf8')) <= 75
+
+
+def test_fold_octets_never_splits_characters():
+    """Tests that a character straddling the limit moves to the next segment."""
+    folded = calendar.fold_octets(f'{"a" * 74}€{"b" * 10}'.encode('utf8'))
+
+    assert folded == f'{"a" * 74}\n €{"b" * 10}\n'.encode('utf8')
+
+
+def test_escape_text():
+    """Tests that TEXT special characters are escaped."""
+    assert calendar.escape_text('a,b;c\\d\r\ne\nf') == 'a\\,b\\;c\\\\d\\ne\\nf'
+
+
+def test_render_event_escapes_comment():
+    """Tests that the event description is escaped."""
+    shift = {
+        'shift_code': 'A1',
+        'start_datetime': datetime(2018, 1, 1, 9, 0, 0),
+        'end_datetime': datetime(2018, 1, 1, 17, 0, 0),
+        'comment': 'Swap with B; see notes,\nthanks',
+    }
+    user = {'full_day': False, 'reminder': None}
+
+    lines = render_event_lines(shift, user, '20180101T000000Z', 'uid')
+
+    assert lines[6] == 'DESCRIPTION:Swap with B\\; see notes\\,\\nthanks'
+
+
+def test_save_compressed_calendars_only_when_changed(tmp_path):
+    """Tests that compressed copies are regenerated only with new content."""
+    file_path = tmp_path / 'SecretCalendar.ics'
+    file_path.write_bytes(b'BEGIN:VCALENDAR\nEND:VCALENDAR\n')
+    os.utime(file_path, (1000, 1000))
+
+    calendar.save_compressed_calendars(str(file_path), ('gzip',))
+    compressed_path = tmp_path / 'SecretCalendar.ics.gz'
+
+    assert gzip.decompress(compressed_path.read_bytes()) == b'BEGIN:VCALENDAR\nEND:VCALENDAR\n'
+
+    # An up to date copy is left alone
+    os.utime(compressed_path, (2000, 2000))
+    calendar.save_compressed_calendars(str(file_path), ('gzip',))
+
+    assert os.path.getmtime(compressed_path) == 2000
+
+    # A changed calendar regenerates the copy
+    file_path.write_bytes(b'BEGIN:VCALENDAR\n')
+    os.utime(file_path, (3000, 3000))
+    calendar.save_compressed_calendars(str(file_path), ('gzip',))
+
+    assert gzip.decompress(compressed_path.read_bytes()) == b'BEGIN:VCALENDAR\n'
+
+
+def test_compress_gzip_is_deterministic():
+    """Tests that identical content compresses identically."""
+    assert calendar.compress_gzip(b'BEGIN:VCALENDAR\n') == calendar.compress_gzip(b'BEGIN:VCALENDAR\n')
+
+
+def test_get_compressors_skips_unavailable_zstd():
+    """Tests that zstd is skipped if zstandard is not installed."""
+    calendar.get_compressors.cache_clear()
+
+    with patch('modules.calendar.zstandard', None):
+        assert not calendar.get_compressors(('zstd',))
+
+    calendar.get_compressors.cache_clear()
+
+
+def test_get_window_start():
+    """Tests that the window starts at the start of the oldest month."""
+    assert calendar.get_window_start(3, date(2018, 2, 15)) == datetime(2017, 11, 1)
+    assert calendar.get_window_start(0, date(2018, 2, 15)) == datetime(2018, 2, 1)
+
+
+def test_split_schedule_without_window():
+    """Tests that every shift is kept without a window."""
+    schedule = [{'start_datetime': datetime(2000, 1, 1)}]
+
+    assert calendar.split_schedule(schedule, 0) == (schedule, [])
+
+
+def test_generate_calendar_archives_old_shifts(tmp_path):
+    """Tests that shifts before the window move to the archive calendar."""
+    save_location = tmp_path / 'calendars'
+    save_location.mkdir()
+    calendar_config = {'state_location': str(tmp_path / 'state'), 'window_months': 2}
+    user = {'sb_user': 10, 'name': 'Test User', 'calendar_name': 'SecretCalendar', 'full_day': True, 'reminder': None}
+    today = datetime.now()
+    schedule = [
+        {
+            'shift_code': code,
+            'start_datetime': start,
+            'end_datetime': start + timedelta(hours=8),
+            'comment': '',
+        }
+        for code, start in (('A1', today - timedelta(days=400)), ('B1', today + timedelta(days=1)))
+    ]
+
+    calendar.generate_calendar(user, schedule, str(save_location), calendar_config)
+
+    current = (save_location / 'SecretCalendar.ics').read_text(encoding='utf8')
+    archive_path = save_location / 'SecretCalendar-archive.ics'
+    archive = archive_path.read_text(encoding='utf8')
+
+    assert 'SUMMARY:B1 Shift' in current
+    assert 'SUMMARY:A1 Shift' not in current
+    assert 'SUMMARY:A1 Shift' in archive
+    assert 'X-WR-CALNAME:Work Schedule Archive' in archive
+
+    # An unchanged archive is not rendered again
+    os.utime(archive_path, (1000, 1000))
+
+    with patch('modules.calendar.write_calendar', wraps=calendar.write_calendar) as mock_write:
+        calendar.generate_calendar(user, schedule, str(save_location), calendar_config)
+
+    assert mock_write.call_count == 1
+    assert os.path.getmtime(archive_path) == 1000
+
+
+def test_generate_dt_start_end_timezone():
+    """Tests that the configured timezone is used for the TZID."""
+    shift = {
+        'start_datetime': datetime(2018, 1, 1, 9, 0, 0),
+        'end_datetime': datetime(2018, 1, 1, 17, 0, 0),
+    }
+
+    event = calendar.generate_dt_start_end(shift, 'Europe/Berlin')
+
+    assert event['dt_start'] == 'DTSTART;TZID=Europe/Berlin:20180101T090000'
+    assert event['dt_end'] == 'DTEND;TZID=Europe/Berlin:20180101T170000'
@@ -0,0 +1,123 @@
+"""Unit tests for the calendar_server module."""
+import http.client
+import os
+import threading
+
+import pytest
+
+from modules import calendar_server
+
+
+@pytest.fixture(name='server')
+def fixture_server(tmp_path):
+    """Runs a calendar server (on a free port) for the test."""
+    (tmp_path / 'SecretCalendar.ics').write_bytes(b'BEGIN:VCALENDAR\nEND:VCALENDAR\n')
+
+    server = calendar_server.create_calendar_server({
+        'calendar_save_location': str(tmp_path),
+        'calendar_server': {'host': '127.0.0.1', 'port': 0, 'cache_size': 2},
+    })
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def _get(server, path, headers=None):
+    """Sends a GET request to the server."""
+    connection = http.client.HTTPConnection(*server.server_address[:2])
+    connection.request('GET', path, headers=headers or {})
+    response = connection.getresponse()
+    body = response.read()
+    connection.close()
+
+    return response, body
+
+
+def test_serves_calendar_with_etag(server):
+    """Tests that calendars are served with a strong ETag."""
+    response, body = _get(server, '/SecretCalendar.ics')
+
+    assert response.status == 200
+    assert body == b'BEGIN:VCALENDAR\nEND:VCALENDAR\n'
+    assert response.getheader('Content-Type') == 'text/calendar; charset=utf-8'
+    assert response.getheader('ETag').startswith('"')
+
+
+def test_matching_etag_returns_304(server):
+    """Tests that a matching If-None-Match returns 304 without a body."""
+    response, _ = _get(server, '/SecretCalendar.ics')
+    etag = response.getheader('ETag')
+
+    response, body = _get(server, '/SecretCalendar.ics', {'If-None-Match': etag})
+
+    assert response.status == 304
+    assert body == b''
+    assert server.calendar_cache.hits == 1
+
+
+def test_unknown_and_invalid_paths_return_404(server):
+    """Tests that only existing calendar files are served."""
+    assert _get(server, '/OtherCalendar.ics')[0].status == 404
+    assert _get(server, '/../SecretCalendar.ics')[0].status == 404
+    assert _get(server, '/SecretCalendar.txt')[0].status == 404
+
+
+def test_changed_calendar_is_revalidated(server, tmp_path):
+    """Tests that a changed file is served with a new ETag."""
+    response, _ = _get(server, '/SecretCalendar.ics')
+    etag = response.getheader('ETag')
+
+    (tmp_path / 'SecretCalendar.ics').write_bytes(b'BEGIN:VCALENDAR\n')
+    os.utime(tmp_path / 'SecretCalendar.ics', (1000, 1000))
+
+    response, body = _get(server, '/SecretCalendar.ics', {'If-None-Match': etag})
+
+    assert response.status == 200
+    assert body == b'BEGIN:VCALENDAR\n'
+    assert response.getheader('ETag') != etag
+
+
+def test_calendar_cache_evicts_least_recently_used(tmp_path):
+    """Tests that the cache holds at most max_entries calendars."""
+    for name in ('A', 'B', 'C'):
+        (tmp_path / f'{name}.ics').write_bytes(name.encode('utf8'))
+
+    cache = calendar_server.CalendarCache(str(tmp_path), max_entries=2)
+
+    cache.get('A')
+    cache.get('B')
+    cache.get('A')
+    cache.get('C')
+
+    assert list(cache.entries) == ['A', 'C']
+
+
+def test_etag_matches():
+    """Tests If-None-Match parsing."""
+    assert calendar_server.etag_matches('"a", "b"', '"b"')
+    assert calendar_server.etag_matches('W/"b"', '"b"')
+    assert calendar_server.etag_matches('*', '"b"')
+    assert not calendar_server.etag_matches('"a"', '"b"')
+    assert not calendar_server.etag_matches(None, '"b"')
+
+
+def test_calendar_cache_detects_replaced_file(tmp_path):
+    """Tests that a replaced file is reloaded even with the same mtime and size."""
+    file_path = tmp_path / 'A.ics'
+    file_path.write_bytes(b'A')
+    os.utime(file_path, (1000, 1000))
+
+    cache = calendar_server.CalendarCache(str(tmp_path))
+    assert cache.get('A')['content'] == b'A'
+
+    new_path = tmp_path / 'new.ics'
+    new_path.write_bytes(b'B')
+    os.utime(new_path, (1000, 1000))
+    os.replace(new_path, file_path)
+
+    assert cache.get('A')['content'] == b'B'
@@ -0,0 +1,338 @@
+"""Unit tests for the delivery module."""
+# pylint: disable=too-few-public-methods, unused-argument
+from copy import deepcopy
+import os
+import smtplib
+import time
+from unittest.mock import patch
+
+from modules import delivery, notify
+
+from tests.smtp_server import StandInSMTP
+from tests.utils import APP_CONFIG
+
+
+class MockSessionSMTP():
+    """A mock SMTP connection recording its use across emails."""
+    # pylint: disable=missing-docstring
+    instances = []
+    failures = []
+
+    def ehlo(self):
+        return True
+
+    def starttls(self):
+        return True
+
+    def sendmail(self, from_address, to_addresses, content):
+        if MockSessionSMTP.failures:
+            raise MockSessionSMTP.failures.pop(0)
+
+        self.messages.append(content)
+
+        return {}
+
+    def quit(self):
+        self.closed = True
+
+        return True
+
+    def __init__(self, server):
+        self.server = server
+        self.messages = []
+        self.closed = False
+        MockSessionSMTP.instances.append(self)
+
+
+def _send_session_emails(count, max_messages=100, failures=()):
+    """Sends emails through the shared SMTP session."""
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['debug']['email_console'] = False
+    custom_config['email']['max_messages_per_connection'] = max_messages
+    custom_config['email']['smtp_connections'] = 1
+    body = {
+        'plain': 'Test plain text email.',
+        'html': '<p>Test html email.</p>',
+    }
+
+    MockSessionSMTP.instances = []
+    MockSessionSMTP.failures = list(failures)
+
+    with patch('smtplib.SMTP', MockSessionSMTP):
+        for _ in range(count):
+            notify.send_multipart_email(
+                custom_config, ['test1@email.com'], 'Email Test', body
+            )
+
+        delivery.close_smtp_sessions()
+
+    return MockSessionSMTP.instances
+
+
+def test_smtp_session_reuses_connection():
+    """Tests that one connection is used for all emails in a run."""
+    connections = _send_session_emails(5)
+
+    assert len(connections) == 1
+    assert len(connections[0].messages) == 5
+    assert connections[0].closed
+    assert not delivery.SENDERS
+
+
+def test_smtp_session_message_limit():
+    """Tests that the connection is re-opened after the message limit."""
+    connections = _send_session_emails(5, max_messages=2)
+
+    assert [len(connection.messages) for connection in connections] == [2, 2, 1]
+    assert all(connection.closed for connection in connections)
+
+
+def test_smtp_session_reconnects_after_disconnect():
+    """Tests that a dropped connection is re-opened and the email resent."""
+    connections = _send_session_emails(
+        2, failures=[smtplib.SMTPServerDisconnected('Mock disconnect')]
+    )
+
+    assert len(connections) == 2
+    assert len(connections[1].messages) == 2
+
+
+def test_smtp_session_reconnects_after_421():
+    """Tests that a 421 (closing connection) reply re-opens the connection."""
+    connections = _send_session_emails(
+        1, failures=[smtplib.SMTPSenderRefused(421, b'Too many messages', 'app@email.com')]
+    )
+
+    assert len(connections) == 2
+    assert len(connections[1].messages) == 1
+
+
+def test_smtp_session_raises_other_errors():
+    """Tests that other SMTP errors are not retried."""
+    session = delivery.SMTPSession('https://127.0.0.1/')
+    MockSessionSMTP.instances = []
+    MockSessionSMTP.failures = [smtplib.SMTPRecipientsRefused({'test1@email.com': (550, b'No')})]
+
+    with patch('smtplib.SMTP', MockSessionSMTP):
+        try:
+            session.send('app@email.com', ['test1@email.com'], 'Content')
+        except smtplib.SMTPRecipientsRefused:
+            assert len(MockSessionSMTP.instances) == 1
+        else:
+            assert False
+
+
+def test_smtp_sender_pool_isolates_failures(caplog):
+    """Tests that a failed email is logged without affecting the others."""
+    connections = _send_session_emails(
+        3, failures=[smtplib.SMTPRecipientsRefused({'test1@email.com': (550, b'No')})]
+    )
+
+    assert sum(len(connection.messages) for connection in connections) == 2
+    assert 'Unable to send email to test1@email.com' in caplog.text
+
+
+def test_smtp_sender_pool_against_stand_in():
+    """Tests concurrent delivery over a bounded number of connections."""
+    with StandInSMTP() as stand_in:
+        sender = delivery.SMTPSenderPool(stand_in.address, connections=3, starttls=False)
+
+        for index in range(30):
+            sender.submit('app@email.com', [f'test{index}@email.com'], f'Subject: {index}\r\n\r\nBody')
+
+        sender.close()
+
+        assert len(stand_in.messages) == 30
+        assert stand_in.connections <= 3
+        assert not sender.sessions
+        assert sender.report()['sent'] == 30
+        assert {message['to_addresses'][0] for message in stand_in.messages} == {
+            f'<test{index}@email.com>' for index in range(30)
+        }
+
+
+class MockOutboxSMTP():
+    """Records sent emails and raises the queued failures."""
+    def __call__(self, from_address, to_addresses, content):
+        if self.failures:
+            raise self.failures.pop(0)
+
+        self.sent.append((from_address, to_addresses, content))
+
+    def __init__(self, *failures):
+        self.failures = list(failures)
+        self.sent = []
+
+
+def test_outbox_enqueue_and_deliver(tmp_path):
+    """Tests that queued emails are delivered in order and removed."""
+    outbox = delivery.Outbox(str(tmp_path))
+    send = MockOutboxSMTP()
+
+    outbox.enqueue('app@email.com', ['test1@email.com'], 'First')
+    outbox.enqueue('app@email.com', ['test2@email.com'], 'Second')
+
+    assert outbox.new_message.is_set()
+    assert len(outbox.pending()) == 2
+    assert outbox.deliver(send) == 2
+    assert [content for _, _, content in send.sent] == ['First', 'Second']
+    assert not outbox.pending()
+    assert not os.listdir(tmp_path / delivery.SENDING)
+
+
+def test_outbox_retries_failed_delivery(tmp_path):
+    """Tests that failed emails are re-queued with a backoff."""
+    outbox = delivery.Outbox(str(tmp_path), retry_delay=0)
+    send = MockOutboxSMTP(smtplib.SMTPServerDisconnected('Mock disconnect'))
+
+    outbox.enqueue('app@email.com', ['test1@email.com'], 'Content')
+
+    assert outbox.deliver(send) == 0
+    assert len(outbox.pending()) == 1
+    assert outbox.deliver(send) == 1
+
+
+def test_outbox_waits_for_retry_delay(tmp_path):
+    """Tests that re-queued emails are not sent before they are due."""
+    outbox = delivery.Outbox(str(tmp_path), retry_delay=60)
+    send = MockOutboxSMTP(OSError('Mock error'))
+
+    outbox.enqueue('app@email.com', ['test1@email.com'], 'Content')
+    outbox.deliver(send)
+
+    assert outbox.deliver(send) == 0
+    assert len(outbox.pending()) == 1
+
+
+def test_outbox_moves_undeliverable_to_failed(tmp_path):
+    """Tests that emails are moved to failed after the maximum attempts."""
+    outbox = delivery.Outbox(str(tmp_path), max_attempts=2, retry_delay=0)
+    send = MockOutboxSMTP(OSError('Mock error'), OSError('Mock error'))
+
+    name = outbox.enqueue('app@email.com', ['test1@email.com'], 'Content')
+    outbox.deliver(send)
+    outbox.deliver(send)
+
+    assert not outbox.pending()
+    assert os.listdir(tmp_path / delivery.FAILED) == [name]
+
+
+def test_outbox_recovers_abandoned_claims(tmp_path):
+    """Tests that emails claimed by a crashed worker are re-queued."""
+    outbox = delivery.Outbox(str(tmp_path))
+    name = outbox.enqueue('app@email.com', ['test1@email.com'], 'Content')
+    os.replace(tmp_path / delivery.PENDING / name, tmp_path / delivery.SENDING / name)
+
+    outbox.recover(max_age=60)
+    assert not outbox.pending()
+
+    outbox.recover(max_age=-1)
+    assert outbox.pending() == [name]
+
+
+def test_outbox_recover_keeps_fresh_claims(tmp_path):
+    """Tests that an old email is not re-queued while it is being sent."""
+    outbox = delivery.Outbox(str(tmp_path))
+    name = outbox.enqueue('app@email.com', ['test1@email.com'], 'Content')
+
+    # Queued well before the claim (e.g. a backlog or a retry)
+    queued = time.time() - 700
+    os.utime(tmp_path / delivery.PENDING / name, (queued, queued))
+
+    recovered = []
+
+    def send(from_address, to_addresses, content):  # pylint: disable=unused-argument
+        # Another process checks for abandoned claims during the send
+        outbox.recover()
+        recovered.extend(outbox.pending())
+
+    assert outbox.deliver(send) == 1
+    assert not recovered
+    assert not outbox.pending()
+    assert not os.listdir(tmp_path / delivery.SENDING)
+
+
+def test_outbox_delivery_tolerates_recovered_claim(tmp_path):
+    """Tests that delivery continues if the claim was re-queued."""
+    outbox = delivery.Outbox(str(tmp_path))
+    outbox.enqueue('app@email.com', ['test1@email.com'], 'Content')
+
+    def send(from_address, to_addresses, content):  # pylint: disable=unused-argument
+        outbox.recover(max_age=-1)
+
+    assert outbox.deliver(send) == 1
+
+
+@patch('smtplib.SMTP', MockSessionSMTP)
+def test_send_multipart_email_outbox(tmp_path):
+    """Tests that emails are queued and delivered by the outbox worker."""
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['debug']['email_console'] = False
+    custom_config['outbox'] = {'location': str(tmp_path), 'poll_interval': 60}
+    body = {
+        'plain': 'Test plain text email.',
+        'html': '<p>Test html email.</p>',
+    }
+    MockSessionSMTP.instances = []
+    MockSessionSMTP.failures = []
+
+    with delivery.OutboxWorker(custom_config) as worker:
+        notify.send_multipart_email(
+            custom_config, ['test1@email.com'], 'Email Test', body
+        )
+
+    assert worker.delivered == 1
+    assert len(MockSessionSMTP.instances[0].messages) == 1
+    assert not delivery.get_outbox(custom_config).pending()
+
+
+def test_smtp_sender_pool_reconnects_at_server_limit():
+    """Tests that the server closing connections does not lose emails."""
+    with StandInSMTP(messages_per_connection=4) as stand_in:
+        sender = delivery.SMTPSenderPool(stand_in.address, connections=2, starttls=False)
+
+        for index in range(20):
+            sender.submit('app@email.com', [f'test{index}@email.com'], 'Subject: Test\r\n\r\nBody')
+
+        sender.close()
+
+        assert stand_in.report()['messages'] == 20
+        assert stand_in.connections >= 5
+        assert sender.report()['failed'] == 0
+
+
+def test_smtp_sender_pool_counts_injected_errors():
+    """Tests that rejected emails are counted without stopping the others."""
+    with StandInSMTP(error_rate=0.3, error_code=554) as stand_in:
+        sender = delivery.SMTPSenderPool(stand_in.address, connections=2, starttls=False)
+
+        for index in range(20):
+            sender.submit('app@email.com', [f'test{index}@email.com'], 'Subject: Test\r\n\r\nBody')
+
+        sender.close()
+        report = stand_in.report()
+
+        assert report['errors'] > 0
+        assert report['messages'] + report['errors'] == 20
+        assert sender.report()['sent'] == report['messages']
+        assert sender.report()['failed'] == report['errors']
+
+
+def test_outbox_worker_delivers_every_email_on_exit(tmp_path):
+    """Tests that emails queued while the worker is busy are delivered."""
+    with StandInSMTP(latency=0.001) as stand_in:
+        custom_config = deepcopy(APP_CONFIG)
+        custom_config['email'].update({
+            'server': stand_in.address, 'starttls': False, 'smtp_connections': 2,
+        })
+        custom_config['outbox'] = {'location': str(tmp_path), 'poll_interval': 60}
+        outbox = delivery.get_outbox(custom_config)
+
+        with delivery.OutboxWorker(custom_config):
+            for index in range(50):
+                outbox.enqueue('app@email.com', [f'test{index}@email.com'], 'Subject: Test\r\n\r\nBody')
+
+        delivery.close_smtp_sessions()
+
+        assert stand_in.report()['messages'] == 50
+        assert not outbox.pending()
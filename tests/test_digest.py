@@ -0,0 +1,174 @@
+"""Unit tests for the digest module."""
+from copy import deepcopy
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+
+from modules import notify
+from modules.digest import NotificationDigest
+
+from tests.utils import APP_CONFIG, USER
+
+
+def get_details(additions=None, deletions=None, changes=None, missing=None, null=None):
+    """Returns notification details with the provided entries."""
+    return {
+        'additions': additions or [],
+        'deletions': deletions or [],
+        'changes': changes or [],
+        'missing': missing or [],
+        'null': null or [],
+    }
+
+
+def addition(shift_date, codes):
+    """Returns an addition entry (as made by the Schedule)."""
+    return {
+        'date': shift_date,
+        'email_message': f'{shift_date} - {"/".join(codes)}',
+        'shift_codes': codes,
+    }
+
+
+def deletion(shift_date, codes):
+    """Returns a deletion entry (as made by the Schedule)."""
+    return {
+        'date': shift_date,
+        'email_message': f'{shift_date} - {"/".join(codes)}',
+        'old_shift_codes': codes,
+    }
+
+
+def change(shift_date, old_codes, new_codes):
+    """Returns a change entry (as made by the Schedule)."""
+    return {
+        'date': shift_date,
+        'email_message': f'{shift_date} - {"/".join(old_codes)} changed to {"/".join(new_codes)}',
+        'old_shift_codes': old_codes,
+        'shift_codes': new_codes,
+    }
+
+
+def test_merge_folds_changes_on_the_same_date(tmp_path):
+    """Tests that successive changes to a date fold into the net change."""
+    digest = NotificationDigest(str(tmp_path), 1)
+    digest.merge(get_details(
+        additions=[addition('2018-01-01', ['A1'])],
+        changes=[change('2018-01-02', ['C1'], ['D1'])],
+        deletions=[deletion('2018-01-03', ['E1'])],
+    ))
+    digest.merge(get_details(
+        changes=[
+            change('2018-01-01', ['A1'], ['B1']),
+            change('2018-01-02', ['D1'], ['C1']),
+        ],
+        additions=[addition('2018-01-03', ['F1'])],
+    ))
+
+    details = digest.notification_details()
+
+    assert details['additions'] == [addition('2018-01-01', ['B1'])]
+    assert details['changes'] == [change('2018-01-03', ['E1'], ['F1'])]
+    assert not details['deletions']
+
+
+def test_merge_addition_then_deletion_drops_out(tmp_path):
+    """Tests that a shift added then removed is not reported."""
+    digest = NotificationDigest(str(tmp_path), 1)
+    digest.merge(get_details(additions=[addition('2018-01-01', ['A1'])]))
+    digest.merge(get_details(deletions=[deletion('2018-01-01', ['A1'])]))
+
+    assert digest.notification_details() == get_details()
+
+
+def test_missing_shifts_are_merged_and_filtered(tmp_path):
+    """Tests that missing shifts are reported once for current codes."""
+    missing = {'date': date(2018, 1, 1), 'email_message': '2018-01-01 - A1', 'shift_code': 'A1'}
+
+    digest = NotificationDigest(str(tmp_path), 1)
+    digest.merge(get_details(additions=[addition('2018-01-01', ['A1'])], missing=[missing]))
+    digest.merge(get_details(additions=[addition('2018-01-02', ['A1'])], missing=[missing]))
+
+    assert digest.notification_details()['missing'] == [
+        {'date': '2018-01-01', 'email_message': '2018-01-01 - A1', 'shift_code': 'A1'},
+    ]
+
+    digest.merge(get_details(changes=[change('2018-01-01', ['A1'], ['B1'])]))
+    digest.merge(get_details(deletions=[deletion('2018-01-02', ['A1'])]))
+
+    assert not digest.notification_details()['missing']
+
+
+def test_save_and_load(tmp_path):
+    """Tests that pending changes persist across runs."""
+    digest = NotificationDigest(str(tmp_path), 1)
+    digest.merge(get_details(additions=[addition('2018-01-01', ['A1'])]))
+    digest.save()
+
+    loaded = NotificationDigest(str(tmp_path), 1)
+    loaded.load()
+
+    assert loaded.since == digest.since
+    assert loaded.notification_details() == digest.notification_details()
+
+    loaded.clear()
+    assert not list(tmp_path.iterdir())
+
+
+def test_is_due():
+    """Tests that the digest is due once the interval has passed."""
+    digest = NotificationDigest('', 1)
+
+    assert digest.is_due(0) is False
+
+    digest.since = 1000
+    assert digest.is_due(1, now=1000 + 3599) is False
+    assert digest.is_due(1, now=1000 + 3600) is True
+
+
+def test_notify_user_digest_mode(tmp_path):
+    """Tests that notify_user holds changes until the digest is due."""
+    user = {**USER, 'first_email_sent': True}
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['digest'] = {'location': str(tmp_path), 'interval': 1}
+
+    with patch('modules.notify.email_schedule') as email_schedule, \
+            patch('modules.digest.time.time', return_value=1000):
+        notify.notify_user(user, custom_config, get_details(additions=[addition('2018-01-01', ['A1'])]), emails=[])
+
+    email_schedule.assert_not_called()
+
+    with patch('modules.notify.email_schedule') as email_schedule, \
+            patch('modules.digest.time.time', return_value=1000 + 3600):
+        notify.notify_user(
+            user, custom_config, get_details(changes=[change('2018-01-01', ['A1'], ['B1'])]), emails=[]
+        )
+
+    email_schedule.assert_called_once()
+    assert email_schedule.call_args[0][3]['additions'] == [addition('2018-01-01', ['B1'])]
+    assert not list(tmp_path.iterdir())
+
+
+def test_notify_user_digest_kept_if_email_fails(tmp_path):
+    """Tests that the digest survives a failed digest email."""
+    user = {**USER, 'first_email_sent': True}
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['digest'] = {'location': str(tmp_path), 'interval': 0}
+    notification = get_details(additions=[addition('2018-01-01', ['A1'])])
+
+    with patch('modules.notify.email_schedule', side_effect=OSError('Mock failure')):
+        with pytest.raises(OSError):
+            notify.notify_user(user, custom_config, notification, emails=[])
+
+    assert list(tmp_path.iterdir())
+
+    # An email the SMTP sender pool could not send
+    with patch('modules.notify.email_schedule') as email_schedule:
+        email_schedule.return_value.result.return_value = False
+        notify.notify_user(user, custom_config, get_details(), emails=[])
+
+    digest = NotificationDigest(str(tmp_path), USER['sb_user'])
+    digest.load()
+
+    assert digest.notification_details()['additions'] == [addition('2018-01-01', ['A1'])]
@@ -1,11 +1,15 @@
 """Unit tests for the manager module."""
-# pylint: disable=too-few-public-methods
+# pylint: disable=too-few-public-methods, unused-argument
+import logging
 from unittest.mock import patch
 
 import requests
+from unipath import Path
 
-from modules.manager import retrieve_users
+from modules.custom_exceptions import CircuitOpenError
+from modules.manager import retrieve_users, run_program
 
+from tests.api_server import StandInAPI, build_app_config, write_schedule_workbooks
 from tests.utils import MockRequest404Response
 
 
@@ -45,3 +49,62 @@ def test_json_conversion_user_retrieval():
 
     assert len(users) == 2
     assert users[0]['name'] == 'Test User 1'
+
+
+def mock_assemble_circuit_open(app_config, excel_files, user, prefetched, known_missing=None):
+    """Mocks an assembly failing on an open circuit breaker."""
+    raise CircuitOpenError('Mock open circuit')
+
+
+@patch('modules.manager.retrieve_schedule_file_paths', lambda app_config: {})
+@patch('modules.manager.retrieve_users', lambda app_config: [
+    {'sb_user': 1, 'schedule_name': 'User 1', 'role': 'p'},
+    {'sb_user': 2, 'schedule_name': 'User 2', 'role': 'p'},
+])
+@patch('modules.manager.assemble_schedule', mock_assemble_circuit_open)
+@patch('modules.upload.update_missing_codes_database', lambda app_config, codes: None)
+def test_run_program_continues_after_circuit_open(caplog):
+    """Tests that an open circuit breaker only skips the affected user."""
+    with caplog.at_level(logging.INFO):
+        run_program(APP_CONFIG)
+
+    assert caplog.text.count('Unable to assemble schedule') == 2
+    assert 'CALENDAR GENERATION COMPLETE' in caplog.text
+
+
+def test_run_program_against_stand_in_api(tmp_path):
+    """Tests a full run against the local stand-in API."""
+    with StandInAPI(user_count=6) as stand_in:
+        write_schedule_workbooks(str(tmp_path), stand_in.users, days=30)
+        app_config = build_app_config(
+            stand_in.url, str(tmp_path), Path('email_templates').absolute()
+        )
+
+        run_program(app_config)
+
+        for user in stand_in.users:
+            assert (tmp_path / f'{user["calendar_name"]}.ics').exists()
+            assert len(stand_in.shifts[user['sb_user']]) > 0
+
+        assert ('p', 'E1') in stand_in.missing_codes
+        assert all(user['first_email_sent'] for user in stand_in.users)
+
+        # Email addresses are retrieved in bulk (4 users per request)
+        assert stand_in.request_counts['GET users/emails/$'] == 2
+        assert 'GET users/(\\d+)/emails/$' not in stand_in.request_counts
+
+
+def test_run_program_uploads_missing_codes_once(tmp_path):
+    """Tests that known missing codes are not uploaded on later runs."""
+    with StandInAPI(user_count=2) as stand_in:
+        write_schedule_workbooks(str(tmp_path), stand_in.users, days=30)
+        app_config = build_app_config(
+            stand_in.url, str(tmp_path), Path('email_templates').absolute()
+        )
+        app_config['missing_codes'] = {'location': str(tmp_path / 'state')}
+
+        run_program(app_config)
+        run_program(app_config)
+
+        assert ('p', 'E1') in stand_in.missing_codes
+        assert stand_in.request_counts['POST shift-codes/missing/upload/$'] == 1
@@ -0,0 +1,87 @@
+"""Unit tests for the mime module."""
+from email import message_from_string, policy
+from email.utils import formataddr
+
+from modules import mime
+
+
+FROM_ADDRESS = formataddr(('App Owner', 'app@email.com'))
+UNSUBSCRIBE_LINK = 'https://127.0.0.1/unsubscribe/'
+
+
+def _round_trip(to_addresses, subject, body):
+    """Builds and parses a message."""
+    content = mime.build_message(FROM_ADDRESS, to_addresses, subject, UNSUBSCRIBE_LINK, body)
+
+    return message_from_string(content, policy=policy.default)
+
+
+def test_build_message_round_trips():
+    """Tests that the message parses back to the provided values."""
+    to_addresses = [formataddr(('Test User', 'test1@email.com'))]
+    body = {'plain': 'Hello\r\n - A1\r\n', 'html': '<p>Hello</p>\r\n<ul><li>A1</li></ul>'}
+
+    message = _round_trip(to_addresses, 'Email Test', body)
+    plain, html = message.iter_parts()
+
+    assert message.get_content_type() == 'multipart/alternative'
+    assert message['From'] == FROM_ADDRESS
+    assert message['To'] == to_addresses[0]
+    assert message['Subject'] == 'Email Test'
+    assert message['List-Unsubscribe'] == f'<{UNSUBSCRIBE_LINK}>'
+    assert not message.defects
+    assert plain.get_content_type() == 'text/plain'
+    assert plain.get_content() == 'Hello\n - A1\n'
+    assert html.get_content_type() == 'text/html'
+    assert html.get_content() == '<p>Hello</p>\n<ul><li>A1</li></ul>'
+
+
+def test_build_message_non_ascii():
+    """Tests that non-ASCII headers and bodies are encoded."""
+    to_addresses = [formataddr(('Zoë Tést', 'test1@email.com'))]
+    body = {'plain': 'Shift changé: A1', 'html': '<p>Shift changé: A1</p>'}
+
+    content = mime.build_message(FROM_ADDRESS, to_addresses, 'Changements à l’horaire', UNSUBSCRIBE_LINK, body)
+    message = message_from_string(content, policy=policy.default)
+    plain, html = message.iter_parts()
+
+    assert content.isascii()
+    assert message['To'] == 'Zoë Tést <test1@email.com>'
+    assert message['Subject'] == 'Changements à l’horaire'
+    assert plain['Content-Transfer-Encoding'] == 'base64'
+    assert plain.get_content() == 'Shift changé: A1'
+    assert html.get_content() == '<p>Shift changé: A1</p>'
+
+
+def test_build_message_long_lines():
+    """Tests that lines over the 7bit limit are base64 encoded."""
+    body = {'plain': 'A' * 1200, 'html': '<p>Short</p>'}
+
+    message = _round_trip(['test1@email.com'], 'Email Test', body)
+    plain, _ = message.iter_parts()
+
+    assert plain['Content-Transfer-Encoding'] == 'base64'
+    assert plain.get_content() == 'A' * 1200
+
+
+def test_build_message_folds_recipients():
+    """Tests that long recipient lists are folded between addresses."""
+    to_addresses = [formataddr(('Test User', f'test{index}@email.com')) for index in range(10)]
+
+    content = mime.build_message(
+        FROM_ADDRESS, to_addresses, 'Email Test', UNSUBSCRIBE_LINK, {'plain': 'A', 'html': 'B'}
+    )
+    message = message_from_string(content, policy=policy.default)
+
+    assert all(len(line) <= mime.FOLD_LENGTH for line in content.split('\n'))
+    assert [address.addr_spec for address in message['To'].addresses] == [
+        f'test{index}@email.com' for index in range(10)
+    ]
+
+
+def test_build_message_reuses_header_block():
+    """Tests that the shared headers (and boundary) are built once."""
+    first = mime.get_header_block(FROM_ADDRESS, UNSUBSCRIBE_LINK)
+    second = mime.get_header_block(FROM_ADDRESS, UNSUBSCRIBE_LINK)
+
+    assert first is second
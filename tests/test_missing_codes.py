@@ -0,0 +1,43 @@
+"""Unit tests for the missing_codes module."""
+from modules.missing_codes import MissingCodeIndex
+
+
+def test_unknown_excludes_known_codes(tmp_path):
+    """Tests that only codes not already in the index are returned."""
+    index = MissingCodeIndex(str(tmp_path))
+    index.add({'p': {'E1'}, 'a': set()})
+
+    assert index.unknown({'p': {'e1', 'E2'}, 'a': {'E1'}}) == {'p': {'E2'}, 'a': {'E1'}}
+    assert index.known('p') == {'E1'}
+
+
+def test_prune_removes_present_codes(tmp_path):
+    """Tests that codes found in a user's shift codes are removed."""
+    index = MissingCodeIndex(str(tmp_path))
+    index.add({'p': {'E1', 'e2'}})
+    index.prune('p', [{'code': 'E2'}, {'code': 'C1'}])
+
+    assert index.known('p') == {'E1'}
+
+
+def test_save_and_load(tmp_path):
+    """Tests that the index persists across runs."""
+    index = MissingCodeIndex(str(tmp_path))
+    index.add({'p': {'E1'}, 't': {'T9'}})
+    index.save()
+
+    loaded = MissingCodeIndex(str(tmp_path))
+    loaded.load()
+
+    assert loaded.codes == {'p': {'E1'}, 't': {'T9'}}
+
+
+def test_without_location(tmp_path):
+    """Tests that the index is not saved if no location is configured."""
+    index = MissingCodeIndex('')
+    index.load()
+    index.add({'p': {'E1'}})
+    index.save()
+
+    assert index.known('p') == {'E1'}
+    assert not list(tmp_path.iterdir())
@@ -2,13 +2,12 @@
 # pylint: disable=too-few-public-methods
 from copy import deepcopy
 from email.errors import MessageError
-from email.mime.text import MIMEText
 from unittest.mock import patch
 
 from requests import ConnectionError as RequestsConnectionError
 from unipath import Path
 
-from modules import notify
+from modules import delivery, notify
 
 from tests.utils import (
     MockRequest404Response, MockRequest200Response, APP_CONFIG, USER
@@ -72,6 +71,33 @@ def test_retrieve_emails():
     assert emails[1] == 'test2@email.com'
 
 
+class MockRetrieveBulkEmailsResponse(MockRequest200Response):
+    """A mock of a response to the retrieve_bulk_emails function."""
+    def __init__(self, url, headers):
+        super().__init__(url, headers)
+        self.text = """{
+            "1": ["test1@email.com"],
+            "2": ["test2@email.com", "test3@email.com"]
+        }"""
+
+
+@patch('requests.get', MockRetrieveBulkEmailsResponse)
+def test_retrieve_bulk_emails():
+    """Tests that bulk emails are keyed by user ID."""
+    emails = notify.retrieve_bulk_emails(APP_CONFIG, [1, 2])
+
+    assert emails == {
+        1: ['test1@email.com'],
+        2: ['test2@email.com', 'test3@email.com'],
+    }
+
+
+@patch('requests.get', MockRequest404Response)
+def test_retrieve_bulk_emails_unsupported():
+    """Tests that None is returned if the API has no bulk endpoint."""
+    assert notify.retrieve_bulk_emails(APP_CONFIG, [1, 2]) is None
+
+
 @patch('requests.post', MockRequest404Response)
 def test_update_first_email_flag_404_response():
     """Tests 404 response in update_first_email_sent_flag_emails."""
@@ -114,8 +140,8 @@ def test_send_multipart_email_debug():
     ]
     subject = 'Email Test'
     body = {
-        'plain': MIMEText('Test plain text email.', 'plain'),
-        'html': MIMEText('<p>Test html email.</p>', 'html'),
+        'plain': 'Test plain text email.',
+        'html': '<p>Test html email.</p>',
     }
 
     # Will need to update exceptions if any occur in production
@@ -138,13 +164,14 @@ def test_send_multipart_email():
     ]
     subject = 'Email Test'
     body = {
-        'plain': MIMEText('Test plain text email.', 'plain'),
-        'html': MIMEText('<p>Test html email.</p>', 'html'),
+        'plain': 'Test plain text email.',
+        'html': '<p>Test html email.</p>',
     }
 
     # Will need to update exceptions if any occur in production
     try:
         notify.send_multipart_email(custom_config, to_addresses, subject, body)
+        delivery.close_smtp_sessions()
     except MessageError:
         assert False
     else:
@@ -172,197 +199,20 @@ def test_email_welcome():
         assert True
 
 
-def test_update_additions_section_with_codes():
-    """Tests that additions section is replaced with provided codes."""
-    with open(Path('tests/files/update.txt'), 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    with open(Path('tests/files/update.html'), 'r', encoding='utf8') as html_file:
-        html = html_file.read()
-
-    additions = [
-        {'email_message': '2018-01-01 - A1'},
-        {'email_message': '2018-01-02 - A2'},
-    ]
-
-    text, html = notify.update_additions_section(text, html, additions)
-
-    assert 'ADDITIONS' in text
-    assert 'ADDITIONS' in html
-    assert ' - 2018-01-01 - A1' in text
-    assert '<li>2018-01-01 - A1</li>' in html
-    assert ' - 2018-01-02 - A2' in text
-    assert '<li>2018-01-02 - A2</li>' in html
-
-
-def test_update_additions_section_without_codes():
-    """Tests that additions section is removed without provided codes."""
-    with open(Path('tests/files/update.txt'), 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    with open(Path('tests/files/update.html'), 'r', encoding='utf8') as html_file:
-        html = html_file.read()
-
-    text, html = notify.update_additions_section(text, html, [])
-
-    assert 'ADDITIONS' not in text
-    assert 'ADDITIONS' not in html
-
-
-def test_update_deletions_section_with_codes():
-    """Tests that deletions section is replaced with provided codes."""
-    with open(Path('tests/files/update.txt'), 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    with open(Path('tests/files/update.html'), 'r', encoding='utf8') as html_file:
-        html = html_file.read()
-
-    deletions = [
-        {'email_message': '2018-01-01 - A1'},
-        {'email_message': '2018-01-02 - A2'},
-    ]
-
-    text, html = notify.update_deletions_section(text, html, deletions)
-
-    assert 'DELETIONS' in text
-    assert 'DELETIONS' in html
-    assert ' - 2018-01-01 - A1' in text
-    assert '<li>2018-01-01 - A1</li>' in html
-    assert ' - 2018-01-02 - A2' in text
-    assert '<li>2018-01-02 - A2</li>' in html
-
-
-def test_update_deletions_section_without_codes():
-    """Tests that deletions section is removed without provided codes."""
-    with open(Path('tests/files/update.txt'), 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    with open(Path('tests/files/update.html'), 'r', encoding='utf8') as html_file:
-        html = html_file.read()
-
-    text, html = notify.update_deletions_section(text, html, [])
-
-    assert 'DELETIONS' not in text
-    assert 'DELETIONS' not in html
-
-
-def test_update_changes_section_with_codes():
-    """Tests that changes section is replaced with provided codes."""
-    with open(Path('tests/files/update.txt'), 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    with open(Path('tests/files/update.html'), 'r', encoding='utf8') as html_file:
-        html = html_file.read()
-
-    changes = [
-        {'email_message': '2018-01-01 - A1 to B1'},
-        {'email_message': '2018-01-02 - A2 to B2'},
-    ]
-
-    text, html = notify.update_changes_section(text, html, changes)
-
-    assert 'CHANGES' in text
-    assert 'CHANGES' in html
-    assert ' - 2018-01-01 - A1 to B1' in text
-    assert '<li>2018-01-01 - A1 to B1</li>' in html
-    assert ' - 2018-01-02 - A2 to B2' in text
-    assert '<li>2018-01-02 - A2 to B2</li>' in html
-
-
-def test_update_changes_section_without_codes():
-    """Tests that changes section is removed without provided codes."""
-    with open(Path('tests/files/update.txt'), 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
+def test_email_welcome_send_failure():
+    """Tests that the user is not flagged if the welcome email fails."""
+    emails = ['test1@email.com']
 
-    with open(Path('tests/files/update.html'), 'r', encoding='utf8') as html_file:
-        html = html_file.read()
-
-    text, html = notify.update_changes_section(text, html, [])
-
-    assert 'CHANGES' not in text
-    assert 'CHANGES' not in html
-
-
-def test_update_missing_section_with_codes():
-    """Tests that missing section is replaced with provided codes."""
-    with open(Path('tests/files/update.txt'), 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    with open(Path('tests/files/update.html'), 'r', encoding='utf8') as html_file:
-        html = html_file.read()
-
-    missings = [
-        {'email_message': '2018-01-01 - A1'},
-        {'email_message': '2018-01-02 - A2'},
-    ]
-
-    text, html = notify.update_missing_section(
-        text, html, missings, APP_CONFIG
-    )
-
-    assert 'MISSING SHIFT CODES' in text
-    assert 'MISSING SHIFT CODES' in html
-    assert '01:00 to 02:06 (weekdays)' in text
-    assert '01:00 to 02:06 (weekdays)' in html
-    assert '05:00 to 10:30 (weekends)' in text
-    assert '05:00 to 10:30 (weekends)' in html
-    assert '09:00 to 18:54 (statutory holidays)' in text
-    assert '09:00 to 18:54 (statutory holidays)' in html
-    assert ' - 2018-01-01 - A1' in text
-    assert '<li>2018-01-01 - A1</li>' in html
-    assert ' - 2018-01-02 - A2' in text
-    assert '<li>2018-01-02 - A2</li>' in html
-
-
-def test_update_missing_section_without_codes():
-    """Tests that missing section is removed without provided codes."""
-    with open(Path('tests/files/update.txt'), 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    with open(Path('tests/files/update.html'), 'r', encoding='utf8') as html_file:
-        html = html_file.read()
-
-    text, html = notify.update_missing_section(text, html, [], APP_CONFIG)
-
-    assert 'MISSING SHIFT CODES' not in text
-    assert 'MISSING SHIFT CODES' not in html
-
-
-def test_update_null_section_with_codes():
-    """Tests that null section is replaced with provided codes."""
-    with open(Path('tests/files/update.txt'), 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    with open(Path('tests/files/update.html'), 'r', encoding='utf8') as html_file:
-        html = html_file.read()
-
-    nulls = [
-        {'email_message': '2018-01-01 - A1 to B1'},
-        {'email_message': '2018-01-02 - A2 to B2'},
-    ]
-
-    text, html = notify.update_null_section(text, html, nulls)
-
-    assert 'EXCLUDED CODES' in text
-    assert 'EXCLUDED CODES' in html
-    assert ' - 2018-01-01 - A1 to B1' in text
-    assert '<li>2018-01-01 - A1 to B1</li>' in html
-    assert ' - 2018-01-02 - A2 to B2' in text
-    assert '<li>2018-01-02 - A2 to B2</li>' in html
-
-
-def test_update_null_section_without_codes():
-    """Tests that null section is removed without provided codes."""
-    with open(Path('tests/files/update.txt'), 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    with open(Path('tests/files/update.html'), 'r', encoding='utf8') as html_file:
-        html = html_file.read()
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['debug']['email_console'] = False
+    custom_config['email']['server'] = '127.0.0.1:1'
+    custom_config['email']['welcome_text'] = Path('tests/files/welcome.txt').absolute()
+    custom_config['email']['welcome_html'] = Path('tests/files/welcome.html').absolute()
 
-    text, html = notify.update_null_section(text, html, [])
+    with patch('modules.notify.update_first_email_sent_flag') as update_flag:
+        notify.email_welcome(USER, emails, custom_config)
 
-    assert 'EXCLUDED CODES' not in text
-    assert 'EXCLUDED CODES' not in html
+    update_flag.assert_not_called()
 
 
 def test_email_schedule():
@@ -395,22 +245,67 @@ def test_email_schedule():
         assert True
 
 
-def test_update_codes_section_with_codes():
-    """Tests that codes section is replaced with provided codes."""
-    with open(Path('tests/files/missing_codes.txt'), 'r', encoding='utf8') as text_file:
-        text = text_file.read().replace('\n', '\r\n')
-
-    with open(Path('tests/files/missing_codes.html'), 'r', encoding='utf8') as html_file:
-        html = html_file.read()
-
-    codes = ['A1', 'A2']
-
-    text, html = notify.update_codes_section(text, html, codes)
+def render_schedule_email(notification_details):
+    """Returns the update email body for the notification details."""
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['email']['update_text'] = Path('tests/files/update.txt').absolute()
+    custom_config['email']['update_html'] = Path('tests/files/update.html').absolute()
+
+    with patch('modules.notify.send_multipart_email') as send_multipart_email:
+        notify.email_schedule(USER, ['test1@email.com'], custom_config, notification_details)
+
+    return send_multipart_email.call_args[0][3]
+
+
+def test_email_schedule_with_sections():
+    """Tests that each section lists its messages."""
+    body = render_schedule_email({
+        'additions': [{'email_message': '2018-01-01 - A1'}, {'email_message': '2018-01-02 - A2'}],
+        'deletions': [{'email_message': '2018-01-03 - D1'}],
+        'changes': [{'email_message': '2018-01-04 - C1 changed to C2'}],
+        'missing': [{'email_message': '2018-01-05 - M1'}],
+        'null': [{'email_message': '2018-01-06 - N1'}],
+    })
+    text = body['plain']
+    html = body['html']
+
+    for heading in ('ADDITIONS', 'DELETIONS', 'CHANGES', 'MISSING SHIFT CODES', 'EXCLUDED CODES'):
+        assert heading in text
+        assert heading in html
+
+    for message in (
+            '2018-01-01 - A1', '2018-01-02 - A2', '2018-01-03 - D1',
+            '2018-01-04 - C1 changed to C2', '2018-01-05 - M1', '2018-01-06 - N1',
+    ):
+        assert f' - {message}' in text
+        assert f'<li>{message}</li>' in html
+
+    for times in (
+            '01:00 to 02:06 (weekdays)',
+            '05:00 to 10:30 (weekends)',
+            '09:00 to 18:54 (statutory holidays)',
+    ):
+        assert times in text
+        assert times in html
+
+    assert '{%' not in text + html
+    assert '{{' not in text + html
+    assert '\r\n' in text
+
+
+def test_email_schedule_without_sections():
+    """Tests that sections without messages are removed."""
+    body = render_schedule_email({
+        'additions': [],
+        'deletions': [],
+        'changes': [],
+        'missing': [],
+        'null': [],
+    })
 
-    assert ' - A1' in text
-    assert '<li>A1</li>' in html
-    assert ' - A2' in text
-    assert '<li>A2</li>' in html
+    for heading in ('ADDITIONS', 'DELETIONS', 'CHANGES', 'MISSING SHIFT CODES', 'EXCLUDED CODES'):
+        assert heading not in body['plain']
+        assert heading not in body['html']
 
 
 def test_email_missing_codes():
@@ -433,3 +328,19 @@ def test_email_missing_codes():
         assert False
     else:
         assert True
+
+
+def test_email_missing_codes_lists_codes():
+    """Tests that the missing codes email lists each code."""
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['email']['missing_codes_text'] = Path('tests/files/missing_codes.txt').absolute()
+    custom_config['email']['missing_codes_html'] = Path('tests/files/missing_codes.html').absolute()
+
+    with patch('modules.notify.send_multipart_email') as send_multipart_email:
+        notify.email_missing_codes(['A1', 'A2'], custom_config)
+
+    body = send_multipart_email.call_args[0][3]
+
+    assert ' - A1\r\n - A2' in body['plain']
+    assert '<li>A1</li>\r\n<li>A2</li>' in body['html']
+    assert '{%' not in body['plain'] + body['html']
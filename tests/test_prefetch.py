@@ -0,0 +1,142 @@
+"""Unit tests for the prefetch module."""
+from copy import deepcopy
+import logging
+from unittest.mock import patch
+
+from modules import prefetch
+from modules.custom_exceptions import ScheduleError
+
+from tests.utils import APP_CONFIG
+
+
+USERS = [{'sb_user': user_id} for user_id in range(1, 6)]
+
+
+def mock_retrieve_old_schedule(app_config, user_id):  # pylint: disable=unused-argument
+    """Mocks retrieval of the old schedule."""
+    if user_id == 3:
+        raise ScheduleError('Mock error')
+
+    return {'user': user_id}
+
+
+def mock_retrieve_shift_codes(app_config, user_id):  # pylint: disable=unused-argument
+    """Mocks retrieval of the shift codes."""
+    return [user_id]
+
+
+def mock_retrieve_emails(user_id, app_config):  # pylint: disable=unused-argument
+    """Mocks retrieval of the user emails."""
+    logging.getLogger('modules.notify').warning('Emails for %s', user_id)
+
+    return [f'user{user_id}@email.com']
+
+
+def mock_retrieve_bulk_emails(app_config, user_ids):  # pylint: disable=unused-argument
+    """Mocks bulk retrieval of the user emails (skipping user 4)."""
+    mock_retrieve_bulk_emails.calls.append(list(user_ids))
+
+    return {user_id: [f'user{user_id}@email.com'] for user_id in user_ids if user_id != 4}
+
+
+mock_retrieve_bulk_emails.calls = []
+
+
+def _collect(depth, bulk_emails=0):
+    """Runs the prefetcher with the provided depth and collects results."""
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['pipeline'] = {'prefetch_users': depth, 'bulk_emails': bulk_emails}
+
+    results = []
+
+    for user, prefetched in prefetch.prefetch_user_data(custom_config, USERS):
+        try:
+            old_schedule = prefetched.old_schedule()
+        except ScheduleError:
+            old_schedule = None
+
+        results.append((
+            user['sb_user'],
+            old_schedule,
+            prefetched.shift_codes(),
+            prefetched.emails(),
+        ))
+
+    return results
+
+
+@patch('modules.prefetch.retrieve_old_schedule', mock_retrieve_old_schedule)
+@patch('modules.prefetch.retrieve_shift_codes', mock_retrieve_shift_codes)
+@patch('modules.prefetch.retrieve_emails', mock_retrieve_emails)
+def test_prefetch_user_data_preserves_order():
+    """Tests that users (and their data) are yielded in order."""
+    results = _collect(2)
+
+    assert [result[0] for result in results] == [1, 2, 3, 4, 5]
+    assert results[0][1] == {'user': 1}
+    assert results[4][2] == [5]
+    assert results[1][3] == ['user2@email.com']
+
+
+@patch('modules.prefetch.retrieve_old_schedule', mock_retrieve_old_schedule)
+@patch('modules.prefetch.retrieve_shift_codes', mock_retrieve_shift_codes)
+@patch('modules.prefetch.retrieve_emails', mock_retrieve_emails)
+def test_prefetch_user_data_raises_errors_for_user():
+    """Tests that retrieval errors are raised for the proper user."""
+    results = _collect(2)
+
+    assert results[2][1] is None
+    assert results[3][1] == {'user': 4}
+
+
+@patch('modules.prefetch.retrieve_old_schedule', mock_retrieve_old_schedule)
+@patch('modules.prefetch.retrieve_shift_codes', mock_retrieve_shift_codes)
+@patch('modules.prefetch.retrieve_emails', mock_retrieve_emails)
+def test_prefetch_user_data_without_prefetching():
+    """Tests that a depth of 0 retrieves data on demand."""
+    assert _collect(0) == _collect(3)
+
+
+@patch('modules.prefetch.retrieve_old_schedule', mock_retrieve_old_schedule)
+@patch('modules.prefetch.retrieve_shift_codes', mock_retrieve_shift_codes)
+@patch('modules.prefetch.retrieve_emails', mock_retrieve_emails)
+def test_prefetch_user_data_logs_in_user_order(caplog):
+    """Tests that worker log records are emitted in user order."""
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['pipeline'] = {'prefetch_users': 3}
+
+    with caplog.at_level(logging.INFO):
+        for user, prefetched in prefetch.prefetch_user_data(custom_config, USERS):
+            logging.getLogger('tests').warning('Processing %s', user['sb_user'])
+            prefetched.emails()
+
+    expected = []
+
+    for user in USERS:
+        expected.extend([f'Processing {user["sb_user"]}', f'Emails for {user["sb_user"]}'])
+
+    assert caplog.messages == expected
+
+
+@patch('modules.prefetch.retrieve_old_schedule', mock_retrieve_old_schedule)
+@patch('modules.prefetch.retrieve_shift_codes', mock_retrieve_shift_codes)
+@patch('modules.prefetch.retrieve_bulk_emails', mock_retrieve_bulk_emails)
+def test_prefetch_user_data_bulk_emails():
+    """Tests that emails are retrieved in chunks with per-user fallback."""
+    mock_retrieve_bulk_emails.calls = []
+
+    with patch('modules.prefetch.retrieve_emails', wraps=mock_retrieve_emails) as mock_emails:
+        results = _collect(2, bulk_emails=2)
+
+    assert [result[3] for result in results] == [[f'user{user_id}@email.com'] for user_id in range(1, 6)]
+    assert mock_retrieve_bulk_emails.calls == [[1, 2], [3, 4], [5]]
+    assert [call.args[0] for call in mock_emails.call_args_list] == [4]
+
+
+@patch('modules.prefetch.retrieve_old_schedule', mock_retrieve_old_schedule)
+@patch('modules.prefetch.retrieve_shift_codes', mock_retrieve_shift_codes)
+@patch('modules.prefetch.retrieve_emails', mock_retrieve_emails)
+@patch('modules.prefetch.retrieve_bulk_emails', lambda app_config, user_ids: None)
+def test_prefetch_user_data_bulk_emails_unsupported():
+    """Tests that emails are retrieved per user without a bulk endpoint."""
+    assert _collect(0, bulk_emails=2) == _collect(0)
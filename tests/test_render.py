@@ -0,0 +1,76 @@
+"""Unit tests for the render module."""
+from copy import deepcopy
+import logging
+from unittest.mock import patch
+
+from modules import render
+
+from tests.utils import APP_CONFIG
+
+
+USERS = [
+    {'sb_user': user_id, 'name': f'User {user_id}', 'schedule_name': f'User {user_id}', 'role': 'p'}
+    for user_id in range(1, 6)
+]
+
+
+def mock_generate_calendar(user, schedule, calendar_location, calendar_config):  # pylint: disable=unused-argument
+    """Mocks calendar generation (failing for user 3)."""
+    logging.getLogger('modules.calendar').warning('Calendar for %s', user['sb_user'])
+
+    if user['sb_user'] == 3:
+        raise OSError('Mock error')
+
+    return user['sb_user'] != 4
+
+
+def _render_all(workers):
+    """Renders all the users with the provided worker count."""
+    custom_config = deepcopy(APP_CONFIG)
+    custom_config['calendar_save_location'] = '/tmp'
+    custom_config['pipeline'] = {'calendar_workers': workers}
+
+    with render.CalendarRenderer(custom_config) as renderer:
+        for user in USERS:
+            renderer.submit(user, [])
+
+    return renderer
+
+
+@patch('modules.render.generate_calendar', mock_generate_calendar)
+def test_calendar_renderer_collects_errors_per_user():
+    """Tests that an error for one user does not stop the others."""
+    renderer = _render_all(3)
+
+    assert [user['sb_user'] for user, _ in renderer.errors] == [3]
+    assert isinstance(renderer.errors[0][1], OSError)
+    assert renderer.saved == 3
+    assert renderer.unchanged == 1
+
+
+@patch('modules.render.generate_calendar', mock_generate_calendar)
+def test_calendar_renderer_without_workers():
+    """Tests that calendars are rendered inline without workers."""
+    renderer = _render_all(0)
+
+    assert renderer.executor is None
+    assert [user['sb_user'] for user, _ in renderer.errors] == [3]
+    assert renderer.saved == 3
+
+
+@patch('modules.render.generate_calendar', mock_generate_calendar)
+def test_calendar_renderer_logs_in_user_order(caplog):
+    """Tests that worker logs and errors are reported in user order."""
+    with caplog.at_level(logging.INFO):
+        _render_all(4)
+
+    messages = [message for message in caplog.messages if not message.startswith('Generated')]
+
+    assert messages == [
+        'Calendar for 1',
+        'Calendar for 2',
+        'Calendar for 3',
+        'Unable to generate calendar for User 3 (role = p)',
+        'Calendar for 4',
+        'Calendar for 5',
+    ]
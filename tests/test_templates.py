@@ -0,0 +1,56 @@
+"""Unit tests for the templates module."""
+from unittest.mock import patch
+
+from modules import templates
+
+
+def test_compile_template_variables():
+    """Tests that variables are replaced and unknown ones kept."""
+    template = templates.compile_template('Hello {{ name }}, {{ unknown }}!')
+
+    assert template.render({'name': 'Test'}) == 'Hello Test, {{ unknown }}!'
+
+
+def test_compile_template_blocks():
+    """Tests that blocks are rendered or removed with their markers."""
+    template = templates.compile_template(
+        'A{% block items %}<ul>{{ items }}</ul>{% block items %}B'
+    )
+
+    assert template.render({'items': '<li>1</li>'}) == 'A<ul><li>1</li></ul>B'
+    assert template.render({'items': ''}) == 'AB'
+    assert template.render({}) == 'AB'
+
+
+def test_compile_template_nested_blocks():
+    """Tests that skipping a block skips any blocks inside it."""
+    template = templates.compile_template(
+        '{% block outer %}[{% block inner %}{{ inner }}{% block inner %}]{% block outer %}.'
+    )
+
+    assert template.render({'outer': True, 'inner': 'x'}) == '[x].'
+    assert template.render({'outer': True}) == '[].'
+    assert template.render({'inner': 'x'}) == '.'
+
+
+def test_compile_template_unclosed_block():
+    """Tests that an unclosed block marker is removed and its contents kept."""
+    template = templates.compile_template('A{% block items %}B')
+
+    assert template.render({}) == 'AB'
+
+
+def test_load_template_compiles_once(tmp_path):
+    """Tests that template files are read and compiled once."""
+    template_path = str(tmp_path / 'template.txt')
+
+    with open(template_path, 'w', encoding='utf8') as template_file:
+        template_file.write('Hello\n{{ name }}\n')
+
+    with patch('modules.templates.compile_template', wraps=templates.compile_template) as mock_compile:
+        first = templates.load_template(template_path, '\r\n')
+        second = templates.load_template(template_path, '\r\n')
+
+    assert first is second
+    assert mock_compile.call_count == 1
+    assert first.render({'name': 'Test'}) == 'Hello\r\nTest\r\n'
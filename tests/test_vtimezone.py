@@ -0,0 +1,77 @@
+"""Unit tests for the vtimezone module."""
+from unittest.mock import patch
+
+import pytest
+
+from modules import vtimezone
+
+
+LEGACY_VTIMEZONE = (
+    'BEGIN:VTIMEZONE',
+    'TZID:America/Edmonton',
+    'X-LIC-LOCATION:America/Edmonton',
+    'BEGIN:DAYLIGHT',
+    'TZOFFSETFROM:-0700',
+    'TZOFFSETTO:-0600',
+    'TZNAME:MDT',
+    'DTSTART:19700308T020000',
+    'RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=2SU',
+    'END:DAYLIGHT',
+    'BEGIN:STANDARD',
+    'TZOFFSETFROM:-0600',
+    'TZOFFSETTO:-0700',
+    'TZNAME:MST',
+    'DTSTART:19701101T020000',
+    'RRULE:FREQ=YEARLY;BYMONTH=11;BYDAY=1SU',
+    'END:STANDARD',
+    'END:VTIMEZONE',
+)
+
+
+def test_generate_vtimezone_matches_legacy_block():
+    """Tests that Edmonton's rules match the previously hardcoded block."""
+    assert vtimezone.generate_vtimezone('America/Edmonton', 2019) == LEGACY_VTIMEZONE
+
+
+def test_generate_vtimezone_last_weekday_rules():
+    """Tests that "last Sunday" rules are derived."""
+    lines = vtimezone.generate_vtimezone('Europe/Berlin', 2019)
+
+    assert 'RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU' in lines
+    assert 'RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU' in lines
+    assert 'TZOFFSETTO:+0200' in lines
+
+
+def test_generate_vtimezone_ended_daylight_saving():
+    """Tests that rules no longer followed end with UNTIL."""
+    lines = vtimezone.generate_vtimezone('America/Sao_Paulo', 2019)
+
+    assert 'RRULE:FREQ=YEARLY;BYMONTH=2;BYDAY=3SU;UNTIL=20190217T020000Z' in lines
+
+
+def test_generate_vtimezone_without_daylight_saving():
+    """Tests that zones without DST get a single STANDARD component."""
+    assert vtimezone.generate_vtimezone('Asia/Tokyo', 2019)[3:] == (
+        'BEGIN:STANDARD',
+        'TZOFFSETFROM:+0900',
+        'TZOFFSETTO:+0900',
+        'TZNAME:JST',
+        'DTSTART:19700101T000000',
+        'END:STANDARD',
+        'END:VTIMEZONE',
+    )
+
+
+def test_generate_vtimezone_fixed_offset_zone():
+    """Tests that fixed offset zones get a single STANDARD component."""
+    lines = vtimezone.generate_vtimezone('Etc/GMT+7', 2019)
+
+    assert 'TZOFFSETTO:-0700' in lines
+    assert 'BEGIN:DAYLIGHT' not in lines
+
+
+def test_generate_vtimezone_missing_transitions():
+    """Tests that a DST zone without transitions is not given a fixed offset."""
+    with patch('modules.vtimezone.get_transitions', return_value=[]):
+        with pytest.raises(ValueError):
+            vtimezone.generate_vtimezone('America/Edmonton', 2001)